@@ -0,0 +1,272 @@
+"""Rollups diários de faturamento e ocupação (coleção ``daily_rollups``).
+
+One document per date::
+
+    {"date": "2025-03-03", "day": 20150,
+     "appointments": {"scheduled": 4, "completed": 9, "no-show": 1, "cancelled": 2},
+     "revenue": 310.0,            # completed bookings, at the price stored on each one
+     "booked_minutes": 405,       # scheduled + completed
+     "services": {service_id: {"name", "count", "completed", "revenue"}},
+     "barbers": {barber_id: {"count", "booked_minutes"}}}
+
+Write routes call ``apply_changes`` with the (before, after) versions of the
+appointments they touched. Each date gets the difference as one ``$inc``,
+so a rollup never has to be recomputed from the appointments it summarises.
+``backfill`` recomputes history with pandas, in chunks of dates, and
+replaces the stored documents. It runs once at startup on databases that
+predate rollups, or by hand::
+
+    python analytics.py [--since YYYY-MM-DD]
+
+Revenue uses the ``price`` stored on the appointment when it was booked,
+so both paths agree and a catalog price change never rewrites history.
+Appointments older than that field are stamped once with the catalog
+price of the day (``stamp_prices``); ``prices`` is only the fallback for a
+row that still has none.
+
+A report reads one small document per day in its range, so its cost
+follows the length of the range, not the size of the history.
+"""
+import asyncio
+import os
+from datetime import date as Date, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from availability import ACTIVE_STATUSES
+from time_fields import epoch_day
+
+STATUSES = ("scheduled", "completed", "no-show", "cancelled")
+PERIODS = ("day", "week", "month", "year")
+UNASSIGNED = "unassigned"
+MIGRATION_ID = "daily_rollups_v1"
+PRICES_MIGRATION_ID = "appointment_prices_v1"
+
+
+def appointment_price(apt: dict, prices: Dict[str, float]) -> float:
+    """Price stored at booking; the current catalog price for rows without one."""
+    price = apt.get("price")
+    return price if price is not None else prices.get(apt.get("service_id"), 0)
+
+
+async def stamp_prices(appointments, prices: Dict[str, float]) -> int:
+    """Give appointments without a ``price`` the current one of their service (one update per service)."""
+    stamped = 0
+    for service_id, price in prices.items():
+        result = await appointments.update_many(
+            {"service_id": service_id, "price": None}, {"$set": {"price": price}}
+        )
+        stamped += result.modified_count
+    return stamped
+
+
+def contribution(apt: dict, prices: Dict[str, float]) -> Dict[str, float]:
+    """What one appointment adds to its date's rollup (dotted paths -> amounts)."""
+    status = apt.get("status", "scheduled")
+    service = f"services.{apt.get('service_id')}"
+    barber = f"barbers.{apt.get('barber_id') or UNASSIGNED}"
+    inc = {f"appointments.{status}": 1}
+    if status != "cancelled":
+        inc[f"{service}.count"] = 1
+    if status == "completed":
+        price = appointment_price(apt, prices)
+        inc.update({"revenue": price, f"{service}.completed": 1, f"{service}.revenue": price})
+    if status in ACTIVE_STATUSES:
+        minutes = apt.get("duration_minutes") or 0
+        inc.update({"booked_minutes": minutes, f"{barber}.count": 1, f"{barber}.booked_minutes": minutes})
+    return inc
+
+
+def rollup_updates(changes: Iterable[Tuple[Optional[dict], Optional[dict]]],
+                   prices: Dict[str, float]) -> Dict[str, dict]:
+    """Net ``$inc`` (and service names) per date for a batch of (before, after) pairs."""
+    updates: Dict[str, dict] = {}
+    for before, after in changes:
+        for apt, sign in ((before, -1), (after, 1)):
+            if not apt or not apt.get("date"):
+                continue
+            update = updates.setdefault(apt["date"], {"inc": {}, "names": {}})
+            for path, amount in contribution(apt, prices).items():
+                update["inc"][path] = update["inc"].get(path, 0) + sign * amount
+            if sign > 0 and apt.get("service_name"):
+                update["names"][f"services.{apt.get('service_id')}.name"] = apt["service_name"]
+    return updates
+
+
+async def apply_changes(rollups, changes: Iterable[Tuple[Optional[dict], Optional[dict]]],
+                        prices: Dict[str, float]) -> None:
+    """Move the counters of the touched dates (one bulk write)."""
+    from pymongo import UpdateOne
+
+    ops = []
+    for date, update in rollup_updates(changes, prices).items():
+        inc = {path: amount for path, amount in update["inc"].items() if amount}
+        if not inc and not update["names"]:
+            continue
+        doc = {"$setOnInsert": {"day": epoch_day(date)}}
+        if inc:
+            doc["$inc"] = inc
+        if update["names"]:
+            doc["$set"] = update["names"]
+        ops.append(UpdateOne({"date": date}, doc, upsert=True))
+    if ops:
+        await rollups.bulk_write(ops, ordered=False)
+
+
+# ==================== BACKFILL ====================
+
+def build_rollups(rows: List[dict], prices: Dict[str, float]) -> List[dict]:
+    """Rollup documents for a batch of appointments, computed column-wise with pandas."""
+    import numpy as np
+    import pandas as pd
+
+    if not rows:
+        return []
+    df = pd.DataFrame(rows, columns=[
+        "date", "status", "service_id", "service_name", "barber_id", "duration_minutes", "price",
+    ])
+    df["status"] = df["status"].fillna("scheduled")
+    df["barber_id"] = df["barber_id"].fillna(UNASSIGNED)
+    completed = (df["status"] == "completed").to_numpy()
+    active = df["status"].isin(ACTIVE_STATUSES).to_numpy()
+    df["counted"] = (df["status"] != "cancelled").astype(int)
+    df["completed"] = completed.astype(int)
+    price = pd.to_numeric(df["price"], errors="coerce").fillna(df["service_id"].map(prices)).fillna(0)
+    df["revenue"] = np.where(completed, price.to_numpy(dtype=float), 0.0)
+    df["active"] = active.astype(int)
+    df["minutes"] = np.where(active, df["duration_minutes"].fillna(0).to_numpy(dtype=float), 0.0)
+
+    docs = {
+        date: {"date": date, "day": epoch_day(date), "appointments": {}, "revenue": 0.0,
+               "booked_minutes": 0, "services": {}, "barbers": {}}
+        for date in df["date"].unique()
+    }
+    for (date, status), count in df.groupby(["date", "status"]).size().items():
+        docs[date]["appointments"][status] = int(count)
+    for date, row in df.groupby("date")[["revenue", "minutes"]].sum().iterrows():
+        docs[date]["revenue"] = float(row["revenue"])
+        docs[date]["booked_minutes"] = int(row["minutes"])
+    services = df.groupby(["date", "service_id"]).agg(
+        name=("service_name", "last"), count=("counted", "sum"),
+        completed=("completed", "sum"), revenue=("revenue", "sum"),
+    )
+    for (date, service_id), row in services.iterrows():
+        entry = {"name": row["name"]}
+        if row["count"]:
+            entry["count"] = int(row["count"])
+        if row["completed"]:
+            entry.update(completed=int(row["completed"]), revenue=float(row["revenue"]))
+        docs[date]["services"][service_id] = entry
+    barbers = df[active].groupby(["date", "barber_id"]).agg(count=("active", "sum"), booked_minutes=("minutes", "sum"))
+    for (date, barber_id), row in barbers.iterrows():
+        docs[date]["barbers"][barber_id] = {"count": int(row["count"]), "booked_minutes": int(row["booked_minutes"])}
+    return list(docs.values())
+
+
+async def backfill(rollups, appointments, prices: Dict[str, float], since: Optional[str] = None,
+                   chunk_days: int = 366) -> int:
+    """Recompute rollups from appointments (``since`` on), ``chunk_days`` dates per pass."""
+    from pymongo import ReplaceOne
+
+    date_filter = {"$gte": since} if since else {"$exists": True}
+    dates = sorted(await appointments.distinct("date", {"date": date_filter}))
+    written = 0
+    for i in range(0, len(dates), chunk_days):
+        first, last = dates[i], dates[min(i + chunk_days, len(dates)) - 1]
+        rows = await appointments.find(
+            {"date": {"$gte": first, "$lte": last}},
+            {"_id": 0, "date": 1, "status": 1, "service_id": 1, "service_name": 1, "barber_id": 1, "duration_minutes": 1, "price": 1}
+        ).to_list(None)
+        docs = build_rollups(rows, prices)
+        if docs:
+            await rollups.bulk_write([ReplaceOne({"date": doc["date"]}, doc, upsert=True) for doc in docs], ordered=False)
+        written += len(docs)
+    # Datas sem nenhum agendamento não têm rollup
+    await rollups.delete_many({"date": {"$nin": dates, **({"$gte": since} if since else {})}})
+    return written
+
+
+# ==================== REPORTS ====================
+
+def period_key(date: str, period: str) -> str:
+    """Start of the bucket a date falls in (Monday for weeks)."""
+    if period == "week":
+        day = Date.fromisoformat(date)
+        return (day - timedelta(days=day.weekday())).isoformat()
+    if period == "month":
+        return date[:7]
+    if period == "year":
+        return date[:4]
+    return date
+
+
+def _bucket(key: str) -> dict:
+    return {"period": key, "appointments": dict.fromkeys(STATUSES, 0), "revenue": 0.0,
+            "booked_minutes": 0, "capacity_minutes": 0, "services": {}}
+
+
+def _finish(bucket: dict) -> dict:
+    counts = bucket["appointments"]
+    resolved = counts.get("completed", 0) + counts.get("no-show", 0)
+    bucket["no_show_rate"] = round(counts.get("no-show", 0) / resolved, 4) if resolved else None
+    capacity = bucket["capacity_minutes"]
+    bucket["utilization"] = round(bucket["booked_minutes"] / capacity, 4) if capacity else None
+    bucket["services"] = sorted(
+        ({"service_id": service_id, **entry} for service_id, entry in bucket["services"].items()),
+        key=lambda row: (-row["revenue"], -row["count"])
+    )
+    return bucket
+
+
+def summarize(docs: Iterable[dict], capacity_by_date: Dict[str, int], period: str) -> dict:
+    """Group rollups into ``period`` buckets plus a total; capacity is open chair-minutes per date."""
+    buckets: Dict[str, dict] = {}
+    total = _bucket("total")
+    for date, capacity in capacity_by_date.items():
+        bucket = buckets.setdefault(period_key(date, period), _bucket(period_key(date, period)))
+        bucket["capacity_minutes"] += capacity
+        total["capacity_minutes"] += capacity
+    for doc in docs:
+        key = period_key(doc["date"], period)
+        for bucket in (buckets.setdefault(key, _bucket(key)), total):
+            for status, count in (doc.get("appointments") or {}).items():
+                bucket["appointments"][status] = bucket["appointments"].get(status, 0) + count
+            bucket["revenue"] += doc.get("revenue", 0)
+            bucket["booked_minutes"] += doc.get("booked_minutes", 0)
+            for service_id, entry in (doc.get("services") or {}).items():
+                row = bucket["services"].setdefault(
+                    service_id, {"name": entry.get("name"), "count": 0, "completed": 0, "revenue": 0.0}
+                )
+                row["count"] += entry.get("count", 0)
+                row["completed"] += entry.get("completed", 0)
+                row["revenue"] += entry.get("revenue", 0)
+    return {
+        "periods": [_finish(buckets[key]) for key in sorted(buckets)],
+        "total": _finish(total),
+    }
+
+
+async def _main(since: Optional[str]) -> None:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pathlib import Path
+
+    from http_cache import MongoVersions
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        prices = {s["id"]: s.get("price", 0) async for s in db.services.find({}, {"_id": 0, "id": 1, "price": 1})}
+        count = await backfill(db.daily_rollups, db.appointments, prices, since)
+        await MongoVersions(db.cache_versions).bump("appointments")
+        print(f"Rebuilt rollups for {count} days")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recompute the daily_rollups collection")
+    parser.add_argument("--since", help="only dates >= YYYY-MM-DD")
+    asyncio.run(_main(parser.parse_args().since))
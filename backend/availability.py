@@ -0,0 +1,137 @@
+"""Motor de disponibilidade (availability engine).
+
+Turns one day's appointments and blocked slots into a minute-resolution
+occupancy bitmap, built from their integer ``start_minute``/``end_minute``
+fields (see time_fields.py), and answers "which start times fit a service
+of N minutes" without re-scanning the bookings for every candidate slot.
+"""
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+MINUTES_PER_DAY = 24 * 60
+
+# Horário de funcionamento: 09:00 às 21:00, slots de 30 minutos
+OPEN_MINUTE = 9 * 60
+CLOSE_MINUTE = 21 * 60
+SLOT_INTERVAL = 30
+
+ACTIVE_STATUSES = ("scheduled", "completed")
+
+
+def parse_appointment_time(value) -> Optional[int]:
+    """Minutes since midnight for an appointment time ("HH:MM" or "hh:MM AM")."""
+    try:
+        if 'AM' in value or 'PM' in value:
+            time_obj = datetime.strptime(value, "%I:%M %p")
+        else:
+            time_obj = datetime.strptime(value, "%H:%M")
+    except (TypeError, ValueError):
+        return None
+    return time_obj.hour * 60 + time_obj.minute
+
+
+def parse_block_time(value) -> Optional[int]:
+    """Minutes since midnight for a blocked-slot bound ("HH:MM")."""
+    try:
+        hour, minute = map(int, value.split(':'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+    return hour * 60 + minute
+
+
+def appointment_span(apt: dict) -> Tuple[Optional[int], Optional[int]]:
+    """(start, end) minutes: the integer fields, or the strings for unmigrated documents."""
+    if "start_minute" in apt:
+        return apt["start_minute"], apt.get("end_minute")
+    start = parse_appointment_time(apt.get('time'))
+    duration = apt.get('duration_minutes')
+    if start is None or not isinstance(duration, (int, float)):
+        return None, None
+    return start, start + int(duration)
+
+
+def block_span(block: dict) -> Tuple[Optional[int], Optional[int]]:
+    if "start_minute" in block:
+        return block["start_minute"], block.get("end_minute")
+    return parse_block_time(block.get('start_time')), parse_block_time(block.get('end_time'))
+
+
+def format_minutes_24h(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def format_minutes_12h(minutes: int) -> str:
+    """Same output as strftime("%I:%M %p") used by the booking site."""
+    hour, minute = divmod(minutes, 60)
+    suffix = "AM" if hour < 12 else "PM"
+    return f"{hour % 12 or 12:02d}:{minute:02d} {suffix}"
+
+
+def candidate_starts(duration: int, open_minute: int = OPEN_MINUTE,
+                     close_minute: int = CLOSE_MINUTE,
+                     interval: int = SLOT_INTERVAL) -> List[int]:
+    """Grid start times whose service still ends before closing."""
+    return [
+        start for start in range(open_minute, close_minute, interval)
+        if start + duration <= close_minute
+    ]
+
+
+class DayOccupancy:
+    """Occupancy bitmap for a single day (bit i set = minute i is busy)."""
+
+    __slots__ = ("mask",)
+
+    def __init__(self, mask: int = 0):
+        self.mask = mask
+
+    @classmethod
+    def from_documents(cls, appointments: Iterable[dict] = (),
+                       blocked_slots: Iterable[dict] = ()) -> "DayOccupancy":
+        occupancy = cls()
+        for doc in appointments:
+            start, end = appointment_span(doc)
+            if start is not None:
+                occupancy.occupy(start, end)
+        for doc in blocked_slots:
+            start, end = block_span(doc)
+            if start is not None and end is not None:
+                occupancy.occupy(start, end)
+        return occupancy
+
+    def occupy(self, start: int, end: int) -> None:
+        start = max(start, 0)
+        end = min(end, MINUTES_PER_DAY)
+        if end > start:
+            self.mask |= ((1 << (end - start)) - 1) << start
+
+    def is_free(self, start: int, duration: int) -> bool:
+        if duration <= 0:
+            return True
+        return (self.mask >> start) & ((1 << duration) - 1) == 0
+
+    def fit_mask(self, duration: int, width: int = 2 * MINUTES_PER_DAY) -> int:
+        """Bitmap of start minutes s (< width) where [s, s + duration) is entirely free.
+
+        ANDs shifted copies of the free mask, doubling the run each time, so
+        it costs O(log duration) big-int operations instead of one test per
+        start. OR-ing the results of several chairs answers "any barber".
+        """
+        free = ~self.mask & ((1 << width) - 1)
+        run = 1
+        while run * 2 <= duration:
+            free &= free >> run
+            run *= 2
+        if duration > run:
+            free &= free >> (duration - run)
+        return free
+
+    def available_starts(self, duration: int, open_minute: int = OPEN_MINUTE,
+                         close_minute: int = CLOSE_MINUTE,
+                         interval: int = SLOT_INTERVAL) -> List[int]:
+        window = (1 << duration) - 1 if duration > 0 else 0
+        mask = self.mask
+        return [
+            start for start in candidate_starts(duration, open_minute, close_minute, interval)
+            if (mask >> start) & window == 0
+        ]
@@ -0,0 +1,110 @@
+"""Bloqueios como períodos: um documento por bloqueio, não por dia.
+
+A block covers ``start_date``..``end_date`` (inclusive), the daily window
+``start_time``..``end_time`` and, optionally, only some weekdays
+(``weekdays``: 0 = Monday .. 6 = Sunday, ``None`` = every day) and one
+barber (``barber_id``; ``None`` closes the whole shop). Blocking a
+vacation month is one document, and reads find the blocks touching a date
+or range with a single overlap query, so cost follows the number of blocks
+rather than the number of days they span.
+
+Older databases stored one row per day (``date``); ``compact_legacy_blocks``
+folds consecutive rows with the same window and reason into range documents.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from availability import block_span
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def parse_date(value: str) -> date:
+    return datetime.strptime(value, DATE_FORMAT).date()
+
+
+def overlap_query(start: str, end: str) -> dict:
+    """Blocks whose date range intersects ``start``..``end`` (YYYY-MM-DD strings)."""
+    return {"start_date": {"$lte": end}, "end_date": {"$gte": start}}
+
+
+def day_query(day: str, barber_ids: Optional[Iterable[str]] = None) -> dict:
+    """Blocks that apply on one date, weekday mask included.
+
+    With ``barber_ids``, only shop-wide blocks and those of these barbers.
+    """
+    query = {
+        **overlap_query(day, day),
+        "$or": [{"weekdays": None}, {"weekdays": parse_date(day).weekday()}],
+    }
+    if barber_ids is not None:
+        query["barber_id"] = {"$in": [None, *barber_ids]}
+    return query
+
+
+def for_barber(windows: Iterable[dict], barber_id: Optional[str]) -> List[dict]:
+    """Windows that block ``barber_id``: shop-wide ones plus the barber's own."""
+    return [w for w in windows if not w.get("barber_id") or w.get("barber_id") == barber_id]
+
+
+def applies_on(block: dict, day: date) -> bool:
+    iso = day.strftime(DATE_FORMAT)
+    if not block.get("start_date", "") <= iso <= block.get("end_date", ""):
+        return False
+    weekdays = block.get("weekdays")
+    return weekdays is None or day.weekday() in weekdays
+
+
+def block_dates(block: dict, start: Optional[str] = None, end: Optional[str] = None) -> Iterable[str]:
+    """Dates a block applies to, optionally clipped to ``start``..``end``."""
+    first = parse_date(max(block["start_date"], start or block["start_date"]))
+    last = parse_date(min(block["end_date"], end or block["end_date"]))
+    for offset in range((last - first).days + 1):
+        day = first + timedelta(days=offset)
+        if applies_on(block, day):
+            yield day.strftime(DATE_FORMAT)
+
+
+def windows_by_date(blocks: Iterable[dict], start: str, end: str) -> Dict[str, List[dict]]:
+    """Expand range blocks into the per-date windows ``DayOccupancy`` takes (minutes resolved once per block)."""
+    by_date: Dict[str, List[dict]] = {}
+    for block in blocks:
+        start_minute, end_minute = block_span(block)
+        window = {"start_minute": start_minute, "end_minute": end_minute, "barber_id": block.get("barber_id")}
+        for day in block_dates(block, start, end):
+            by_date.setdefault(day, []).append(window)
+    return by_date
+
+
+async def compact_legacy_blocks(collection) -> int:
+    """Fold per-day rows (``date`` field) into range documents; returns rows folded."""
+    from pymongo import DeleteMany, UpdateOne
+
+    rows = await collection.find(
+        {"start_date": {"$exists": False}, "date": {"$exists": True}}, {"_id": 0}
+    ).sort([("date", 1)]).to_list(None)
+    if not rows:
+        return 0
+
+    runs: Dict[tuple, List[List[dict]]] = {}
+    for row in rows:
+        key = (row.get("start_time"), row.get("end_time"), row.get("reason"))
+        group = runs.setdefault(key, [])
+        if group and parse_date(row["date"]) - parse_date(group[-1][-1]["date"]) <= timedelta(days=1):
+            group[-1].append(row)
+        else:
+            group.append([row])
+
+    ops = []
+    for group in runs.values():
+        for run in group:
+            first = run[0]
+            ops.append(UpdateOne(
+                {"id": first["id"]},
+                {"$set": {"start_date": first["date"], "end_date": run[-1]["date"], "weekdays": None},
+                 "$unset": {"date": ""}},
+            ))
+            if len(run) > 1:
+                ops.append(DeleteMany({"id": {"$in": [row["id"] for row in run[1:]]}}))
+    await collection.bulk_write(ops, ordered=False)
+    return len(rows)
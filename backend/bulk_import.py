@@ -0,0 +1,218 @@
+"""Importação em lote de agendamentos (CSV / NDJSON).
+
+The upload is parsed as it streams in, and rows are handled in chunks. For
+each chunk:
+
+1. Ids already in the database are rejected (one query). Occupancy of the
+   days the chunk touches is loaded into a ``DayIndex``: one appointments
+   query and one blocked-slots query. Conflicts are then
+   checked in memory, against existing bookings, blocks and the rows
+   imported before.
+2. ``write_chunk`` claims the cells of the future bookings, inserts the
+   appointments and upserts the customers, one ``insert_many`` /
+   ``bulk_write`` each.
+
+A chunk therefore costs a handful of round trips however many rows it holds,
+where ``POST /appointments`` needs four or five per booking.
+"""
+import codecs
+import csv
+import json
+import uuid
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from availability import ACTIVE_STATUSES, DayOccupancy, appointment_span
+from blocked_periods import for_barber, overlap_query, windows_by_date
+from customer_stats import contribution
+from reservations import claim_cells
+
+FORMATS = ("csv", "ndjson")
+
+
+async def _lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode a byte stream into lines (newline kept); a spreadsheet BOM is dropped."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def _csv_records(chunks: AsyncIterator[bytes]) -> AsyncIterator[List[str]]:
+    # Um campo entre aspas pode conter quebras de linha: junta até as aspas fecharem
+    record = ""
+    async for line in _lines(chunks):
+        record += line
+        if record.count('"') % 2:
+            continue
+        if record.strip():
+            yield next(csv.reader([record]))
+        record = ""
+    if record.strip():
+        yield next(csv.reader([record]))
+
+
+async def read_rows(chunks: AsyncIterator[bytes], format: str) -> AsyncIterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """Yield ``(row_number, row, error)``; CSV needs a header row, empty cells become None."""
+    if format == "ndjson":
+        number = 0
+        async for line in _lines(chunks):
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield number, None, "Invalid JSON"
+                continue
+            if isinstance(row, dict):
+                yield number, row, None
+            else:
+                yield number, None, "Row must be a JSON object"
+        return
+
+    header = None
+    number = 0
+    async for record in _csv_records(chunks):
+        if header is None:
+            header = [name.strip() for name in record]
+            continue
+        number += 1
+        if len(record) != len(header):
+            yield number, None, f"Expected {len(header)} columns, got {len(record)}"
+            continue
+        yield number, {name: value.strip() or None for name, value in zip(header, record)}, None
+
+
+class DayIndex:
+    """In-memory occupancy of the (date, barber) pairs an import touches."""
+
+    def __init__(self, appointments, blocked_slots):
+        self.appointments = appointments
+        self.blocked_slots = blocked_slots
+        self.days: Dict[Tuple[str, Optional[str]], DayOccupancy] = {}
+        self.loaded: Set[str] = set()
+
+    async def load(self, dates: Iterable[str], barber_ids: List[str]) -> None:
+        dates = sorted(set(dates) - self.loaded)
+        if not dates:
+            return
+        by_chair: Dict[Tuple[str, Optional[str]], list] = {}
+        async for apt in self.appointments.find(
+            {"date": {"$in": dates}, "status": {"$in": list(ACTIVE_STATUSES)}},
+            {"_id": 0, "date": 1, "barber_id": 1, "start_minute": 1, "end_minute": 1, "time": 1, "duration_minutes": 1}
+        ):
+            by_chair.setdefault((apt["date"], apt.get("barber_id")), []).append(apt)
+        blocks = await self.blocked_slots.find(
+            overlap_query(dates[0], dates[-1]),
+            {"_id": 0, "start_date": 1, "end_date": 1, "start_minute": 1, "end_minute": 1,
+             "start_time": 1, "end_time": 1, "weekdays": 1, "barber_id": 1}
+        ).to_list(None)
+        windows = windows_by_date(blocks, dates[0], dates[-1])
+        for date in dates:
+            for barber_id in barber_ids:
+                self.days[(date, barber_id)] = DayOccupancy.from_documents(
+                    by_chair.get((date, barber_id), ()), for_barber(windows.get(date, ()), barber_id)
+                )
+        self.loaded.update(dates)
+
+    def claim(self, date: str, barber_ids: List[str], start: int, end: int) -> Optional[str]:
+        """Occupy the span on the least busy free chair; None when none is free."""
+        free = [
+            barber_id for barber_id in barber_ids
+            if (date, barber_id) in self.days and self.days[(date, barber_id)].is_free(start, end - start)
+        ]
+        if not free:
+            return None
+        barber_id = min(free, key=lambda chair: self.days[(date, chair)].mask.bit_count())
+        self.days[(date, barber_id)].occupy(start, end)
+        return barber_id
+
+
+async def existing_ids(appointments, ids: List[str]) -> Set[str]:
+    return {doc["id"] async for doc in appointments.find({"id": {"$in": ids}}, {"_id": 0, "id": 1})}
+
+
+def customer_ops(docs: Iterable[dict], prices: Dict[str, float]) -> list:
+    """One upsert per phone with the chunk's counters, like ``register_booking`` + ``apply_appointment_change``."""
+    from pymongo import UpdateOne
+
+    by_phone: Dict[str, dict] = {}
+    for apt in docs:
+        entry = by_phone.setdefault(apt["customer_phone"], {"inc": dict.fromkeys(contribution(None, prices), 0)})
+        for name, value in contribution(apt, prices).items():
+            entry["inc"][name] += value
+        entry["full_name"] = apt["customer_name"]
+        if apt.get("customer_email"):
+            entry["email"] = apt["customer_email"]
+        if apt.get("status") in ACTIVE_STATUSES:
+            entry["last_visit"] = max(entry.get("last_visit") or "", apt["date"])
+
+    ops = []
+    for phone, entry in by_phone.items():
+        update = {
+            "$set": {"full_name": entry["full_name"]},
+            "$inc": entry["inc"],
+            "$setOnInsert": {"id": str(uuid.uuid4())},
+        }
+        if "email" in entry:
+            update["$set"]["email"] = entry["email"]
+        else:
+            update["$setOnInsert"]["email"] = None
+        if entry.get("last_visit"):
+            update["$max"] = {"last_visit": entry["last_visit"]}
+        ops.append(UpdateOne({"phone": phone}, update, upsert=True))
+    return ops
+
+
+async def write_chunk(appointments, claims, customers, docs: List[dict], claim_from: str,
+                      prices: Dict[str, float]) -> Tuple[List[dict], Dict[str, str]]:
+    """Insert a validated chunk; returns (inserted docs, {appointment id: error}).
+
+    Ids must be new (see ``existing_ids``): releasing a failed row's cells
+    goes by appointment id. Active bookings on or after ``claim_from`` claim their cells first, so a
+    booking made through the API meanwhile still can't overlap an imported one.
+    """
+    from pymongo import InsertOne
+    from pymongo.errors import BulkWriteError
+
+    errors: Dict[str, str] = {}
+    claim_docs = []
+    for apt in docs:
+        start, end = appointment_span(apt)
+        if apt["status"] in ACTIVE_STATUSES and apt["date"] >= claim_from:
+            claim_docs += [
+                {"date": apt["date"], "barber_id": apt.get("barber_id"), "cell": cell, "appointment_id": apt["id"]}
+                for cell in claim_cells(start, end - start)
+            ]
+    if claim_docs:
+        try:
+            await claims.insert_many(claim_docs, ordered=False)
+        except BulkWriteError as e:
+            taken = {claim_docs[error["index"]]["appointment_id"] for error in e.details.get("writeErrors", [])}
+            errors.update(dict.fromkeys(taken, "Time slot already booked"))
+            await claims.delete_many({"appointment_id": {"$in": list(taken)}})
+
+    pending = [apt for apt in docs if apt["id"] not in errors]
+    if pending:
+        try:
+            await appointments.bulk_write([InsertOne(apt) for apt in pending], ordered=False)
+        except BulkWriteError as e:
+            failed = {pending[error["index"]]["id"]: error.get("errmsg", "Insert failed")
+                      for error in e.details.get("writeErrors", [])}
+            for id in failed:
+                errors[id] = "Duplicate appointment id" if "duplicate key" in failed[id] else failed[id]
+            await claims.delete_many({"appointment_id": {"$in": list(failed)}})
+    inserted = [apt for apt in pending if apt["id"] not in errors]
+    for apt in inserted:
+        apt.pop("_id", None)
+
+    ops = customer_ops(inserted, prices)
+    if ops:
+        await customers.bulk_write(ops, ordered=False)
+    return inserted, errors
@@ -0,0 +1,212 @@
+"""Agregados desnormalizados por cliente (total, faltas, gasto, última visita).
+
+Each appointment contributes to its customer's counters: it counts toward
+``total_appointments`` unless cancelled, toward ``no_show_count`` when it is
+a no-show, and adds the price stored on the appointment (see
+``analytics.appointment_price``) to ``lifetime_spend`` once completed.
+Write routes call ``apply_appointment_change(before, after)`` and the
+customer document gets the difference as one atomic ``$inc``; ``last_visit``
+(a max, which can't be decremented) is re-read from the customer's latest
+active booking. An edit that moves a booking to another phone takes the
+counters off the old customer and creates the new one if needed. ``recompute_all_customers`` rebuilds every customer from
+the appointments collection.
+"""
+import asyncio
+import os
+import uuid
+from typing import Dict, Optional
+
+from analytics import appointment_price
+from availability import ACTIVE_STATUSES
+
+COUNTERS = ("total_appointments", "no_show_count", "lifetime_spend")
+
+
+def contribution(apt: Optional[dict], prices: Dict[str, float]) -> Dict[str, float]:
+    if not apt:
+        return {name: 0 for name in COUNTERS}
+    status = apt.get("status", "scheduled")
+    return {
+        "total_appointments": 0 if status == "cancelled" else 1,
+        "no_show_count": 1 if status == "no-show" else 0,
+        # Preço gravado no agendamento: mudar o catálogo não altera o que já foi pago
+        "lifetime_spend": appointment_price(apt, prices) if status == "completed" else 0,
+    }
+
+
+async def register_booking(customers, phone: str, full_name: str, email: Optional[str], date: str) -> dict:
+    """Atomic upsert of the customer for a new booking (one round-trip)."""
+    set_on_insert = {"id": str(uuid.uuid4()), "no_show_count": 0, "lifetime_spend": 0}
+    update = {
+        "$set": {"full_name": full_name},
+        "$setOnInsert": set_on_insert,
+        "$inc": {"total_appointments": 1},
+        "$max": {"last_visit": date},
+    }
+    if email:
+        update["$set"]["email"] = email
+    else:
+        set_on_insert["email"] = None
+    return await customers.find_one_and_update(
+        {"phone": phone}, update, upsert=True, return_document=True, projection={"_id": 0}
+    )
+
+
+async def _refresh_last_visit(customers, appointments, phone: str) -> Optional[dict]:
+    latest = await appointments.find(
+        {"customer_phone": phone, "status": {"$in": list(ACTIVE_STATUSES)}},
+        {"_id": 0, "date": 1}
+    ).sort([("date", -1)]).limit(1).to_list(1)
+    return await customers.find_one_and_update(
+        {"phone": phone},
+        {"$set": {"last_visit": latest[0]["date"] if latest else None}},
+        return_document=True, projection={"_id": 0}
+    )
+
+
+async def apply_appointment_change(customers, appointments, before: Optional[dict],
+                                   after: Optional[dict], prices: Dict[str, float]) -> list:
+    """Move counters from the old version of an appointment to the new one.
+
+    Returns the updated customer documents (one per phone touched).
+    """
+    deltas: Dict[str, Dict[str, float]] = {}
+    for apt, sign in ((before, -1), (after, 1)):
+        if not apt or not apt.get("customer_phone"):
+            continue
+        delta = deltas.setdefault(apt["customer_phone"], {name: 0 for name in COUNTERS})
+        for name, value in contribution(apt, prices).items():
+            delta[name] += sign * value
+
+    new_phone = after.get("customer_phone") if after else None
+    updated = []
+    for phone, delta in deltas.items():
+        inc = {name: value for name, value in delta.items() if value}
+        if phone == new_phone and phone != (before or {}).get("customer_phone"):
+            # Telefone novo (reserva movida ou importada): cria o cliente completo, não um doc parcial
+            set_on_insert = {"id": str(uuid.uuid4()), "full_name": after.get("customer_name"),
+                             "email": after.get("customer_email")}
+            set_on_insert.update({name: 0 for name in COUNTERS if name not in inc})
+            update = {"$setOnInsert": set_on_insert}
+            if inc:
+                update["$inc"] = inc
+            await customers.update_one({"phone": phone}, update, upsert=True)
+        elif inc:
+            await customers.update_one({"phone": phone}, {"$inc": inc})
+        doc = await _refresh_last_visit(customers, appointments, phone)
+        if doc:
+            updated.append(doc)
+    return updated
+
+
+def recompute_pipeline(phones: Optional[list] = None) -> list:
+    match = [{"$match": {"customer_phone": {"$in": phones}}}] if phones is not None else []
+    return match + [
+        {"$lookup": {"from": "services", "localField": "service_id", "foreignField": "id", "as": "service"}},
+        {"$set": {"price": {"$ifNull": ["$price", {"$ifNull": [{"$arrayElemAt": ["$service.price", 0]}, 0]}]}}},
+        {"$sort": {"date": 1}},
+        {"$group": {
+            "_id": "$customer_phone",
+            "full_name": {"$last": "$customer_name"},
+            "email": {"$last": "$customer_email"},
+            "total_appointments": {"$sum": {"$cond": [{"$eq": ["$status", "cancelled"]}, 0, 1]}},
+            "no_show_count": {"$sum": {"$cond": [{"$eq": ["$status", "no-show"]}, 1, 0]}},
+            "lifetime_spend": {"$sum": {"$cond": [{"$eq": ["$status", "completed"]}, "$price", 0]}},
+            "last_visit": {"$max": {"$cond": [{"$in": ["$status", list(ACTIVE_STATUSES)]}, "$date", None]}},
+        }},
+    ]
+
+
+async def recompute_all_customers(customers, appointments, chunk_size: int = 500) -> int:
+    """Repair job: rebuild every customer's counters from appointments."""
+    from pymongo import UpdateOne
+
+    run_id = str(uuid.uuid4())
+    ops, count = [], 0
+    async for row in appointments.aggregate(recompute_pipeline(), allowDiskUse=True):
+        if not row["_id"]:
+            continue
+        ops.append(UpdateOne(
+            {"phone": row["_id"]},
+            {
+                "$set": {
+                    **{name: row[name] for name in COUNTERS},
+                    "last_visit": row["last_visit"],
+                    "stats_run": run_id,
+                },
+                "$setOnInsert": {"id": str(uuid.uuid4()), "full_name": row["full_name"], "email": row["email"]},
+            },
+            upsert=True,
+        ))
+        if len(ops) >= chunk_size:
+            await customers.bulk_write(ops, ordered=False)
+            count += len(ops)
+            ops = []
+    if ops:
+        await customers.bulk_write(ops, ordered=False)
+        count += len(ops)
+
+    # Clientes sem nenhum agendamento voltam a zero
+    await customers.update_many(
+        {"stats_run": {"$ne": run_id}},
+        {"$set": {**{name: 0 for name in COUNTERS}, "last_visit": None}}
+    )
+    await customers.update_many({}, {"$unset": {"stats_run": ""}})
+    return count
+
+
+async def merge_duplicate_customers(customers, appointments) -> int:
+    """Keep one customer per phone before ``phone_unique`` is built; returns documents removed.
+
+    Older databases created customers with a find-then-insert, so two
+    concurrent first bookings could leave two documents for one phone. The
+    oldest document survives (taking an e-mail from the others if it had
+    none) and the merged phones get their counters recomputed.
+    """
+    groups = await customers.aggregate([
+        {"$sort": {"_id": 1}},
+        {"$group": {"_id": "$phone", "docs": {"$push": {"_id": "$_id", "email": "$email"}}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ]).to_list(None)
+    removed = 0
+    for group in groups:
+        keep, *extra = group["docs"]
+        email = keep.get("email") or next((doc["email"] for doc in reversed(extra) if doc.get("email")), None)
+        if email:
+            await customers.update_one({"_id": keep["_id"]}, {"$set": {"email": email}})
+        result = await customers.delete_many({"_id": {"$in": [doc["_id"] for doc in extra]}})
+        removed += result.deleted_count
+
+    phones = [group["_id"] for group in groups]
+    if phones:
+        await customers.update_many(
+            {"phone": {"$in": phones}}, {"$set": {**{name: 0 for name in COUNTERS}, "last_visit": None}}
+        )
+        async for row in appointments.aggregate(recompute_pipeline(phones)):
+            await customers.update_one(
+                {"phone": row["_id"]},
+                {"$set": {**{name: row[name] for name in COUNTERS}, "last_visit": row["last_visit"]}},
+            )
+    return removed
+
+
+async def _main() -> None:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pathlib import Path
+
+    from http_cache import MongoVersions
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        count = await recompute_all_customers(db.customers, db.appointments)
+        await MongoVersions(db.cache_versions).bump("customers")
+        print(f"Recomputed stats for {count} customers")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,133 @@
+"""Visão materializada de ocupação por dia e barbeiro (coleção ``day_availability``).
+
+Each document holds one (date, barber) occupancy bitmap (hex-encoded, one
+bit per minute) so the booking page reads a few small documents instead of
+re-scanning appointments and blocked slots. Write paths call
+``refresh(date, barber_id)``, which rebuilds just that chair's day from the
+source collections; a block spanning many days calls ``invalidate_range``
+instead, which marks the dates stale in one write and leaves the rebuild to
+the next read.
+
+Concurrent refreshes are ordered with a per-document sequence number: a
+writer bumps ``seq`` after its own write and only stores its bitmap if
+nothing newer was stored meanwhile, so a slow refresh never overwrites a
+fresher one. A document whose ``built_seq`` lags ``seq`` is stale and is
+rebuilt on read.
+"""
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from availability import ACTIVE_STATUSES, DayOccupancy
+from blocked_periods import day_query
+
+
+class DayAvailabilityStore:
+    def __init__(self, view, appointments, blocked_slots):
+        self.view = view
+        self.appointments = appointments
+        self.blocked_slots = blocked_slots
+
+    async def _build(self, date: str, barber_id: Optional[str]) -> DayOccupancy:
+        appointments = await self.appointments.find(
+            {"date": date, "barber_id": barber_id, "status": {"$in": list(ACTIVE_STATUSES)}},
+            {"_id": 0, "start_minute": 1, "end_minute": 1, "time": 1, "duration_minutes": 1}
+        ).to_list(None)
+        blocked_slots = await self.blocked_slots.find(
+            day_query(date, [barber_id] if barber_id else []),
+            {"_id": 0, "start_minute": 1, "end_minute": 1, "start_time": 1, "end_time": 1}
+        ).to_list(None)
+        return DayOccupancy.from_documents(appointments, blocked_slots)
+
+    async def _store(self, date: str, barber_id: Optional[str], seq: int, occupancy: DayOccupancy) -> None:
+        await self.view.update_one(
+            {"date": date, "barber_id": barber_id,
+             "$or": [{"built_seq": {"$lt": seq}}, {"built_seq": {"$exists": False}}]},
+            {"$set": {
+                "mask": format(occupancy.mask, "x"),
+                "built_seq": seq,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }}
+        )
+
+    async def refresh(self, date: str, barber_id: Optional[str] = None) -> DayOccupancy:
+        """Rebuild one chair's day after its appointments or blocks changed."""
+        doc = await self.view.find_one_and_update(
+            {"date": date, "barber_id": barber_id}, {"$inc": {"seq": 1}},
+            upsert=True, return_document=True, projection={"_id": 0, "seq": 1}
+        )
+        occupancy = await self._build(date, barber_id)
+        await self._store(date, barber_id, doc["seq"], occupancy)
+        return occupancy
+
+    async def refresh_many(self, keys: Iterable[Tuple[str, Optional[str]]]) -> None:
+        """Refresh several (date, barber_id) pairs concurrently."""
+        await asyncio.gather(*(self.refresh(date, barber_id) for date, barber_id in set(keys) if date))
+
+    async def invalidate_range(self, start: str, end: str, barber_id: Optional[str] = None) -> None:
+        """Mark stored days in ``start``..``end`` stale (one barber, or all when None)."""
+        query = {"date": {"$gte": start, "$lte": end}}
+        if barber_id:
+            query["barber_id"] = barber_id
+        await self.view.update_many(query, {"$inc": {"seq": 1}})
+
+    async def get(self, date: str, barber_id: Optional[str] = None) -> DayOccupancy:
+        return (await self.get_many(date, [barber_id]))[barber_id]
+
+    async def get_many(self, date: str, barber_ids: List[Optional[str]]) -> Dict[Optional[str], DayOccupancy]:
+        """Occupancy of several chairs on one date: one read, plus rebuilds of stale ones."""
+        docs = {
+            doc.get("barber_id"): doc
+            async for doc in self.view.find({"date": date, "barber_id": {"$in": list(barber_ids)}}, {"_id": 0})
+        }
+        result, stale = {}, []
+        for barber_id in barber_ids:
+            doc = docs.get(barber_id)
+            if doc and "mask" in doc and doc.get("built_seq") == doc.get("seq"):
+                result[barber_id] = DayOccupancy(int(doc["mask"], 16))
+            else:
+                stale.append(barber_id)
+        if stale:
+            rebuilt = await asyncio.gather(*(self.refresh(date, barber_id) for barber_id in stale))
+            result.update(zip(stale, rebuilt))
+        return result
+
+    async def rebuild(self, since: Optional[str] = None) -> int:
+        """Repair: rebuild every chair-day with appointments; the rest go stale and rebuild on read."""
+        query = {"date": {"$gte": since}} if since else {}
+        await self.view.update_many(query, {"$inc": {"seq": 1}})
+        keys = {
+            (apt["date"], apt.get("barber_id"))
+            async for apt in self.appointments.find(query, {"_id": 0, "date": 1, "barber_id": 1})
+        }
+        for date, barber_id in sorted(keys, key=lambda key: (key[0], key[1] or "")):
+            await self.refresh(date, barber_id)
+        return len(keys)
+
+
+async def _main(since: Optional[str]) -> None:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pathlib import Path
+
+    from http_cache import MongoVersions
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    store = DayAvailabilityStore(db.day_availability, db.appointments, db.blocked_slots)
+    try:
+        count = await store.rebuild(since)
+        await MongoVersions(db.cache_versions).bump("appointments")
+        print(f"Rebuilt availability for {count} days")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Rebuild the day_availability view")
+    parser.add_argument("--since", help="only dates >= YYYY-MM-DD")
+    asyncio.run(_main(parser.parse_args().since))
@@ -0,0 +1,111 @@
+"""Eventos ao vivo para o painel admin (Server-Sent Events).
+
+``EventBroker`` is a small in-process pub/sub: each SSE client gets its own
+bounded queue and write routes publish appointment, customer and
+blocked-slot changes to all of them. When MongoDB supports change streams
+(replica set / Atlas, 6.0+ so deletes carry pre-images) and
+``watch_changes`` is running, the change stream becomes the source
+instead, so writes made by other workers or processes show up too; local
+publishes are then ignored to avoid duplicates.
+"""
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# coleção -> tipo do evento enviado ao navegador
+EVENT_TYPES = {
+    "appointments": "appointment",
+    "customers": "customer",
+    "blocked_slots": "blocked_slot",
+}
+
+OPERATIONS = {"insert": "insert", "update": "update", "replace": "update", "delete": "delete"}
+
+
+class EventBroker:
+    def __init__(self, queue_size: int = 100, heartbeat: float = 15.0):
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.source = "local"
+        self._subscribers = set()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def _broadcast(self, event: dict) -> None:
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Cliente lento: encerra o stream; ao reconectar ele recarrega tudo
+                self._subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+    def publish(self, collection: str, op: str, doc: Optional[dict] = None, id: Optional[str] = None) -> None:
+        """Publish a change made by this process (no-op when the change stream is the source)."""
+        if self.source != "local" or not self._subscribers:
+            return
+        self._broadcast(_event(collection, op, doc, id))
+
+    async def stream(self) -> AsyncIterator[str]:
+        """SSE frames for one client, with a heartbeat comment to keep proxies open."""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if event is None:
+                    return
+                yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            self._subscribers.discard(queue)
+
+    async def watch_changes(self, db) -> None:
+        """Feed the broker from a database change stream, if the server has one."""
+        from pymongo.errors import PyMongoError
+
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": list(EVENT_TYPES)},
+            "operationType": {"$in": list(OPERATIONS)},
+        }}]
+        try:
+            # Um delete só traz o documento (e o "id" do app) como pre-image: sem elas, nada de change stream
+            for collection in EVENT_TYPES:
+                await db.command("collMod", collection, changeStreamPreAndPostImages={"enabled": True})
+            async with db.watch(pipeline, full_document="updateLookup",
+                                full_document_before_change="whenAvailable") as stream:
+                self.source = "change_stream"
+                logger.info("Live events fed by MongoDB change stream")
+                async for change in stream:
+                    doc = change.get("fullDocument") or change.get("fullDocumentBeforeChange")
+                    if doc is None and change["operationType"] == "delete":
+                        # Pre-image expirada: o painel recebe um delete sem id e recarrega a lista
+                        logger.warning(f"Delete without pre-image in {change['ns']['coll']}: {change.get('documentKey')}")
+                    self._broadcast(_event(change["ns"]["coll"], OPERATIONS[change["operationType"]], doc))
+        except asyncio.CancelledError:
+            raise
+        except PyMongoError as e:
+            logger.info(f"Change streams unavailable, using in-process events: {e}")
+        finally:
+            self.source = "local"
+
+
+def _event(collection: str, op: str, doc: Optional[dict], id: Optional[str] = None) -> dict:
+    data = {k: v for k, v in (doc or {}).items() if k != "_id"} or None
+    return {
+        "type": EVENT_TYPES.get(collection, collection),
+        "op": op,
+        "id": id or (data or {}).get("id"),
+        "data": data,
+    }
@@ -0,0 +1,126 @@
+"""Cache HTTP com ETag / GET condicional para as rotas de leitura.
+
+Each cached route depends on a few collections. Every collection has a
+version, bumped after any successful write request to a route that changes
+it. A response's ETag is built from those versions (plus the query string),
+so a client repeating ``If-None-Match`` gets a bodyless 304 without the
+handler or the database collections behind it being touched.
+
+With ``MongoVersions`` (what server.py uses) the versions live in the
+``cache_versions`` collection: every worker bumps and reads the same
+counters, so a write handled by one worker invalidates the ETags of all of
+them (one small read per cached GET). Each counter document carries a
+random token set when it is created, so dropping the collection can't
+bring an old ETag back to life. ``LocalVersions`` keeps the counters in
+process memory and is only correct with a single worker.
+
+Writes that bypass the API (scripts, the mongo shell) must call
+``MongoVersions.bump`` for the collections they change; the CLIs in this
+directory do.
+"""
+import hashlib
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+class CacheRule:
+    def __init__(self, collections: Iterable[str], cache_control: str, daily: bool = False):
+        self.collections = tuple(collections)
+        self.cache_control = cache_control
+        # Resposta depende do dia corrente (ex.: estatísticas de "hoje")
+        self.daily = daily
+
+
+class LocalVersions:
+    """In-process counters (single worker only); the epoch tells restarts apart."""
+
+    def __init__(self):
+        self.epoch = uuid.uuid4().hex[:8]
+        self.counters: Dict[str, int] = {}
+
+    async def get(self, collections: Iterable[str]) -> Dict[str, str]:
+        return {c: f"{self.epoch}.{self.counters.get(c, 0)}" for c in collections}
+
+    async def bump(self, *collections: str) -> None:
+        for collection in collections:
+            self.counters[collection] = self.counters.get(collection, 0) + 1
+
+
+class MongoVersions:
+    """Counters shared by every worker, one ``cache_versions`` document per collection."""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, collections: Iterable[str]) -> Dict[str, str]:
+        collections = list(collections)
+        found = {
+            doc["_id"]: f"{doc['token']}.{doc['v']}"
+            async for doc in self.collection.find({"_id": {"$in": collections}})
+        }
+        return {c: found.get(c, "0") for c in collections}
+
+    async def bump(self, *collections: str) -> None:
+        for collection in collections:
+            await self.collection.update_one(
+                {"_id": collection},
+                {"$inc": {"v": 1}, "$setOnInsert": {"token": uuid.uuid4().hex[:8]}},
+                upsert=True,
+            )
+
+
+class HTTPCache:
+    def __init__(self, rules: Dict[str, CacheRule], writes: List[Tuple[str, Iterable[str]]], versions=None):
+        self.rules = rules
+        self.writes = [(prefix, tuple(collections)) for prefix, collections in writes]
+        self.versions = versions or LocalVersions()
+        self.hits = 0
+        self.misses = 0
+
+    async def bump(self, *collections: str) -> None:
+        await self.versions.bump(*collections)
+
+    async def etag(self, request: Request, rule: CacheRule) -> str:
+        versions = await self.versions.get(rule.collections)
+        parts = [f"{c}{versions[c]}" for c in rule.collections]
+        if rule.daily:
+            parts.append(datetime.now(timezone.utc).strftime("%Y%m%d"))
+        query = request.url.query
+        if query:
+            parts.append(hashlib.blake2s(query.encode(), digest_size=6).hexdigest())
+        return f'W/"{"-".join(parts)}"'
+
+    def _written_collections(self, path: str) -> Optional[Tuple[str, ...]]:
+        for prefix, collections in self.writes:
+            if path.startswith(prefix):
+                return collections
+        return None
+
+    async def middleware(self, request: Request, call_next):
+        if request.method in ("GET", "HEAD"):
+            rule = self.rules.get(request.url.path)
+            if rule is None:
+                return await call_next(request)
+
+            etag = await self.etag(request, rule)
+            headers = {"ETag": etag, "Cache-Control": rule.cache_control}
+            if etag in request.headers.get("if-none-match", ""):
+                self.hits += 1
+                return Response(status_code=304, headers=headers)
+
+            self.misses += 1
+            response = await call_next(request)
+            if response.status_code == 200:
+                response.headers.update(headers)
+            return response
+
+        response = await call_next(request)
+        if response.status_code < 400:
+            collections = self._written_collections(request.url.path)
+            if collections:
+                await self.bump(*collections)
+        return response
@@ -0,0 +1,92 @@
+"""Chaves de idempotência para ``POST /appointments`` (header ``Idempotency-Key``).
+
+A client that retries a booking (a flaky mobile network, a double tap)
+sends the same key every time. The first request claims the key with one
+insert into ``idempotency_keys`` (unique index) and runs as usual. Its
+successful response is stored under the key. Later requests with that key
+get the stored response back, so the slot queries, the customer update,
+the e-mail/WhatsApp sends and the phone's rate-limit token are spent once.
+
+* same key, different body -> 422 (a key names one request)
+* same key while the first request is still running -> 409, retry later.
+  A request that died mid-way only holds the key for ``lease``.
+* failed requests release the key, so the retry really runs again
+
+Stored responses expire after ``ttl`` (TTL index on ``expires_at``).
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def fingerprint(payload: dict) -> str:
+    """Hash of the request body, independent of key order."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class IdempotencyStore:
+    def __init__(self, collection, ttl: timedelta = timedelta(hours=24), lease: timedelta = timedelta(seconds=30)):
+        self.collection = collection
+        self.ttl = ttl
+        self.lease = lease
+        self.replays = 0
+
+    async def begin(self, key: str, request_hash: str) -> Optional[dict]:
+        """Claim ``key``: None means go ahead; a dict is the stored ``{"status_code", "body"}``.
+
+        Raises IdempotencyConflict for a reused key or one still in progress.
+        """
+        from pymongo.errors import DuplicateKeyError
+
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise IdempotencyConflict(400, f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+        now = datetime.now(timezone.utc)
+        try:
+            await self.collection.insert_one({
+                "key": key, "request_hash": request_hash, "status": "pending",
+                "locked_until": now + self.lease, "expires_at": now + self.ttl,
+            })
+            return None
+        except DuplicateKeyError:
+            pass
+
+        stored = await self.collection.find_one({"key": key}, {"_id": 0})
+        if stored is None:
+            # Expirou (ou foi liberada) entre o insert e a leitura
+            return await self.begin(key, request_hash)
+        if stored["request_hash"] != request_hash:
+            raise IdempotencyConflict(422, "Idempotency-Key was already used with a different request")
+        if stored["status"] == "done":
+            self.replays += 1
+            return {"status_code": stored["status_code"], "body": stored["body"]}
+        # Pendente: só assume a chave se o dono sumiu (lease vencido)
+        taken = await self.collection.update_one(
+            {"key": key, "status": "pending", "locked_until": {"$lt": now}},
+            {"$set": {"locked_until": now + self.lease}},
+        )
+        # matched, não modified: o novo lease pode cair no mesmo milissegundo do antigo
+        if taken.matched_count:
+            return None
+        raise IdempotencyConflict(409, "A request with this Idempotency-Key is still in progress")
+
+    async def finish(self, key: str, status_code: int, body) -> None:
+        await self.collection.update_one(
+            {"key": key},
+            {"$set": {"status": "done", "status_code": status_code, "body": body,
+                      "expires_at": datetime.now(timezone.utc) + self.ttl},
+             "$unset": {"locked_until": ""}},
+        )
+
+    async def release(self, key: str) -> None:
+        await self.collection.delete_one({"key": key, "status": "pending"})
@@ -0,0 +1,271 @@
+"""Métricas no formato de texto do Prometheus (/metrics).
+
+Cheap enough to leave on in production: a histogram observation is a
+bisect plus a few integer increments under a lock, and nothing is exported
+until ``/metrics`` is scraped.
+
+* HTTP middleware: request count and latency per method/route template/status.
+* ``CommandListener`` (pymongo command monitoring): DB time and round trips,
+  attributed to the HTTP route that issued them through a contextvar
+  (Motor copies the context into its executor threads).
+* ``PoolListener`` (pymongo pool monitoring): open / checked-out / waiting
+  connections and checkout wait time, for sizing ``MONGO_MAX_POOL_SIZE``.
+* ``outbound(provider)``: timing of Twilio/SendGrid calls.
+* ``gauge(name, help, fn)``: values read at scrape time (cache hits, queue size...).
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+from starlette.requests import Request
+from starlette.responses import Response
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Labels, extra: str = "") -> str:
+    parts = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(l)} {v}" for l, v in sorted(self.values.items())]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.buckets = name, help, tuple(buckets)
+        self.series: Dict[Labels, list] = {}
+
+    def observe(self, labels: Labels, value: float) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            # [contagem por bucket..., +Inf, soma]
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {series[-1]}")
+            lines.append(f"{self.name}_count{_labels(labels)} {cumulative}")
+        return lines
+
+
+class _RequestDB:
+    """DB time/round trips of the request being served (shared with Motor threads)."""
+    __slots__ = ("scope", "commands", "seconds")
+
+    def __init__(self, scope: dict):
+        self.scope, self.commands, self.seconds = scope, 0, 0.0
+
+    @property
+    def route(self) -> str:
+        # O router grava a rota casada no scope; o template evita uma série por id
+        return getattr(self.scope.get("route"), "path", "unmatched")
+
+
+_current: contextvars.ContextVar[Optional[_RequestDB]] = contextvars.ContextVar("metrics_request", default=None)
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter("http_requests_total", "HTTP requests by method, route and status.")
+        self.latency = Histogram("http_request_duration_seconds", "HTTP request latency by method and route.")
+        self.db_commands = Counter("db_commands_total", "MongoDB commands by route, command and outcome.")
+        self.db_latency = Histogram("db_command_duration_seconds", "MongoDB command latency by command.", DB_BUCKETS)
+        self.db_per_request = Histogram(
+            "db_round_trips_per_request", "MongoDB round trips per HTTP request by route.",
+            (0, 1, 2, 3, 4, 5, 8, 13, 21, 50)
+        )
+        self.db_time_per_request = Histogram(
+            "db_time_per_request_seconds", "Total MongoDB time per HTTP request by route.", DB_BUCKETS
+        )
+        self.outbound_latency = Histogram(
+            "outbound_request_duration_seconds", "Twilio/SendGrid call latency by provider and outcome."
+        )
+        self.pool_wait = Histogram(
+            "mongo_pool_checkout_wait_seconds", "Time spent waiting for a pooled MongoDB connection.", DB_BUCKETS
+        )
+        self.pool_failures = Counter("mongo_pool_checkout_failures_total", "Failed connection checkouts by reason.")
+        self._collected: List[Tuple[str, str, str, Callable[[], float]]] = []
+        self.command_listener = CommandListener(self)
+        self.pool_listener = PoolListener(self)
+        pool = self.pool_listener
+        self.gauge("mongo_pool_connections", "Open MongoDB connections.", lambda: pool.open)
+        self.gauge("mongo_pool_checked_out", "MongoDB connections in use.", lambda: pool.checked_out)
+        self.gauge("mongo_pool_waiting", "Operations waiting for a MongoDB connection.", lambda: pool.waiting)
+        self.gauge("mongo_pool_cleared_total", "Times the MongoDB pool was cleared.", lambda: pool.cleared, "counter")
+
+    def gauge(self, name: str, help: str, fn: Callable[[], float], kind: str = "gauge") -> None:
+        """Export ``fn()`` at scrape time (``kind="counter"`` for running totals)."""
+        self._collected.append((name, help, kind, fn))
+
+    def observe_command(self, command: str, seconds: float, ok: bool) -> None:
+        request = _current.get()
+        route = request.route if request else "background"
+        with self._lock:
+            self.db_commands.inc((("route", route), ("command", command), ("outcome", "ok" if ok else "error")))
+            self.db_latency.observe((("command", command),), seconds)
+            if request:
+                request.commands += 1
+                request.seconds += seconds
+
+    @contextmanager
+    def outbound(self, provider: str):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            yield
+            outcome = "ok"
+        finally:
+            with self._lock:
+                self.outbound_latency.observe((("provider", provider), ("outcome", outcome)),
+                                              time.perf_counter() - start)
+
+    async def middleware(self, request: Request, call_next):
+        if request.url.path == "/metrics":
+            return await call_next(request)
+        stats = _RequestDB(request.scope)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status = 500
+        try:
+            response = await call_next(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            path = stats.route
+            if path == "unmatched" and status == 304:
+                # 304 do cache HTTP sai antes do roteamento; as regras são caminhos exatos
+                path = request.url.path
+            with self._lock:
+                self.requests.inc((("method", request.method), ("route", path), ("status", str(status))))
+                self.latency.observe((("method", request.method), ("route", path)), elapsed)
+                self.db_per_request.observe((("route", path),), stats.commands)
+                self.db_time_per_request.observe((("route", path),), stats.seconds)
+
+    def render(self) -> str:
+        with self._lock:
+            lines = []
+            for metric in (self.requests, self.latency, self.db_commands, self.db_latency,
+                           self.db_per_request, self.db_time_per_request, self.outbound_latency,
+                           self.pool_wait, self.pool_failures):
+                lines += metric.render()
+        for name, help, kind, fn in self._collected:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def response(self) -> Response:
+        return Response(self.render(), media_type="text/plain; version=0.0.4")
+
+
+class CommandListener(monitoring.CommandListener):
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.metrics.observe_command(event.command_name, event.duration_micros / 1e6, True)
+
+    def failed(self, event):
+        self.metrics.observe_command(event.command_name, event.duration_micros / 1e6, False)
+
+
+class PoolListener(monitoring.ConnectionPoolListener):
+    """Connection pool counters (summed over servers) and checkout wait times.
+
+    A checkout starts and ends on the same executor thread, so the start time
+    is kept in a thread-local.
+    """
+
+    def __init__(self, metrics: Metrics):
+        self.metrics = metrics
+        self.open = 0
+        self.checked_out = 0
+        self.waiting = 0
+        self.cleared = 0
+        self._started = threading.local()
+
+    def _change(self, field: str, delta: int) -> None:
+        with self.metrics._lock:
+            setattr(self, field, getattr(self, field) + delta)
+
+    def _end_wait(self, outcome: Optional[str]) -> None:
+        started = getattr(self._started, "at", None)
+        self._started.at = None
+        with self.metrics._lock:
+            self.waiting -= 1
+            if outcome:
+                self.metrics.pool_failures.inc((("reason", outcome),))
+            elif started is not None:
+                self.metrics.pool_wait.observe((), time.perf_counter() - started)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._change("cleared", 1)
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._change("open", 1)
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._change("open", -1)
+
+    def connection_check_out_started(self, event):
+        self._started.at = time.perf_counter()
+        self._change("waiting", 1)
+
+    def connection_check_out_failed(self, event):
+        self._end_wait(str(event.reason))
+
+    def connection_checked_out(self, event):
+        self._end_wait(None)
+        self._change("checked_out", 1)
+
+    def connection_checked_in(self, event):
+        self._change("checked_out", -1)
@@ -0,0 +1,189 @@
+"""Fila de notificações (e-mail / WhatsApp) fora do caminho da requisição.
+
+Every message is first written to an outbox collection and then handed to
+an asyncio queue served by a small worker pool. Provider SDKs are blocking,
+so each send runs in a thread. Failures are retried with exponential
+backoff; on startup any message still pending in the outbox is re-queued,
+so a restart does not lose notifications.
+
+Before sending, a worker claims the row with one ``find_one_and_update``
+(pending and due -> ``sending`` with a ``locked_until`` lease). Several
+processes may queue the same row (overlapping deploys, more than one
+uvicorn worker); only one claim wins, so a message goes out once. A process
+that dies mid-send leaves the row ``sending``; it is picked up again once
+the lease runs out. Sent and failed rows get ``finished_at`` and are
+dropped by a TTL index (they hold customer names and phone numbers).
+"""
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+CLOCK_SLACK = 1.0
+
+
+class NotificationDispatcher:
+    def __init__(self, outbox, providers: Optional[Dict[str, Callable[[dict], object]]] = None,
+                 workers: int = 2, max_attempts: int = 5, base_delay: float = 2.0,
+                 max_delay: float = 300.0, lease: float = 120.0):
+        self.outbox = outbox
+        self.lease = lease
+        self.owner = uuid.uuid4().hex[:12]
+        self.providers = dict(providers or {})
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.queue: Optional[asyncio.Queue] = None
+        self._tasks = []
+        self._retries = set()
+        self._inflight = 0
+
+    def register(self, channel: str, provider: Callable[[dict], object]) -> None:
+        self.providers[channel] = provider
+
+    async def start(self) -> None:
+        self.queue = asyncio.Queue()
+        now = time.time()
+        # Pendentes, e "sending" de um processo que morreu (lease vencido quando chegar a vez)
+        async for job in self.outbox.find({"status": {"$in": [PENDING, SENDING]}}, {"_id": 0}):
+            due = job.get("locked_until", now) if job["status"] == SENDING else job.get("next_attempt_at", now)
+            self._schedule(job, max(0.0, due - now))
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Drain what is already queued, then stop the workers.
+
+        Anything left (including scheduled retries) stays pending in the
+        outbox and is picked up on the next start.
+        """
+        try:
+            await asyncio.wait_for(self.drain(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Notification queue not drained before shutdown")
+        for handle in self._retries:
+            handle.cancel()
+        self._retries.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def pending(self) -> int:
+        """Jobs queued, being sent or waiting for a retry."""
+        return self._inflight + len(self._retries)
+
+    async def drain(self) -> None:
+        while self._retries or self._inflight:
+            await asyncio.sleep(0.01)
+
+    async def enqueue(self, channel: str, payload: dict) -> dict:
+        job = {
+            "id": str(uuid.uuid4()),
+            "channel": channel,
+            "payload": payload,
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": time.time(),
+            "last_error": None,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        await self.outbox.insert_one(dict(job))
+        self._put(job)
+        return job
+
+    def _put(self, job: dict) -> None:
+        self._inflight += 1
+        self.queue.put_nowait(job)
+
+    def _schedule(self, job: dict, delay: float) -> None:
+        if delay <= 0:
+            self._put(job)
+            return
+
+        def requeue():
+            self._retries.discard(handle)
+            self._put(job)
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retries.add(handle)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._deliver(job)
+            except Exception as e:
+                logger.error(f"Notification worker error on {job.get('id')}: {e}")
+            finally:
+                self._inflight -= 1
+                self.queue.task_done()
+
+    async def _claim(self, job: dict) -> Optional[dict]:
+        """Take the row for this process; None when another one has it or it is done."""
+        from pymongo import ReturnDocument
+
+        now = time.time()
+        return await self.outbox.find_one_and_update(
+            {"id": job["id"], "$or": [
+                # Folga: o call_later do retry pode disparar um instante antes pelo relógio de parede
+                {"status": PENDING, "next_attempt_at": {"$lte": now + CLOCK_SLACK}},
+                {"status": SENDING, "locked_until": {"$lt": now}},
+            ]},
+            {"$set": {"status": SENDING, "locked_until": now + self.lease, "locked_by": self.owner}},
+            projection={"_id": 0}, return_document=ReturnDocument.AFTER,
+        )
+
+    async def _deliver(self, job: dict) -> None:
+        claimed = await self._claim(job)
+        if claimed is None:
+            return
+        job = claimed
+        provider = self.providers.get(job["channel"])
+        if provider is None:
+            await self._mark(job, FAILED, error=f"No provider for channel {job['channel']}")
+            return
+
+        try:
+            await asyncio.to_thread(provider, job["payload"])
+        except Exception as e:
+            job["attempts"] += 1
+            if job["attempts"] >= self.max_attempts:
+                logger.error(f"Notification {job['id']} ({job['channel']}) failed for good: {e}")
+                await self._mark(job, FAILED, error=str(e))
+                return
+            delay = min(self.base_delay * 2 ** (job["attempts"] - 1), self.max_delay)
+            job["next_attempt_at"] = time.time() + delay
+            await self._mark(job, PENDING, error=str(e))
+            self._schedule(job, delay)
+            return
+
+        job["attempts"] += 1
+        await self._mark(job, SENT)
+        logger.info(f"Notification {job['id']} sent via {job['channel']}")
+
+    async def _mark(self, job: dict, status: str, error: Optional[str] = None) -> None:
+        job["status"] = status
+        now = datetime.now(timezone.utc)
+        update = {
+            "status": status,
+            "attempts": job["attempts"],
+            "next_attempt_at": job["next_attempt_at"],
+            "last_error": error,
+            "updated_at": now.isoformat(),
+        }
+        if status in (SENT, FAILED):
+            update["finished_at"] = now  # TTL (schema.INDEXES)
+        await self.outbox.update_one(
+            {"id": job["id"]}, {"$set": update, "$unset": {"locked_until": "", "locked_by": ""}}
+        )
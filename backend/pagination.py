@@ -0,0 +1,95 @@
+"""Paginação por cursor (keyset) e streaming NDJSON / CSV para as rotas de listagem.
+
+A cursor is the sort-key values of the last row of a page, base64-encoded.
+The next page is fetched with a range filter on those keys instead of
+``skip``, so every page costs the same no matter how deep the client goes.
+"""
+import base64
+import csv
+import io
+import json
+from typing import AsyncIterator, Iterable, List, Optional, Sequence, Tuple
+
+ASC = 1
+DESC = -1
+
+SortSpec = Sequence[Tuple[str, int]]
+
+
+def encode_cursor(values: list) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, expected_length: int) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != expected_length:
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def _past(field: str, direction: int, value) -> Optional[dict]:
+    """Filter for rows strictly after ``value`` on one sort key.
+
+    MongoDB sorts null below every string, and range operators never match
+    null, so nulls need their own branch.
+    """
+    if direction == ASC:
+        return {field: {"$ne": None}} if value is None else {field: {"$gt": value}}
+    if value is None:
+        return None
+    return {"$or": [{field: {"$lt": value}}, {field: None}]}
+
+
+def keyset_filter(sort: SortSpec, values: list) -> dict:
+    branches = []
+    for i, (field, direction) in enumerate(sort):
+        past = _past(field, direction, values[i])
+        if past is None:
+            continue
+        clause = {sort[j][0]: values[j] for j in range(i)}
+        clause.update(past)
+        branches.append(clause)
+    return {"$or": branches} if branches else {"_id": {"$exists": False}}
+
+
+def cursor_for(doc: dict, sort: SortSpec) -> str:
+    return encode_cursor([doc.get(field) for field, _ in sort])
+
+
+async def paginate(collection, query: dict, sort: SortSpec, limit: int,
+                   after: Optional[str] = None, projection: Optional[dict] = None) -> Tuple[List[dict], Optional[str]]:
+    """One page of ``limit`` rows plus the cursor of the next page (or None)."""
+    if after:
+        query = {"$and": [query, keyset_filter(sort, decode_cursor(after, len(sort)))]}
+    docs = await collection.find(query, projection or {"_id": 0}).sort(list(sort)).limit(limit + 1).to_list(limit + 1)
+    if len(docs) > limit:
+        docs = docs[:limit]
+        return docs, cursor_for(docs[-1], sort)
+    return docs, None
+
+
+async def ndjson_lines(cursor) -> AsyncIterator[bytes]:
+    """Iterate a Motor cursor straight into newline-delimited JSON."""
+    async for doc in cursor:
+        doc.pop("_id", None)
+        yield (json.dumps(doc, default=str) + "\n").encode()
+
+
+async def csv_lines(cursor, fields: Iterable[str]) -> AsyncIterator[bytes]:
+    """Iterate a Motor cursor into CSV rows (header first), one encoded line at a time."""
+    fields = list(fields)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    async for doc in cursor:
+        writer.writerow(["" if doc.get(name) is None else doc.get(name) for name in fields])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
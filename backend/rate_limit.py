@@ -0,0 +1,175 @@
+"""Limite de requisições (token bucket) nas rotas públicas de reserva.
+
+Each client key (an IP address, a phone number) has a bucket of
+``capacity`` tokens that refills evenly over ``period`` seconds. A request
+takes one token, or is answered ``429`` with ``Retry-After`` when the
+bucket is empty. Checks run in middleware (IP) or on the first line of the
+handler (phone), before any database work.
+
+Buckets live in process memory (``LocalBuckets``, LRU-bounded). With
+several workers, ``MongoBuckets`` keeps them in a shared collection: one
+atomic ``find_one_and_update`` per request, issued only after the worker's
+own bucket let the request through. A flood hitting one worker is
+therefore still turned away without a round trip.
+"""
+import logging
+import math
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+class Limit:
+    __slots__ = ("capacity", "period")
+
+    def __init__(self, capacity: int, period: float):
+        if capacity < 1 or period <= 0:
+            raise ValueError("Rate limit needs capacity >= 1 and period > 0")
+        self.capacity = capacity
+        self.period = period
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / self.period
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        """``"requests/seconds"``, e.g. ``"120/60"``."""
+        try:
+            capacity, period = value.split("/")
+            return cls(int(capacity), float(period))
+        except ValueError:
+            raise ValueError(f"Invalid rate limit {value!r} (expected requests/seconds)")
+
+
+def normalize_phone(phone: str) -> str:
+    # "+1 (555) 010-2030" e "15550102030" caem no mesmo balde
+    return re.sub(r"\D", "", phone or "")
+
+
+class LocalBuckets:
+    """In-process buckets; the least recently used are dropped past ``max_keys``."""
+
+    def __init__(self, max_keys: int = 100_000, clock: Callable[[], float] = time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def take(self, key: str, limit: Limit) -> float:
+        """Take a token: 0 when allowed, else seconds until one is available."""
+        now = self.clock()
+        tokens, last = self._buckets.pop(key, (limit.capacity, now))
+        tokens = min(limit.capacity, tokens + (now - last) * limit.rate)
+        wait = 0.0 if tokens >= 1 else (1 - tokens) / limit.rate
+        self._buckets[key] = (tokens - 1 if not wait else tokens, now)
+        if len(self._buckets) > self.max_keys:
+            # Um balde esquecido equivale a um balde cheio
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class MongoBuckets:
+    """Buckets shared by every worker, one document per key.
+
+    Refill and take happen in a single pipeline update, so concurrent
+    workers can't both spend the last token. ``expires_at`` (TTL index)
+    removes a bucket once it would be full again.
+    """
+
+    def __init__(self, collection, clock: Callable[[], float] = time.time):
+        self.collection = collection
+        self.clock = clock
+
+    async def take(self, key: str, limit: Limit) -> float:
+        from pymongo import ReturnDocument
+        from pymongo.errors import DuplicateKeyError
+
+        now = self.clock()
+        refilled = {"$min": [limit.capacity, {"$add": [
+            {"$ifNull": ["$tokens", limit.capacity]},
+            {"$multiply": [limit.rate, {"$max": [0, {"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}]}]},
+        ]}]}
+        pipeline = [
+            {"$set": {"tokens": refilled}},
+            {"$set": {
+                "allowed": {"$gte": ["$tokens", 1]},
+                "tokens": {"$cond": [{"$gte": ["$tokens", 1]}, {"$subtract": ["$tokens", 1]}, "$tokens"]},
+                "updated_at": now,
+                "expires_at": datetime.fromtimestamp(now, timezone.utc) + timedelta(seconds=limit.period),
+            }},
+        ]
+        for attempt in range(2):
+            try:
+                doc = await self.collection.find_one_and_update(
+                    {"key": key}, pipeline, projection={"_id": 0, "tokens": 1, "allowed": 1},
+                    upsert=True, return_document=ReturnDocument.AFTER,
+                )
+                break
+            except DuplicateKeyError:
+                # Dois workers criando o mesmo balde: o segundo tenta de novo
+                if attempt:
+                    raise
+        return 0.0 if doc["allowed"] else (1 - doc["tokens"]) / limit.rate
+
+
+class RateLimiter:
+    """Named limits, the routes they guard by client IP, and the 429 response."""
+
+    def __init__(self, limits: Dict[str, Limit], routes: Dict[Tuple[str, str], str],
+                 shared: Optional[MongoBuckets] = None, proxy_hops: int = 0, enabled: bool = True,
+                 local: Optional[LocalBuckets] = None):
+        self.limits = limits
+        self.routes = routes
+        self.shared = shared
+        self.proxy_hops = proxy_hops
+        self.enabled = enabled
+        self.local = local or LocalBuckets()
+        self.rejected = 0
+
+    def client_ip(self, request: Request) -> str:
+        """Peer address, or the entry ``proxy_hops`` trusted proxies appended to X-Forwarded-For."""
+        forwarded = [ip.strip() for ip in request.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+        if self.proxy_hops and forwarded:
+            return forwarded[-min(self.proxy_hops, len(forwarded))]
+        return request.client.host if request.client else "unknown"
+
+    async def hit(self, name: str, key: str) -> float:
+        """Spend one token of limit ``name`` for ``key``; 0 when allowed, else the wait in seconds."""
+        if not self.enabled:
+            return 0.0
+        limit = self.limits[name]
+        bucket = f"{name}:{key}"
+        wait = self.local.take(bucket, limit)
+        if not wait and self.shared is not None:
+            try:
+                wait = await self.shared.take(bucket, limit)
+            except Exception as e:
+                # Banco indisponível não derruba a reserva: vale o limite local
+                logger.warning(f"Shared rate limit unavailable: {e}")
+        if wait:
+            self.rejected += 1
+        return wait
+
+    @staticmethod
+    def retry_after(wait: float) -> str:
+        return str(max(1, math.ceil(wait)))
+
+    async def middleware(self, request: Request, call_next):
+        name = self.routes.get((request.method, request.url.path))
+        if name and self.enabled:
+            wait = await self.hit(name, self.client_ip(request))
+            if wait:
+                return JSONResponse(
+                    {"detail": "Too many requests"}, status_code=429, headers={"Retry-After": self.retry_after(wait)}
+                )
+        return await call_next(request)
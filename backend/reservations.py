@@ -0,0 +1,86 @@
+"""Reserva atômica de horários (sem agendamento duplo).
+
+A booking claims every 5-minute cell its service occupies by inserting one
+``slot_claims`` document per cell under a unique (date, barber_id, cell)
+index. MongoDB lets exactly one insert win per cell of each chair, so two
+overlapping bookings with the same barber can never both succeed, and no
+global lock is needed. Claims are released when the
+appointment is cancelled, deleted or moved.
+"""
+from typing import List, Optional
+
+from pymongo.errors import BulkWriteError
+
+from availability import appointment_span
+
+CELL_MINUTES = 5
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+def claim_cells(start: int, duration: int) -> List[int]:
+    """Cell start minutes covering [start, start + duration)."""
+    first = start - start % CELL_MINUTES
+    end = start + max(duration, 1)
+    return list(range(first, end, CELL_MINUTES))
+
+
+async def reserve(claims, date: str, start: int, duration: int, appointment_id: str,
+                  barber_id: Optional[str] = None) -> None:
+    """Claim every cell for the appointment or raise SlotUnavailable.
+
+    Cells go in ascending order and the insert stops at the first taken
+    one, so among overlapping bookings the earliest contested cell decides
+    and one of them always wins (with an unordered insert each could grab
+    a few cells, hit the others' and back off). Cells the appointment
+    already owns count as claimed, so calling this again for the same
+    booking is a no-op.
+    """
+    filter_ = {"date": date, "barber_id": barber_id, "appointment_id": appointment_id}
+    pending = claim_cells(start, duration)
+    inserted, owned = [], None
+    while pending:
+        try:
+            await claims.insert_many([{**filter_, "cell": cell} for cell in pending], ordered=True)
+            return
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            index = errors[0]["index"] if errors else 0
+        inserted += pending[:index]
+        if owned is None:
+            # Mesma cadeira: células do agendamento em outro barbeiro não contam como suas
+            owned = set(await claims.distinct("cell", {**filter_, "cell": {"$in": pending[index:]}}))
+        if pending[index] not in owned:
+            break
+        pending = [cell for cell in pending[index + 1:] if cell not in owned]
+    else:
+        return
+
+    # Desfaz só as células inseridas nesta tentativa
+    if inserted:
+        await claims.delete_many({**filter_, "cell": {"$in": inserted}})
+    raise SlotUnavailable(f"{date} {start // 60:02d}:{start % 60:02d} overlaps another booking")
+
+
+async def release(claims, appointment_id: str) -> None:
+    await claims.delete_many({"appointment_id": appointment_id})
+
+
+async def backfill_claims(appointments, claims, since: str, statuses) -> int:
+    """Claim cells for existing bookings from ``since`` on; returns overlaps found."""
+    overlaps = 0
+    async for apt in appointments.find(
+        {"date": {"$gte": since}, "status": {"$in": list(statuses)}},
+        {"_id": 0, "id": 1, "date": 1, "time": 1, "duration_minutes": 1, "start_minute": 1, "end_minute": 1,
+         "barber_id": 1}
+    ):
+        start, end = appointment_span(apt)
+        if start is None or end is None:
+            continue
+        try:
+            await reserve(claims, apt["date"], start, end - start, apt["id"], apt.get("barber_id"))
+        except SlotUnavailable:
+            overlaps += 1
+    return overlaps
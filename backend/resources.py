@@ -0,0 +1,104 @@
+"""Recursos do processo: pool do MongoDB e sessões HTTP dos provedores.
+
+Pool sizes and timeouts come from ``MONGO_*`` environment variables, so each
+deployment can tune them without code changes. The client is created with
+``connect=False``. Nothing touches the network at import time. The app
+lifespan calls ``warm_up`` before the first request: it pings the server and
+opens the minimum pool, so the first bookings don't pay for connection
+setup and a wrong ``MONGO_URL`` fails at boot rather than on a customer's
+request.
+
+Twilio and SendGrid each get one keep-alive ``requests.Session``, shared by
+the notification workers. A send then reuses an open TLS connection instead
+of doing a fresh handshake every time. The SDK defaults (SendGrid goes
+through ``urllib``) connect anew for each message.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Mapping, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# variável de ambiente -> (opção do pymongo, padrão)
+MONGO_POOL_SETTINGS = {
+    "MONGO_MAX_POOL_SIZE": ("maxPoolSize", 50),
+    "MONGO_MIN_POOL_SIZE": ("minPoolSize", 5),
+    "MONGO_MAX_IDLE_MS": ("maxIdleTimeMS", 300_000),
+    # Sem conexão livre por este tempo: erro rápido em vez de fila sem fim
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS": ("waitQueueTimeoutMS", 2_000),
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS": ("serverSelectionTimeoutMS", 5_000),
+    "MONGO_CONNECT_TIMEOUT_MS": ("connectTimeoutMS", 5_000),
+    "MONGO_SOCKET_TIMEOUT_MS": ("socketTimeoutMS", 30_000),
+}
+
+SENDGRID_URL = "https://api.sendgrid.com/v3/mail/send"
+
+
+def _env_int(environ: Mapping[str, str], name: str, default: int) -> int:
+    value = environ.get(name)
+    if value in (None, ""):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+
+
+def mongo_options(environ: Mapping[str, str] = os.environ) -> dict:
+    """Keyword arguments for ``AsyncIOMotorClient`` (pool sizes, timeouts)."""
+    options = {
+        option: _env_int(environ, name, default)
+        for name, (option, default) in MONGO_POOL_SETTINGS.items()
+    }
+    if options["minPoolSize"] > options["maxPoolSize"]:
+        raise ValueError("MONGO_MIN_POOL_SIZE cannot exceed MONGO_MAX_POOL_SIZE")
+    return {**options, "appname": environ.get("MONGO_APP_NAME", "jhun-barber"), "connect": False}
+
+
+async def warm_up(client, connections: int = 1) -> float:
+    """Ping the server and open ``connections`` pooled sockets; returns seconds taken."""
+    start = time.perf_counter()
+    await client.admin.command("ping")
+    if connections > 1:
+        # Pings simultâneos fazem o pool abrir uma conexão para cada
+        await asyncio.gather(*(client.admin.command("ping") for _ in range(connections)))
+    return time.perf_counter() - start
+
+
+def keepalive_session(pool_size: int = 4, retries: int = 0) -> requests.Session:
+    """A ``requests.Session`` with a connection pool sized for the notification workers."""
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries))
+    return session
+
+
+def twilio_http_client(pool_size: int = 4, timeout: float = 10.0):
+    """Twilio transport backed by one shared keep-alive session."""
+    from twilio.http.http_client import TwilioHttpClient
+
+    http = TwilioHttpClient(pool_connections=True, timeout=timeout)
+    http.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+    return http
+
+
+class SendGridSender:
+    """``Mail`` -> SendGrid v3 API over a shared session (the SDK opens a new connection per send)."""
+
+    def __init__(self, api_key: str, pool_size: int = 4, timeout: float = 10.0,
+                 session: Optional[requests.Session] = None):
+        self.timeout = timeout
+        self.session = session or keepalive_session(pool_size)
+        self.session.headers.update({"Authorization": f"Bearer {api_key}"})
+
+    def send(self, mail) -> requests.Response:
+        response = self.session.post(SENDGRID_URL, json=mail.get(), timeout=self.timeout)
+        response.raise_for_status()
+        return response
+
+    def close(self) -> None:
+        self.session.close()
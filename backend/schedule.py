@@ -0,0 +1,223 @@
+"""Regras de funcionamento: horário por dia da semana, pausas, feriados e grade.
+
+The configuration is a single ``schedule_config`` document. It is compiled
+once into a ``DayTemplate`` per weekday. A template holds the grid of
+candidate start times, their 12h labels, and a bitmap of the minutes the
+shop is closed (outside opening hours or during a break). Availability then
+needs one mask test per grid start: nothing is parsed or formatted per
+request. A holiday resolves to the closed template.
+
+Writes through the API call ``invalidate()``. When MongoDB runs as a replica
+set, a change stream does the same for edits made elsewhere.
+"""
+import asyncio
+import logging
+from datetime import date as Date
+from typing import Dict, Iterable, List, Optional, Union
+
+from availability import (
+    CLOSE_MINUTE, MINUTES_PER_DAY, OPEN_MINUTE, SLOT_INTERVAL,
+    DayOccupancy, format_minutes_12h, format_minutes_24h, parse_block_time,
+)
+
+logger = logging.getLogger(__name__)
+
+CONFIG_ID = "default"
+WEEKDAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# Horário original da barbearia: segunda a sábado 09:00–21:00, domingo fechado
+DEFAULT_CONFIG = {
+    "slot_interval": SLOT_INTERVAL,
+    "hours": {
+        **{str(day): {"open": format_minutes_24h(OPEN_MINUTE), "close": format_minutes_24h(CLOSE_MINUTE)}
+           for day in range(6)},
+        "6": None,
+    },
+    "breaks": [],
+    "holidays": [],
+}
+
+# Além do fim do dia: um serviço que passaria da meia-noite também não cabe
+_HORIZON = 2 * MINUTES_PER_DAY
+
+
+def _span(start: int, end: int) -> int:
+    return ((1 << (end - start)) - 1) << start if end > start else 0
+
+
+class DayTemplate:
+    """Compiled rules for one kind of day: grid starts, labels and closed minutes."""
+
+    __slots__ = ("starts", "labels", "closed_mask")
+
+    def __init__(self, open_minute: Optional[int] = None, close_minute: Optional[int] = None,
+                 interval: int = SLOT_INTERVAL, breaks: tuple = ()):
+        if open_minute is None or close_minute is None or close_minute <= open_minute:
+            self.starts, self.labels, self.closed_mask = (), {}, _span(0, _HORIZON)
+            return
+        mask = _span(0, open_minute) | _span(close_minute, _HORIZON)
+        for start, end in breaks:
+            mask |= _span(max(start, 0), min(end, _HORIZON))
+        self.closed_mask = mask
+        self.starts = tuple(range(open_minute, close_minute, interval))
+        self.labels = {start: format_minutes_12h(start) for start in self.starts}
+
+    @property
+    def closed(self) -> bool:
+        return not self.starts
+
+    @property
+    def open_minutes(self) -> int:
+        """Minutes of the day a chair can be booked (opening hours minus breaks)."""
+        if self.closed:
+            return 0
+        return MINUTES_PER_DAY - (self.closed_mask & _span(0, MINUTES_PER_DAY)).bit_count()
+
+    def allows(self, start: int, duration: int) -> bool:
+        """Does ``start``..``start + duration`` fall inside opening hours, clear of breaks?"""
+        return not self.closed and DayOccupancy(self.closed_mask).is_free(start, max(duration, 1))
+
+    def available_starts(self, occupancy: DayOccupancy, duration: int) -> List[int]:
+        window = (1 << duration) - 1 if duration > 0 else 0
+        mask = occupancy.mask | self.closed_mask
+        return [start for start in self.starts if (mask >> start) & window == 0]
+
+    def available_labels(self, occupancy: DayOccupancy, duration: int) -> List[str]:
+        labels = self.labels
+        return [labels[start] for start in self.available_starts(occupancy, duration)]
+
+    def available_starts_any(self, occupancies: Iterable[DayOccupancy], duration: int) -> List[int]:
+        """Grid starts where at least one of the chairs fits the service."""
+        fits = 0
+        for occupancy in occupancies:
+            fits |= DayOccupancy(occupancy.mask | self.closed_mask).fit_mask(max(duration, 1))
+        return [start for start in self.starts if (fits >> start) & 1]
+
+    def available_labels_any(self, occupancies: Iterable[DayOccupancy], duration: int) -> List[str]:
+        labels = self.labels
+        return [labels[start] for start in self.available_starts_any(occupancies, duration)]
+
+
+CLOSED = DayTemplate()
+
+
+def _minutes(value: str, field: str) -> int:
+    minutes = parse_block_time(value)
+    if minutes is None or not 0 <= minutes <= MINUTES_PER_DAY:
+        raise ValueError(f"Invalid time for {field}: {value!r}")
+    return minutes
+
+
+def compile_weekly(config: dict) -> Dict[int, DayTemplate]:
+    """One template per weekday (0 = Monday). Raises ValueError on bad rules."""
+    interval = config.get("slot_interval", SLOT_INTERVAL)
+    if not isinstance(interval, int) or interval <= 0:
+        raise ValueError("slot_interval must be a positive number of minutes")
+
+    breaks_by_day: Dict[int, list] = {day: [] for day in range(7)}
+    for rule in config.get("breaks") or ():
+        span = (_minutes(rule.get("start"), "break start"), _minutes(rule.get("end"), "break end"))
+        if span[1] <= span[0]:
+            raise ValueError("Break must end after it starts")
+        days = rule.get("weekdays")
+        for day in (range(7) if days is None else days):
+            if day not in breaks_by_day:
+                raise ValueError(f"Invalid weekday: {day!r}")
+            breaks_by_day[day].append(span)
+
+    hours = config.get("hours") or {}
+    weekly = {}
+    for day in range(7):
+        window = hours.get(str(day))
+        if not window:
+            weekly[day] = CLOSED
+            continue
+        open_minute = _minutes(window.get("open"), "open")
+        close_minute = _minutes(window.get("close"), "close")
+        if close_minute <= open_minute:
+            raise ValueError(f"Closing time must be after opening time (weekday {day})")
+        weekly[day] = DayTemplate(open_minute, close_minute, interval, tuple(breaks_by_day[day]))
+    return weekly
+
+
+class ScheduleRules:
+    def __init__(self, collection):
+        self.collection = collection
+        self._config: Optional[dict] = None
+        self._weekly: Optional[Dict[int, DayTemplate]] = None
+        self._holidays = frozenset()
+        self._yearly = frozenset()
+        self._lock = asyncio.Lock()
+        self.compilations = 0
+
+    def _compile(self, config: dict) -> None:
+        weekly = compile_weekly(config)
+        dates = [holiday["date"] for holiday in config.get("holidays") or ()]
+        # "MM-DD" repete todo ano; "YYYY-MM-DD" vale só naquela data
+        self._holidays = frozenset(d for d in dates if len(d) == 10)
+        self._yearly = frozenset(d for d in dates if len(d) == 5)
+        self._config, self._weekly = config, weekly
+        self.compilations += 1
+
+    async def _ensure_loaded(self) -> Dict[int, DayTemplate]:
+        weekly = self._weekly
+        if weekly is not None:
+            return weekly
+        async with self._lock:
+            if self._weekly is None:
+                doc = await self.collection.find_one({"id": CONFIG_ID}, {"_id": 0, "id": 0})
+                try:
+                    self._compile(doc or DEFAULT_CONFIG)
+                except ValueError as e:
+                    logger.error(f"Invalid schedule config, using defaults: {e}")
+                    self._compile(DEFAULT_CONFIG)
+            return self._weekly
+
+    async def load(self) -> None:
+        self.invalidate()
+        await self._ensure_loaded()
+
+    async def config(self) -> dict:
+        await self._ensure_loaded()
+        return self._config
+
+    async def template(self, day: Union[str, Date]) -> DayTemplate:
+        """Template for a date ("YYYY-MM-DD" or date); ValueError on a bad date."""
+        weekly = await self._ensure_loaded()
+        if isinstance(day, str):
+            day = Date.fromisoformat(day)
+        iso = day.isoformat()
+        if iso in self._holidays or iso[5:] in self._yearly:
+            return CLOSED
+        return weekly[day.weekday()]
+
+    async def closed_message(self, day: Union[str, Date]) -> str:
+        """Why a closed day is closed: "Closed on Sundays" (the original text) or a holiday."""
+        weekly = await self._ensure_loaded()
+        if isinstance(day, str):
+            day = Date.fromisoformat(day)
+        if weekly[day.weekday()].closed:
+            return f"Closed on {WEEKDAY_NAMES[day.weekday()]}s"
+        return "Closed for a holiday"
+
+    async def save(self, config: dict) -> dict:
+        compile_weekly(config)  # valida antes de gravar
+        await self.collection.replace_one({"id": CONFIG_ID}, {"id": CONFIG_ID, **config}, upsert=True)
+        self.invalidate()
+        return await self.config()
+
+    def invalidate(self) -> None:
+        self._weekly = None
+
+    async def watch(self) -> None:
+        """Invalidate on every change to the config (needs a replica set)."""
+        from pymongo.errors import PyMongoError
+
+        try:
+            async with self.collection.watch() as stream:
+                async for _ in stream:
+                    self.invalidate()
+        except asyncio.CancelledError:
+            raise
+        except PyMongoError as e:
+            logger.info(f"Schedule change stream unavailable, relying on write-path invalidation: {e}")
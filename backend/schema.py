@@ -0,0 +1,176 @@
+"""Índices das coleções e verificação de planos de consulta.
+
+Index declarations live here as plain (keys, options) pairs so they can be
+created idempotently at startup with ``ensure_indexes``. ``ROUTE_QUERIES``
+mirrors the filters/sorts the routes issue; ``check_query_plans`` runs
+``explain()`` on each one and reports any that fall back to a COLLSCAN.
+"""
+import logging
+from typing import Dict, Iterable, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+ASC = 1
+DESC = -1
+
+INDEXES: Dict[str, List[Tuple[list, dict]]] = {
+    "appointments": [
+        ([("id", ASC)], {"name": "id_unique", "unique": True}),
+        ([("date", ASC), ("status", ASC), ("start_minute", ASC)], {"name": "date_status_start"}),
+        ([("date", ASC), ("start_minute", ASC), ("id", ASC)], {"name": "date_start_id"}),
+        ([("customer_phone", ASC), ("date", DESC), ("start_minute", DESC), ("id", DESC)],
+         {"name": "customer_phone_date_start"}),
+    ],
+    "blocked_slots": [
+        ([("id", ASC)], {"name": "id_unique", "unique": True}),
+        ([("start_date", ASC), ("start_minute", ASC), ("id", ASC)], {"name": "start_date_start_id"}),
+        ([("end_date", ASC), ("start_date", ASC)], {"name": "end_date_start_date"}),
+    ],
+    "customers": [
+        ([("id", ASC)], {"name": "id_unique", "unique": True}),
+        # Duplicados de bancos antigos são fundidos antes (customer_stats.merge_duplicate_customers)
+        ([("phone", ASC)], {"name": "phone_unique", "unique": True}),
+        ([("last_visit", DESC), ("id", ASC)], {"name": "last_visit_id"}),
+    ],
+    "services": [
+        ([("id", ASC)], {"name": "id_unique", "unique": True}),
+    ],
+    "barbers": [
+        ([("id", ASC)], {"name": "id_unique", "unique": True}),
+    ],
+    "schedule_config": [
+        ([("id", ASC)], {"name": "id_unique", "unique": True}),
+    ],
+    "day_availability": [
+        ([("date", ASC), ("barber_id", ASC)], {"name": "date_barber_unique", "unique": True}),
+    ],
+    "slot_claims": [
+        ([("date", ASC), ("barber_id", ASC), ("cell", ASC)], {"name": "date_barber_cell_unique", "unique": True}),
+        ([("appointment_id", ASC)], {"name": "appointment_id"}),
+    ],
+    "migrations": [
+        ([("id", ASC)], {"name": "id_unique", "unique": True}),
+    ],
+    "daily_rollups": [
+        ([("date", ASC)], {"name": "date_unique", "unique": True}),
+    ],
+    "idempotency_keys": [
+        ([("key", ASC)], {"name": "key_unique", "unique": True}),
+        ([("expires_at", ASC)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+    ],
+    # Só usada com RATE_LIMIT_BACKEND=mongo; baldes somem quando estariam cheios de novo
+    "rate_limits": [
+        ([("key", ASC)], {"name": "key_unique", "unique": True}),
+        ([("expires_at", ASC)], {"name": "expires_at_ttl", "expireAfterSeconds": 0}),
+    ],
+    "notification_outbox": [
+        ([("id", ASC)], {"name": "id_unique", "unique": True}),
+        ([("status", ASC), ("next_attempt_at", ASC)], {"name": "status_next_attempt"}),
+        # Enviadas / desistidas guardam nome e telefone do cliente: somem após 30 dias
+        ([("finished_at", ASC)], {"name": "finished_at_ttl", "expireAfterSeconds": 30 * 24 * 3600}),
+    ],
+}
+
+# Índices substituídos por outros: removidos no startup (o antigo quebraria a regra nova)
+OBSOLETE_INDEXES: Dict[str, List[str]] = {
+    # Ordenavam pela string "time"/"start_time"; agora pelo inteiro start_minute
+    "appointments": ["date_status_time", "date_time_id", "customer_phone_date"],
+    "blocked_slots": ["date_start_time_id", "start_date_start_time_id"],
+    "day_availability": ["date_unique"],
+    "slot_claims": ["date_cell_unique"],
+}
+
+# (route, collection, filter, sort) — the same shapes the handlers query with
+ROUTE_QUERIES = [
+    ("GET /available-slots", "day_availability", {"date": "2025-01-02", "barber_id": {"$in": ["a", "b"]}}, None),
+    ("GET /available-slots (rebuild)", "appointments",
+     {"date": "2025-01-02", "status": {"$in": ["scheduled", "completed"]}}, None),
+    ("GET /available-slots/range", "appointments",
+     {"date": {"$gte": "2025-01-01", "$lte": "2025-01-31"}, "status": {"$in": ["scheduled", "completed"]}}, None),
+    ("GET /appointments", "appointments", {"date": "2025-01-02"}, [("date", ASC), ("start_minute", ASC), ("id", ASC)]),
+    ("GET /appointments (all)", "appointments", {}, [("date", ASC), ("start_minute", ASC), ("id", ASC)]),
+    ("PATCH /appointments/{id}", "appointments", {"id": "x"}, None),
+    ("GET /dashboard/stats", "daily_rollups", {"date": {"$gte": "2025-01-01", "$lte": "2025-01-31"}}, [("date", ASC)]),
+    ("GET /analytics/report", "daily_rollups", {"date": {"$gte": "2025-01-01", "$lte": "2025-12-31"}}, None),
+    ("GET /available-slots (blocks)", "blocked_slots",
+     {"start_date": {"$lte": "2025-01-02"}, "end_date": {"$gte": "2025-01-02"},
+      "$or": [{"weekdays": None}, {"weekdays": 3}]}, None),
+    ("GET /available-slots/range (blocks)", "blocked_slots",
+     {"start_date": {"$lte": "2025-01-31"}, "end_date": {"$gte": "2025-01-01"}}, None),
+    ("POST /appointments (claims)", "slot_claims",
+     {"date": "2025-01-02", "barber_id": "a", "cell": {"$in": [600, 605]}}, None),
+    ("DELETE /appointments/{id} (claims)", "slot_claims", {"appointment_id": "x"}, None),
+    ("DELETE /blocked-slots/{id}", "blocked_slots", {"id": "x"}, None),
+    ("GET /customers/{phone}", "customers", {"phone": "555"}, None),
+    ("GET /customers/{phone}/appointments", "appointments",
+     {"customer_phone": "555", "date": {"$gte": "2025-01-01"}}, [("date", DESC), ("start_minute", DESC), ("id", DESC)]),
+    ("PUT /customers/{id}", "customers", {"id": "x"}, None),
+    ("GET /customers", "customers", {}, [("last_visit", DESC), ("id", ASC)]),
+    ("GET /blocked-slots", "blocked_slots", {}, [("start_date", ASC), ("start_minute", ASC), ("id", ASC)]),
+    ("GET /services/{id}", "services", {"id": "x"}, None),
+    ("POST /appointments (idempotency)", "idempotency_keys", {"key": "k"}, None),
+    ("POST /appointments (rate limit)", "rate_limits", {"key": "booking:127.0.0.1"}, None),
+]
+
+
+async def ensure_indexes(db, indexes: Dict[str, List[Tuple[list, dict]]] = INDEXES,
+                         obsolete: Dict[str, List[str]] = OBSOLETE_INDEXES) -> None:
+    """Drop replaced indexes, then create every declared one (existing ones are a no-op).
+
+    A performance index that can't be built is logged and skipped. A unique
+    index is what enforces an invariant (one claim per slot cell, one
+    document per id), so failing to build one raises RuntimeError and stops
+    the startup.
+    """
+    from pymongo import IndexModel
+    from pymongo.errors import OperationFailure
+
+    for collection, names in obsolete.items():
+        existing = await db[collection].index_information()
+        for name in names:
+            if name in existing:
+                await db[collection].drop_index(name)
+                logger.info(f"Dropped obsolete index {name} on {collection}")
+
+    missing_unique = []
+    for collection, specs in indexes.items():
+        for keys, options in specs:
+            try:
+                await db[collection].create_indexes([IndexModel(keys, **options)])
+            except OperationFailure as e:
+                logger.error(f"Could not create index {options.get('name')} on {collection}: {e}")
+                if options.get("unique"):
+                    missing_unique.append(f"{collection}.{options.get('name')}")
+    if missing_unique:
+        # Ex.: duplicatas antigas; sem o índice único não há proteção contra agendamento duplo
+        raise RuntimeError(f"Unique indexes could not be created (fix the duplicates first): {missing_unique}")
+
+
+def plan_stages(plan) -> Iterable[str]:
+    """Yield every stage name in an explain() plan tree."""
+    if isinstance(plan, dict):
+        stage = plan.get("stage")
+        if stage:
+            yield stage
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_stages(item)
+
+
+def uses_collscan(explain_output: dict) -> bool:
+    winning_plan = explain_output.get("queryPlanner", {}).get("winningPlan", {})
+    return "COLLSCAN" in plan_stages(winning_plan)
+
+
+async def check_query_plans(db, queries=ROUTE_QUERIES) -> List[str]:
+    """Return the routes whose query plan is a collection scan."""
+    offenders = []
+    for route, collection, query, sort in queries:
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        if uses_collscan(await cursor.explain()):
+            offenders.append(route)
+    return offenders
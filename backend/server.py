@@ -1,19 +1,47 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Header, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
+import asyncio
 from twilio.rest import Client
-from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional
+from pydantic import BaseModel, Field, ConfigDict, ValidationError
+from typing import Annotated, Dict, List, Optional, Union
 import uuid
 from datetime import datetime, timezone, timedelta
 import hashlib
 
+from analytics import (
+    MIGRATION_ID as ROLLUPS_MIGRATION_ID, PERIODS as REPORT_PERIODS, PRICES_MIGRATION_ID,
+    apply_changes as apply_rollup_changes, backfill as backfill_rollups, stamp_prices, summarize,
+)
+from availability import ACTIVE_STATUSES, DayOccupancy, appointment_span, parse_appointment_time
+from bulk_import import FORMATS as IMPORT_FORMATS, DayIndex, existing_ids, read_rows, write_chunk
+from blocked_periods import compact_legacy_blocks, day_query, for_barber, overlap_query, parse_date, windows_by_date
+from customer_stats import (
+    apply_appointment_change, merge_duplicate_customers, recompute_all_customers, register_booking,
+)
+from day_availability import DayAvailabilityStore
+from events import EventBroker
+from fast_json import FAST_JSON, RowSerializer
+from http_cache import CacheRule, HTTPCache, MongoVersions
+from idempotency import IdempotencyConflict, IdempotencyStore, fingerprint as request_fingerprint
+from metrics import Metrics
+from notifications import NotificationDispatcher
+from pagination import ASC, DESC, csv_lines, decode_cursor, keyset_filter, ndjson_lines, paginate
+from rate_limit import Limit, MongoBuckets, RateLimiter, normalize_phone
+from resources import SendGridSender, mongo_options, twilio_http_client, warm_up
+from reservations import SlotUnavailable, backfill_claims, release, reserve
+from schedule import ScheduleRules
+from schema import check_query_plans, ensure_indexes
+from services_cache import ServicesCache
+from time_fields import appointment_fields, block_fields, migrate as migrate_time_fields
+
 # 1. Configurar Logging logo no início para evitar erros de referência
 logging.basicConfig(
     level=logging.INFO,
@@ -26,9 +54,38 @@ load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+# Latência por rota, tempo de banco por requisição e chamadas externas (/metrics)
+metrics = Metrics()
+# Pool e timeouts via MONGO_* (ver resources.py); conecta só no warm-up do lifespan
+mongo_pool = mongo_options()
+client = AsyncIOMotorClient(
+    mongo_url, event_listeners=[metrics.command_listener, metrics.pool_listener], **mongo_pool
+)
 db = client[os.environ['DB_NAME']]
 
+# Conexões HTTP mantidas abertas por provedor (uma por worker de notificação)
+PROVIDER_POOL_SIZE = int(os.environ.get('PROVIDER_POOL_SIZE', '4'))
+PROVIDER_TIMEOUT = float(os.environ.get('PROVIDER_TIMEOUT_SECONDS', '10'))
+# Tempo máximo para esvaziar a fila de notificações no desligamento
+SHUTDOWN_DRAIN_SECONDS = float(os.environ.get('SHUTDOWN_DRAIN_SECONDS', '10'))
+
+# Limites por IP (disponibilidade, reservas) e por telefone (reservas); RATE_LIMITS=off desliga
+rate_limiter = RateLimiter(
+    limits={
+        "slots": Limit.parse(os.environ.get('RATE_LIMIT_SLOTS', '120/60')),
+        "booking": Limit.parse(os.environ.get('RATE_LIMIT_BOOKING', '20/600')),
+        "booking_phone": Limit.parse(os.environ.get('RATE_LIMIT_BOOKING_PHONE', '10/3600')),
+    },
+    routes={
+        ("GET", "/api/available-slots"): "slots",
+        ("GET", "/api/available-slots/range"): "slots",
+        ("POST", "/api/appointments"): "booking",
+    },
+    shared=MongoBuckets(db.rate_limits) if os.environ.get('RATE_LIMIT_BACKEND') == 'mongo' else None,
+    proxy_hops=int(os.environ.get('RATE_LIMIT_PROXY_HOPS', '1')),
+    enabled=os.environ.get('RATE_LIMITS', 'on') != 'off',
+)
+
 # --- Configuração do Twilio (WhatsApp) ---
 TWILIO_ACCOUNT_SID = os.getenv('TWILIO_ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('TWILIO_AUTH_TOKEN')
@@ -36,7 +93,10 @@ TWILIO_FROM_NUMBER = os.getenv('TWILIO_FROM_NUMBER') # whatsapp:+1...
 TWILIO_TO_NUMBER = os.getenv('TWILIO_TO_NUMBER')  # whatsapp:+1... (Seu número)
 
 try:
-    twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    twilio_client = Client(
+        TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN,
+        http_client=twilio_http_client(PROVIDER_POOL_SIZE, PROVIDER_TIMEOUT),
+    )
 except Exception as e:
     print(f"Erro Twilio: {e}")
     twilio_client = None   # Garante que não haverá erro se as credenciais estiverem faltando
@@ -48,14 +108,51 @@ FROM_EMAIL = "jhunblackbarber@gmail.com"
 ADMIN_EMAIL = "jhunblackbarber@gmail.com"
 
 try:
-    sg_client = SendGridAPIClient(SENDGRID_API_KEY)
+    sg_client = SendGridSender(SENDGRID_API_KEY, PROVIDER_POOL_SIZE, PROVIDER_TIMEOUT) if SENDGRID_API_KEY else None
 except Exception as e:
     print(f"Erro SendGrid: {e}")
     sg_client = None
 
+# --- Fila de notificações ---
+# As chamadas aos SDKs são bloqueantes: rodam em threads, fora da requisição
+
+def send_email(payload: dict):
+    with metrics.outbound("sendgrid"):
+        sg_client.send(Mail(
+            from_email=FROM_EMAIL,
+            to_emails=payload["to_emails"],
+            subject=payload["subject"],
+            html_content=payload["html_content"]
+        ))
+
+def send_whatsapp(payload: dict):
+    with metrics.outbound("twilio"):
+        twilio_client.messages.create(
+            from_=TWILIO_FROM_NUMBER,
+            to=TWILIO_TO_NUMBER,
+            body=payload["body"]
+        )
+
+notifications = NotificationDispatcher(db.notification_outbox)
+if sg_client:
+    notifications.register("email", send_email)
+if twilio_client and TWILIO_TO_NUMBER and TWILIO_FROM_NUMBER:
+    notifications.register("whatsapp", send_whatsapp)
+
+# Janela máxima do calendário de disponibilidade (/available-slots/range)
+MAX_RANGE_DAYS = 62
+
 # -------------------- FastAPI app --------------------
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await initialize_services()
+    try:
+        yield
+    finally:
+        await shutdown_resources()
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # -------------------- Rota de monitoramento --------------------
 # Apenas para o UptimeRobot manter o backend acordado
@@ -67,6 +164,11 @@ def ping():
     # O status 200 (OK) será enviado.
     return {"status": "ok"}
 
+# Métricas no formato do Prometheus, para o scraper (fora do /api)
+@app.get("/metrics")
+def get_metrics():
+    return metrics.response()
+
 # -------------------- Criação do router --------------------
 api_router = APIRouter(prefix="/api")
 
@@ -81,6 +183,13 @@ class Service(BaseModel):
     duration_minutes: int
     description: Optional[str] = None
 
+class Barber(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    active: bool = True  # inativo: some da agenda, histórico preservado
+    created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+
 class Customer(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -88,6 +197,8 @@ class Customer(BaseModel):
     phone: str
     email: Optional[str] = None
     total_appointments: int = 0
+    no_show_count: int = 0
+    lifetime_spend: float = 0
     last_visit: Optional[str] = None
 
 class Appointment(BaseModel):
@@ -101,18 +212,41 @@ class Appointment(BaseModel):
     date: str  # YYYY-MM-DD
     time: str  # HH:MM
     duration_minutes: int
+    barber_id: Optional[str] = None
     status: str = "scheduled"  # scheduled, completed, no-show, cancelled
+    # Campos canônicos (time_fields.py): minutos desde a meia-noite
+    start_minute: Optional[int] = None
+    end_minute: Optional[int] = None
+    # Preço do serviço no momento da reserva (faturamento não muda se o catálogo mudar)
+    price: Optional[float] = None
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
     language: str = "en"  # en or pt
 
 class BlockedSlot(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    date: str  # YYYY-MM-DD
+    start_date: str  # YYYY-MM-DD
+    end_date: str  # YYYY-MM-DD (inclusive)
     start_time: str  # HH:MM
     end_time: str  # HH:MM
+    weekdays: Optional[List[int]] = None  # 0 = segunda .. 6 = domingo; None = todos os dias
+    barber_id: Optional[str] = None  # None = a barbearia toda
     reason: Optional[str] = None
     created_at: str = Field(default_factory=lambda: datetime.now(timezone.utc).isoformat())
+    start_minute: Optional[int] = None
+    end_minute: Optional[int] = None
+
+class AppointmentPage(BaseModel):
+    items: List[Appointment]
+    next_cursor: Optional[str] = None
+
+class CustomerPage(BaseModel):
+    items: List[Customer]
+    next_cursor: Optional[str] = None
+
+class BlockedSlotPage(BaseModel):
+    items: List[BlockedSlot]
+    next_cursor: Optional[str] = None
 
 class LoginRequest(BaseModel):
     password: str
@@ -128,6 +262,17 @@ class MultiBlockedSlotCreate(BaseModel):
     reason: Optional[str] = None
 
 
+services_cache = ServicesCache(db.services, Service)
+# Barbeiros: poucos registros, mesmo cache em memória do catálogo de serviços
+barbers_cache = ServicesCache(db.barbers, Barber)
+schedule = ScheduleRules(db.schedule_config)
+events = EventBroker()
+day_availability = DayAvailabilityStore(db.day_availability, db.appointments, db.blocked_slots)
+idempotency = IdempotencyStore(
+    db.idempotency_keys, ttl=timedelta(hours=float(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24')))
+)
+
+
 # ==================== INPUT MODELS ====================
 
 class AppointmentCreate(BaseModel):
@@ -137,6 +282,7 @@ class AppointmentCreate(BaseModel):
     customer_email: Optional[str] = None
     date: str
     time: str
+    barber_id: Optional[str] = None  # None = qualquer barbeiro livre
     language: str = "en"
 
 class AppointmentUpdate(BaseModel):
@@ -147,8 +293,46 @@ class BlockedSlotRangeCreate(BaseModel):
     end_date: str = Field(..., description="Data de fim do bloqueio (formato YYYY-MM-DD)")
     start_time: str = Field(..., pattern=r'^\d{2}:\d{2}$', description="Hora de início do bloqueio (formato HH:MM)")
     end_time: str = Field(..., pattern=r'^\d{2}:\d{2}$', description="Hora de fim do bloqueio (formato HH:MM)")
+    weekdays: Optional[List[Annotated[int, Field(ge=0, le=6)]]] = Field(
+        None, description="Só nestes dias da semana (0 = segunda .. 6 = domingo); vazio = todos"
+    )
+    barber_id: Optional[str] = Field(None, description="Só este barbeiro; vazio = a barbearia toda")
     reason: Optional[str] = None
 
+class BarberCreate(BaseModel):
+    name: str
+    active: bool = True
+
+class BarberUpdate(BaseModel):
+    name: Optional[str] = None
+    active: Optional[bool] = None
+
+class DayHours(BaseModel):
+    open: str = Field(..., pattern=r'^\d{2}:\d{2}$')
+    close: str = Field(..., pattern=r'^\d{2}:\d{2}$')
+
+class ScheduleBreak(BaseModel):
+    start: str = Field(..., pattern=r'^\d{2}:\d{2}$')
+    end: str = Field(..., pattern=r'^\d{2}:\d{2}$')
+    weekdays: Optional[List[Annotated[int, Field(ge=0, le=6)]]] = None  # None = todos os dias
+
+class Holiday(BaseModel):
+    date: str = Field(..., pattern=r'^(\d{4}-)?\d{2}-\d{2}$', description="YYYY-MM-DD, ou MM-DD para todo ano")
+    name: Optional[str] = None
+
+class ScheduleConfig(BaseModel):
+    slot_interval: int = Field(30, ge=5, le=240)
+    # "0" (segunda) .. "6" (domingo); null ou ausente = fechado
+    hours: Dict[Annotated[str, Field(pattern=r'^[0-6]$')], Optional[DayHours]]
+    breaks: List[ScheduleBreak] = []
+    holidays: List[Holiday] = []
+
+class BlockedSlotBulkDelete(BaseModel):
+    ids: Optional[List[str]] = None
+    # Ou: remove os bloqueios inteiramente dentro deste intervalo
+    start_date: Optional[str] = None
+    end_date: Optional[str] = None
+
 # ==================== HELPER FUNCTIONS ====================
 
 def send_notification_mock(notification_type: str, recipient: str, data: dict, language: str = "en"):
@@ -169,6 +353,44 @@ def send_notification_mock(notification_type: str, recipient: str, data: dict, l
     
     return True
 
+# Ordenação estável de cada listagem (a última chave desempata)
+# Horário pelo inteiro: a string "01:00 PM" viria antes de "09:00 AM"
+APPOINTMENT_SORT = [("date", ASC), ("start_minute", ASC), ("id", ASC)]
+CUSTOMER_SORT = [("last_visit", DESC), ("id", ASC)]
+BLOCKED_SLOT_SORT = [("start_date", ASC), ("start_minute", ASC), ("id", ASC)]
+CUSTOMER_HISTORY_SORT = [("date", DESC), ("start_minute", DESC), ("id", DESC)]
+MAX_PAGE_SIZE = 500
+
+ROW_SERIALIZERS = {model: RowSerializer(model) for model in (Appointment, Customer, BlockedSlot)}
+appointment_rows = ROW_SERIALIZERS[Appointment]
+
+async def list_documents(collection, model, query: dict, sort, limit: Optional[int],
+                         after: Optional[str], format: Optional[str]):
+    """Legacy array, keyset page ({items, next_cursor}) or NDJSON / CSV stream."""
+    serializer = ROW_SERIALIZERS[model]
+    try:
+        if format in ("ndjson", "csv"):
+            if after:
+                query = {"$and": [query, keyset_filter(sort, decode_cursor(after, len(sort)))]}
+            cursor = collection.find(query, serializer.projection).sort(sort)
+            if format == "csv":
+                # Exportação para planilha, linha a linha
+                filename = f"{collection.name}.csv"
+                return StreamingResponse(csv_lines(cursor, serializer.fields), media_type="text/csv",
+                                         headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+            return StreamingResponse(ndjson_lines(cursor), media_type="application/x-ndjson")
+        if limit is None and not after:
+            items = await collection.find(query, serializer.projection).sort(sort).to_list(1000)
+            return serializer.response(serializer.rows(items)) if FAST_JSON else items
+        items, next_cursor = await paginate(
+            collection, query, sort, limit or MAX_PAGE_SIZE, after, serializer.projection
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if FAST_JSON:
+        return serializer.response({"items": serializer.rows(items), "next_cursor": next_cursor})
+    return {"items": items, "next_cursor": next_cursor}
+
 # ==================== ROUTES ====================
 
 @api_router.get("/")
@@ -179,91 +401,87 @@ async def root():
 
 @api_router.get("/services", response_model=List[Service])
 async def get_services():
-    services = await db.services.find({}, {"_id": 0}).to_list(1000)
-    return services
+    return await services_cache.all()
+
+@api_router.get("/services/cache-stats")
+async def get_services_cache_stats():
+    return services_cache.stats()
+
+# ========== BARBERS ==========
+
+async def bookable_barbers(barber_id: Optional[str] = None) -> List[str]:
+    """Ids of the chairs a request may use: one barber, or every active one."""
+    if barber_id:
+        barber = await barbers_cache.get(barber_id)
+        if not barber or not barber.active:
+            raise HTTPException(status_code=404, detail="Barber not found")
+        return [barber_id]
+    return [barber.id for barber in await barbers_cache.all() if barber.active]
+
+@api_router.get("/barbers", response_model=List[Barber])
+async def get_barbers():
+    return await barbers_cache.all()
+
+@api_router.post("/barbers", response_model=Barber, status_code=201)
+async def create_barber(data: BarberCreate):
+    barber = Barber(**data.model_dump())
+    await db.barbers.insert_one(barber.model_dump())
+    barbers_cache.invalidate()
+    return barber
+
+@api_router.patch("/barbers/{barber_id}", response_model=Barber)
+async def update_barber(barber_id: str, data: BarberUpdate):
+    changes = data.model_dump(exclude_none=True)
+    barber = await db.barbers.find_one_and_update(
+        {"id": barber_id}, {"$set": changes}, projection={"_id": 0}, return_document=True
+    )
+    if not barber:
+        raise HTTPException(status_code=404, detail="Barber not found")
+    barbers_cache.invalidate()
+    return Barber(**barber)
 
 # ========== APPOINTMENTS ==========
 
-@api_router.post("/appointments", response_model=Appointment)
-async def create_appointment(appointment_data: AppointmentCreate):
-    # Get service details
-    service = await db.services.find_one({"id": appointment_data.service_id}, {"_id": 0})
-    if not service:
-        raise HTTPException(status_code=404, detail="Service not found")
-    
-    # Check if slot is available
-    date = appointment_data.date
-    time = appointment_data.time
-    duration = service['duration_minutes']
-    
-    # Check for existing appointments
-    existing = await db.appointments.find_one({
-        "date": date,
-        "time": time,
-        "status": {"$in": ["scheduled", "completed"]}
-    }, {"_id": 0})
-    
-    if existing:
+async def claim_appointment_slot(apt: dict):
+    start, end = appointment_span(apt)
+    if start is None or end is None:
+        raise HTTPException(status_code=400, detail="Invalid time format")
+    try:
+        await reserve(db.slot_claims, apt['date'], start, end - start, apt['id'], apt.get('barber_id'))
+    except SlotUnavailable:
         raise HTTPException(status_code=400, detail="Time slot already booked")
-    
-    # Check for blocked slots
-    blocked = await db.blocked_slots.find_one({
-        "date": date,
-        "start_time": {"$lte": time},
-        "end_time": {"$gt": time}
-    }, {"_id": 0})
-    
-    if blocked:
-        raise HTTPException(status_code=400, detail="Time slot is blocked")
-    
-    # Create appointment
-    appointment = Appointment(
-        service_id=appointment_data.service_id,
-        service_name=service['name'],
-        customer_name=appointment_data.customer_name,
-        customer_phone=appointment_data.customer_phone,
-        customer_email=appointment_data.customer_email,
-        date=date,
-        time=time,
-        duration_minutes=duration,
-        language=appointment_data.language
-    )
-    
-    doc = appointment.model_dump()
-    await db.appointments.insert_one(doc)
-    
-    # Update or create customer
-    customer = await db.customers.find_one({"phone": appointment_data.customer_phone}, {"_id": 0})
-    if customer:
-        await db.customers.update_one(
-            {"phone": appointment_data.customer_phone},
-            {
-                "$set": {"last_visit": date, "full_name": appointment_data.customer_name},
-                "$inc": {"total_appointments": 1}
-            }
-        )
-    else:
-        new_customer = Customer(
-            full_name=appointment_data.customer_name,
-            phone=appointment_data.customer_phone,
-            email=appointment_data.customer_email,
-            total_appointments=1,
-            last_visit=date
-        )
-        await db.customers.insert_one(new_customer.model_dump())
-    
+
+async def service_prices() -> Dict[str, float]:
+    services = await services_cache.as_dict()
+    return {service_id: service.price for service_id, service in services.items()}
+
+async def sync_customer_stats(before: Optional[dict], after: Optional[dict]):
+    # Mantém total/faltas/gasto/última visita do cliente em dia com o agendamento
+    prices = await service_prices()
+    for customer in await apply_appointment_change(db.customers, db.appointments, before, after, prices):
+        events.publish("customers", "update", customer)
+
+async def sync_rollups(changes: List[tuple]):
+    # Rollups diários (faturamento, ocupação) andam junto com cada escrita
+    await apply_rollup_changes(db.daily_rollups, changes, await service_prices())
+
+async def notify_booking(apt: dict):
+    """Confirmação da reserva: e-mail (admin + cliente) e WhatsApp do admin, pela fila."""
+    date = apt['date']
+    time = apt['time']
+
     # Dados para Notificações
     notification_data = {
-        "service": service['name'],
+        "service": apt['service_name'],
         "date": date,
         "time": time,
-        "customer_name": appointment_data.customer_name
+        "customer_name": apt['customer_name']
     }
 
     # --- INICIO DO BLOCO DE NOTIFICACOES REAIS ---
     
     # 1. Notificacao SMS Mock
-    send_notification_mock("sms", appointment_data.customer_phone, notification_data, appointment_data.language)
+    send_notification_mock("sms", apt['customer_phone'], notification_data, apt.get('language', 'en'))
 
     # --- DICIONÁRIO DE TRADUÇÕES PARA O E-MAIL ---
     email_content = {
@@ -303,70 +521,346 @@ async def create_appointment(appointment_data: AppointmentCreate):
     }
 
     # Seleciona o idioma (padrão inglês se não encontrar)
-    lang = appointment_data.language if appointment_data.language in email_content else "en"
+    lang = apt.get('language', 'en') if apt.get('language', 'en') in email_content else "en"
     texts = email_content[lang]
 
-    # --- ENVIO DO E-MAIL ---
-    if sg_client:
-        try:
-            # Envia sempre para o admin (marido)
-            destinatarios = [ADMIN_EMAIL]
-            # Adiciona o cliente se ele preencheu o e-mail
-            if appointment_data.customer_email and appointment_data.customer_email.strip():
-                destinatarios.append(appointment_data.customer_email)
-
-            email_msg = Mail(
-                from_email=FROM_EMAIL,
-                to_emails=destinatarios,
-                subject=f"{texts['subject']}: {service['name']} - {appointment_data.customer_name}",
-                html_content=f"""
+    # --- ENVIO DO E-MAIL (fila de notificações, fora da requisição) ---
+    if "email" in notifications.providers:
+        # Envia sempre para o admin (marido)
+        destinatarios = [ADMIN_EMAIL]
+        # Adiciona o cliente se ele preencheu o e-mail
+        customer_email = apt.get('customer_email')
+        if customer_email and customer_email.strip():
+            destinatarios.append(customer_email)
+
+        await notifications.enqueue("email", {
+            "to_emails": destinatarios,
+            "subject": f"{texts['subject']}: {apt['service_name']} - {apt['customer_name']}",
+            "html_content": f"""
                 <div style="font-family: sans-serif; padding: 20px; border: 1px solid #ddd; border-radius: 8px;">
                     <h2 style="color: #333;">{texts['title']}</h2>
                     <p>{texts['subtitle']} <strong>Jhun Black Barber</strong>.</p>
                     <hr style="border: 0; border-top: 1px solid #eee;">
-                    <p><strong>{texts['client']}:</strong> {appointment_data.customer_name}</p>
-                    <p><strong>{texts['service']}:</strong> {service['name']}</p>
+                    <p><strong>{texts['client']}:</strong> {apt['customer_name']}</p>
+                    <p><strong>{texts['service']}:</strong> {apt['service_name']}</p>
                     <p><strong>{texts['date']}:</strong> {date}</p>
                     <p><strong>{texts['time']}:</strong> {time}</p>
-                    <p><strong>{texts['phone']}:</strong> {appointment_data.customer_phone}</p>
+                    <p><strong>{texts['phone']}:</strong> {apt['customer_phone']}</p>
                     <br>
                     <p style="font-size: 12px; color: #666;">{texts['footer']}</p>
                 </div>
                 """
-            )
-            sg_client.send(email_msg)
-            print(f"E-mail enviado para: {destinatarios}")
-        except Exception as e:
-            print(f"Erro ao enviar e-mail: {e}")
+        })
 
     # 3. Notificacao WhatsApp Admin
-    if twilio_client and TWILIO_TO_NUMBER and TWILIO_FROM_NUMBER:
-        try:
-            whatsapp_body = f"🚨 NOVO AGENDAMENTO! 🚨\n\nServiço: {service['name']}\nCliente: {appointment_data.customer_name}\nData: {date} às {time}\nTelefone: {appointment_data.customer_phone}"
-            twilio_client.messages.create(
-                from_=TWILIO_FROM_NUMBER,
-                to=TWILIO_TO_NUMBER,
-                body=whatsapp_body
-            )
-            print("WhatsApp enviado para o admin!")
-        except Exception as e:
-            print(f"Erro ao enviar WhatsApp: {e}")
+    if "whatsapp" in notifications.providers:
+        await notifications.enqueue("whatsapp", {
+            "body": f"🚨 NOVO AGENDAMENTO! 🚨\n\nServiço: {apt['service_name']}\nCliente: {apt['customer_name']}\nData: {date} às {time}\nTelefone: {apt['customer_phone']}"
+        })
+
+async def check_phone_limit(appointment_data: AppointmentCreate):
+    # Limite por telefone antes de qualquer consulta (o por IP fica no middleware)
+    wait = await rate_limiter.hit("booking_phone", normalize_phone(appointment_data.customer_phone))
+    if wait:
+        raise HTTPException(status_code=429, detail="Too many booking attempts for this phone number",
+                            headers={"Retry-After": rate_limiter.retry_after(wait)})
 
+@api_router.post("/appointments", response_model=Appointment)
+async def create_appointment(
+    appointment_data: AppointmentCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    if idempotency_key is None:
+        await check_phone_limit(appointment_data)
+        appointment, doc = await book_appointment(appointment_data)
+        await after_booking(doc)
+        return appointment
+
+    # Repetição com a mesma chave: devolve a resposta gravada, sem reservar, notificar
+    # nem gastar o limite do telefone de novo
+    try:
+        stored = await idempotency.begin(idempotency_key, request_fingerprint(appointment_data.model_dump()))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if stored:
+        return JSONResponse(stored["body"], status_code=stored["status_code"], headers={"Idempotent-Replayed": "true"})
+    try:
+        await check_phone_limit(appointment_data)
+        appointment, doc = await book_appointment(appointment_data)
+    except Exception:
+        # Nada foi gravado: a repetição deve tentar de novo
+        await idempotency.release(idempotency_key)
+        raise
+    # Agendamento gravado: daqui em diante uma repetição recebe esta resposta,
+    # mesmo que um dos efeitos abaixo falhe
+    await idempotency.finish(idempotency_key, 200, appointment.model_dump(mode="json"))
+    await after_booking(doc)
     return appointment
 
-@api_router.get("/appointments", response_model=List[Appointment])
-async def get_appointments(date: Optional[str] = None, status: Optional[str] = None):
+async def book_appointment(appointment_data: AppointmentCreate) -> tuple:
+    """Validate, claim the slot and insert; returns (Appointment, stored doc). Side effects are in ``after_booking``."""
+    # Get service details
+    service = await services_cache.get(appointment_data.service_id)
+    if not service:
+        raise HTTPException(status_code=404, detail="Service not found")
+    
+    # Check if slot is available
+    date = appointment_data.date
+    time = appointment_data.time
+    duration = service.duration_minutes
+    
+    start = parse_appointment_time(time)
+    if start is None:
+        raise HTTPException(status_code=400, detail="Invalid time format")
+    
+    # Horário de funcionamento e bloqueios (qualquer sobreposição com o serviço)
+    barber_ids = await bookable_barbers(appointment_data.barber_id)
+    try:
+        template = await schedule.template(parse_date(date))
+        blocks_today = day_query(date, barber_ids)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+    if not template.allows(start, duration):
+        raise HTTPException(status_code=400, detail="Outside business hours")
+    blocked_slots = await db.blocked_slots.find(
+        blocks_today, {"_id": 0, "start_minute": 1, "end_minute": 1, "start_time": 1, "end_time": 1, "barber_id": 1}
+    ).to_list(1000)
+    
+    barber_ids = [
+        barber_id for barber_id in barber_ids
+        if DayOccupancy.from_documents((), for_barber(blocked_slots, barber_id)).is_free(start, duration)
+    ]
+    if not barber_ids:
+        raise HTTPException(status_code=400, detail="Time slot is blocked")
+    
+    # "Qualquer barbeiro": tenta primeiro os livres com a agenda mais vazia no dia
+    occupancies = await day_availability.get_many(date, barber_ids)
+    candidates = sorted(
+        (barber_id for barber_id in barber_ids if occupancies[barber_id].is_free(start, duration)),
+        key=lambda barber_id: occupancies[barber_id].mask.bit_count()
+    )
+    if not candidates:
+        raise HTTPException(status_code=400, detail="Time slot already booked")
+    
+    # Create appointment
+    appointment = Appointment(
+        service_id=appointment_data.service_id,
+        service_name=service.name,
+        customer_name=appointment_data.customer_name,
+        customer_phone=appointment_data.customer_phone,
+        customer_email=appointment_data.customer_email,
+        date=date,
+        time=time,
+        duration_minutes=duration,
+        start_minute=start,
+        end_minute=start + duration,
+        price=service.price,
+        language=appointment_data.language
+    )
+    
+    doc = appointment.model_dump()
+    
+    # Reserva atômica das células do horário: só uma requisição concorrente vence
+    for barber_id in candidates:
+        doc['barber_id'] = barber_id
+        try:
+            await reserve(db.slot_claims, date, start, duration, doc['id'], barber_id)
+            break
+        except SlotUnavailable:
+            continue
+    else:
+        raise HTTPException(status_code=400, detail="Time slot already booked")
+    appointment.barber_id = doc['barber_id']
+    
+    try:
+        await db.appointments.insert_one(doc)
+    except Exception:
+        await release(db.slot_claims, appointment.id)
+        raise
+    doc.pop('_id', None)
+    return appointment, doc
+
+async def after_booking(doc: dict):
+    """Efeitos de um agendamento já gravado: disponibilidade, cliente, rollups e notificações."""
+    await day_availability.refresh(doc['date'], doc['barber_id'])
+    events.publish("appointments", "insert", doc)
+    
+    # Update or create customer (upsert atômico)
+    customer = await register_booking(
+        db.customers,
+        doc['customer_phone'],
+        doc['customer_name'],
+        doc.get('customer_email'),
+        doc['date']
+    )
+    events.publish("customers", "update", customer)
+    await sync_rollups([(None, doc)])
+    
+    await notify_booking(doc)
+
+@api_router.get("/appointments", response_model=Union[List[Appointment], AppointmentPage])
+async def get_appointments(
+    date: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    status: Optional[str] = None,
+    barber_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    format: Optional[str] = None,
+):
     query = {}
     if date:
         query["date"] = date
+    elif start or end:
+        query["date"] = {}
+        if start:
+            query["date"]["$gte"] = start
+        if end:
+            query["date"]["$lte"] = end
     if status:
         query["status"] = status
+    if barber_id:
+        query["barber_id"] = barber_id
     
-    appointments = await db.appointments.find(query, {"_id": 0}).sort("date", 1).to_list(1000)
-    return appointments
+    return await list_documents(db.appointments, Appointment, query, APPOINTMENT_SORT, limit, after, format)
+
+IMPORT_STATUSES = ("scheduled", "completed", "no-show", "cancelled")
+MAX_IMPORT_ERRORS = 200
+
+def validation_message(error: ValidationError) -> str:
+    """Pydantic errors as ``field: message`` pairs, the text FastAPI puts in a 422 ``detail``."""
+    return "; ".join(
+        f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" if err["loc"] else err["msg"]
+        for err in error.errors(include_url=False)
+    )
+
+def build_imported_appointment(row: dict, services: Dict[str, Service], barbers: Dict[str, Barber]) -> dict:
+    """Validate one import row into an appointment document (ValueError on a bad row)."""
+    row = {key: value for key, value in row.items() if value is not None}
+    service = services.get(row.get("service_id"))
+    if not service:
+        name = str(row.get("service_name", "")).strip().lower()
+        service = next((s for s in services.values() if s.name.lower() == name), None)
+    if not service:
+        raise ValueError("Unknown service")
+    if row.get("barber_id") and row["barber_id"] not in barbers:
+        raise ValueError("Unknown barber")
+
+    appointment = Appointment(**{
+        **row,
+        "service_id": service.id,
+        "service_name": service.name,
+        "duration_minutes": row.get("duration_minutes") or service.duration_minutes,
+        "price": row["price"] if row.get("price") is not None else service.price,
+    })
+    if appointment.status not in IMPORT_STATUSES:
+        raise ValueError(f"Invalid status: {appointment.status}")
+    parse_date(appointment.date)
+    Customer(phone=appointment.customer_phone, full_name=appointment.customer_name, email=appointment.customer_email)
+
+    doc = appointment.model_dump()
+    doc.update(appointment_fields(doc))
+    if doc["start_minute"] is None:
+        raise ValueError("Invalid time format")
+    return doc
+
+@api_router.post("/appointments/import")
+async def import_appointments(
+    request: Request,
+    format: Optional[str] = None,
+    notify: bool = False,
+    chunk_size: int = Query(500, ge=1, le=5000),
+):
+    """Bulk import from a CSV (with header) or NDJSON upload, streamed and written in chunks."""
+    format = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    if format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(IMPORT_FORMATS)}")
+
+    services = await services_cache.as_dict()
+    prices = await service_prices()
+    barbers = {barber.id: barber for barber in await barbers_cache.all()}
+    active = [barber_id for barber_id, barber in barbers.items() if barber.active]
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    index = DayIndex(db.appointments, db.blocked_slots)
+    report = {"imported": 0, "rejected": 0, "errors": []}
+    dates, seen_ids = set(), set()
+
+    def reject(number: int, error: str):
+        report["rejected"] += 1
+        if len(report["errors"]) < MAX_IMPORT_ERRORS:
+            report["errors"].append({"row": number, "error": error})
+
+    async def flush(chunk: List[tuple]):
+        # Conflitos checados em memória: agenda existente, bloqueios e as linhas anteriores
+        await index.load([doc["date"] for _, doc in chunk], list(barbers))
+        known = await existing_ids(db.appointments, [doc["id"] for _, doc in chunk])
+        accepted, numbers = [], {}
+        for number, doc in chunk:
+            if doc["id"] in known:
+                reject(number, "Duplicate appointment id")
+                continue
+            chairs = [doc["barber_id"]] if doc.get("barber_id") else active
+            if doc["status"] in ACTIVE_STATUSES:
+                doc["barber_id"] = index.claim(doc["date"], chairs, doc["start_minute"], doc["end_minute"])
+                if not doc["barber_id"]:
+                    reject(number, "Time slot already booked")
+                    continue
+            elif not doc.get("barber_id"):
+                doc["barber_id"] = chairs[0] if chairs else None
+            accepted.append(doc)
+            numbers[doc["id"]] = number
+
+        inserted, failed = await write_chunk(db.appointments, db.slot_claims, db.customers, accepted, today, prices)
+        for appointment_id, error in failed.items():
+            reject(numbers[appointment_id], error)
+        report["imported"] += len(inserted)
+        dates.update(doc["date"] for doc in inserted)
+        await apply_rollup_changes(db.daily_rollups, [(None, doc) for doc in inserted], prices)
+        if notify:
+            for doc in inserted:
+                if doc["status"] in ACTIVE_STATUSES and doc["date"] >= today:
+                    await notify_booking(doc)
+
+    chunk = []
+    async for number, row, error in read_rows(request.stream(), format):
+        if error is None:
+            try:
+                doc = build_imported_appointment(row, services, barbers)
+            except ValidationError as e:
+                error = validation_message(e)
+            except ValueError as e:
+                error = str(e)
+            else:
+                if doc["id"] in seen_ids:
+                    error = "Duplicate appointment id"
+        if error:
+            reject(number, error)
+            continue
+        seen_ids.add(doc["id"])
+        chunk.append((number, doc))
+        if len(chunk) >= chunk_size:
+            await flush(chunk)
+            chunk = []
+    if chunk:
+        await flush(chunk)
+
+    if dates:
+        # Uma escrita marca os dias importados como desatualizados; refeitos na próxima leitura
+        await day_availability.invalidate_range(min(dates), max(dates))
+    return report
 
 @api_router.patch("/appointments/{appointment_id}", response_model=Appointment)
 async def update_appointment(appointment_id: str, update_data: AppointmentUpdate):
+    current = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
+    if not current:
+        raise HTTPException(status_code=404, detail="Appointment not found")
+    
+    # Reativar um agendamento cancelado precisa reservar o horário de novo
+    reactivating = current.get('status') not in ACTIVE_STATUSES and update_data.status in ACTIVE_STATUSES
+    if reactivating:
+        await claim_appointment_slot(current)
+    
     result = await db.appointments.find_one_and_update(
         {"id": appointment_id},
         {"$set": {"status": update_data.status}},
@@ -376,167 +870,236 @@ async def update_appointment(appointment_id: str, update_data: AppointmentUpdate
     if not result:
         raise HTTPException(status_code=404, detail="Appointment not found")
     
+    if update_data.status not in ACTIVE_STATUSES:
+        await release(db.slot_claims, appointment_id)
+    if (current.get('status') in ACTIVE_STATUSES) != (update_data.status in ACTIVE_STATUSES):
+        await day_availability.refresh(result['date'], result.get('barber_id'))
+    
     result.pop('_id', None)
+    events.publish("appointments", "update", result)
+    await sync_customer_stats(current, result)
+    await sync_rollups([(current, result)])
     return Appointment(**result)
 
 # ========== AVAILABLE SLOTS ==========
 
 @api_router.get("/available-slots")
-async def get_available_slots(date: str, service_id: str):
-    # 1. Bloqueio de Domingo
+async def get_available_slots(date: str, service_id: str, barber_id: Optional[str] = None):
+    # 1. Regras de funcionamento do dia (domingo, feriado, horário, pausas)
     try:
-        date_obj = datetime.strptime(date, "%Y-%m-%d")
-        if date_obj.weekday() == 6:  # 6 representa Domingo
-            return {"available_slots": [], "message": "Closed on Sundays"}
-    except Exception as e:
+        template = await schedule.template(parse_date(date))
+    except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format")
+    if template.closed:
+        return {"available_slots": [], "message": await schedule.closed_message(date)}
 
     # 2. Busca o serviço para saber a duração
-    service = await db.services.find_one({"id": service_id}, {"_id": 0})
+    service = await services_cache.get(service_id)
     if not service:
         raise HTTPException(status_code=404, detail="Service not found")
     
-    duration = service['duration_minutes']
-    
-    # Horário de funcionamento: 09:00 às 21:00
-    start_hour = 9
-    end_hour = 21
-    slot_interval = 30
-    
-    slots_24h = []
-    current_minutes = start_hour * 60
-    end_minutes = end_hour * 60
-    
-    while current_minutes < end_minutes:
-        hour = current_minutes // 60
-        minute = current_minutes % 60
-        time_slot_24h = f"{hour:02d}:{minute:02d}"
-        
-        if (current_minutes + duration) <= end_minutes:
-            slots_24h.append(time_slot_24h)
-        current_minutes += slot_interval
-    
-    # Busca agendamentos e bloqueios
-    appointments = await db.appointments.find({
-        "date": date,
-        "status": {"$in": ["scheduled", "completed"]}
-    }).to_list(1000)
-    
-    blocked_slots = await db.blocked_slots.find({"date": date}).to_list(1000)
-    
-    available_slots_24h = []
-    for slot_24h in slots_24h:
-        is_available = True
-        slot_hour, slot_minute = map(int, slot_24h.split(':'))
-        slot_minutes = slot_hour * 60 + slot_minute
-        slot_end_minutes = slot_minutes + duration
-        
-        # Verifica contra agendamentos (Suporta 24h e AM/PM)
-        for apt in appointments:
-            try:
-                apt_time = apt['time']
-                if 'AM' in apt_time or 'PM' in apt_time:
-                    time_obj = datetime.strptime(apt_time, "%I:%M %p")
-                else:
-                    time_obj = datetime.strptime(apt_time, "%H:%M")
-                
-                apt_start = time_obj.hour * 60 + time_obj.minute
-                apt_end = apt_start + apt['duration_minutes']
-                
-                if not (slot_end_minutes <= apt_start or slot_minutes >= apt_end):
-                    is_available = False
-                    break
-            except:
-                continue
-        
-        # Verifica contra bloqueios
-        if is_available:
-            for blocked in blocked_slots:
-                try:
-                    b_start_h, b_start_m = map(int, blocked['start_time'].split(':'))
-                    b_end_h, b_end_m = map(int, blocked['end_time'].split(':'))
-                    b_start = b_start_h * 60 + b_start_m
-                    b_end = b_end_h * 60 + b_end_m
-                    
-                    if not (slot_end_minutes <= b_start or slot_minutes >= b_end):
-                        is_available = False
-                        break
-                except:
-                    continue
-        
-        if is_available:
-            available_slots_24h.append(slot_24h)
+    duration = service.duration_minutes
     
-    # Formata para AM/PM para o site
-    available_slots_12h = [
-        datetime.strptime(s, "%H:%M").strftime("%I:%M %p") 
-        for s in available_slots_24h
-    ]
+    # Mapa de ocupação de cada cadeira: um documento da visão materializada por barbeiro
+    occupancies = await day_availability.get_many(date, await bookable_barbers(barber_id))
     
-    return {"available_slots": available_slots_12h}
+    # Horário livre em pelo menos uma cadeira (OR dos bitmaps); rótulos AM/PM já prontos no template
+    return {"available_slots": template.available_labels_any(occupancies.values(), duration)}
 
-# ========== BLOCKED SLOTS ==========
-
-@api_router.post("/blocked-slots", status_code=201)
-async def create_blocked_slot_range(data: BlockedSlotRangeCreate):
-    
-    # 1. Converter datas de string para objetos datetime.date
+@api_router.get("/available-slots/range")
+async def get_available_slots_range(start: str, end: str, service_id: str, barber_id: Optional[str] = None):
+    # Calendário de vários dias com uma consulta só em cada coleção
     try:
-        start_date = datetime.strptime(data.start_date, '%Y-%m-%d').date()
-        end_date = datetime.strptime(data.end_date, '%Y-%m-%d').date()
+        start_date = datetime.strptime(start, "%Y-%m-%d").date()
+        end_date = datetime.strptime(end, "%Y-%m-%d").date()
     except ValueError:
-        raise HTTPException(status_code=400, detail="Formato de data inválido. Use YYYY-MM-DD.")
-        
-    # 2. Garantir que a data de início não seja posterior à data de fim
+        raise HTTPException(status_code=400, detail="Invalid date format")
+
     if start_date > end_date:
-        raise HTTPException(status_code=400, detail="Data de início não pode ser posterior à data de fim.")
+        raise HTTPException(status_code=400, detail="Start date must not be after end date")
 
-    # 3. Iterar por cada dia no intervalo
-    # Calcula o número total de dias, incluindo a data final (+1)
     num_days = (end_date - start_date).days + 1
-    
-    blocked_slots_to_insert = []
+    if num_days > MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range is limited to {MAX_RANGE_DAYS} days")
+
+    service = await services_cache.get(service_id)
+    if not service:
+        raise HTTPException(status_code=404, detail="Service not found")
 
+    duration = service.duration_minutes
+    date_filter = {"$gte": start, "$lte": end}
+    barber_ids = await bookable_barbers(barber_id)
+
+    appointments_by_chair = {}
+    async for apt in db.appointments.find(
+        {"date": date_filter, "barber_id": {"$in": barber_ids}, "status": {"$in": list(ACTIVE_STATUSES)}},
+        {"_id": 0, "date": 1, "start_minute": 1, "end_minute": 1, "time": 1, "duration_minutes": 1, "barber_id": 1}
+    ):
+        appointments_by_chair.setdefault((apt['date'], apt['barber_id']), []).append(apt)
+
+    blocks = await db.blocked_slots.find(
+        {**overlap_query(start, end), "barber_id": {"$in": [None, *barber_ids]}},
+        {"_id": 0, "start_date": 1, "end_date": 1, "start_minute": 1, "end_minute": 1,
+         "start_time": 1, "end_time": 1, "weekdays": 1, "barber_id": 1}
+    ).to_list(None)
+    blocked_by_date = windows_by_date(blocks, start, end)
+
+    days = []
     for i in range(num_days):
         current_date = start_date + timedelta(days=i)
-        
-        # Cria um objeto para ser inserido no MongoDB para o dia atual
-        slot_data = {
-            # Usando o modelo BlockedSlot como base para garantir consistência
-            "id": str(uuid.uuid4()),
-            "date": current_date.strftime('%Y-%m-%d'), # Formato string para salvar no DB
-            "start_time": data.start_time,
-            "end_time": data.end_time,
-            "reason": data.reason,
-            "created_at": datetime.now(timezone.utc).isoformat(),
-        }
-        blocked_slots_to_insert.append(slot_data)
+        date_str = current_date.strftime("%Y-%m-%d")
+
+        template = await schedule.template(current_date)
+        if template.closed:
+            days.append({"date": date_str, "closed": True, "fully_booked": False, "available_slots": []})
+            continue
+
+        windows = blocked_by_date.get(date_str, ())
+        occupancies = [
+            DayOccupancy.from_documents(appointments_by_chair.get((date_str, chair), ()), for_barber(windows, chair))
+            for chair in barber_ids
+        ]
+        slots = template.available_labels_any(occupancies, duration)
+        days.append({
+            "date": date_str,
+            "closed": False,
+            "fully_booked": not slots,
+            "available_slots": slots,
+        })
+
+    return {"service_id": service_id, "start": start, "end": end, "days": days}
+
+@api_router.post("/day-availability/rebuild")
+async def rebuild_day_availability(since: Optional[str] = None):
+    days = await day_availability.rebuild(since)
+    return {"rebuilt_days": days}
+
+# ========== SCHEDULE ==========
+
+@api_router.get("/schedule", response_model=ScheduleConfig)
+async def get_schedule():
+    return await schedule.config()
+
+@api_router.put("/schedule", response_model=ScheduleConfig)
+async def update_schedule(config: ScheduleConfig):
+    try:
+        return await schedule.save(config.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# ========== BLOCKED SLOTS ==========
+
+def build_blocked_slot(data: BlockedSlotRangeCreate) -> dict:
+    """Validate a block request and build its range document."""
+    try:
+        start_date = parse_date(data.start_date)
+        end_date = parse_date(data.end_date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Formato de data inválido. Use YYYY-MM-DD.")
+
+    if start_date > end_date:
+        raise HTTPException(status_code=400, detail="Data de início não pode ser posterior à data de fim.")
 
-    # 4. Inserir todos os slots bloqueados de uma vez
-    if blocked_slots_to_insert:
+    weekdays = sorted(set(data.weekdays)) if data.weekdays else None
+    return BlockedSlot(
+        start_date=data.start_date,
+        end_date=data.end_date,
+        start_time=data.start_time,
+        end_time=data.end_time,
+        weekdays=weekdays,
+        barber_id=data.barber_id,
+        reason=data.reason,
+        **block_fields(data.model_dump()),
+    ).model_dump()
+
+async def after_blocks_changed(blocks: List[dict], op: str):
+    # Um documento por bloqueio: as datas cobertas só ficam marcadas como desatualizadas
+    for block in blocks:
+        await day_availability.invalidate_range(block["start_date"], block["end_date"], block.get("barber_id"))
+        if op == "delete":
+            events.publish("blocked_slots", op, id=block["id"])
+        else:
+            events.publish("blocked_slots", op, block)
+
+@api_router.post("/blocked-slots", status_code=201)
+async def create_blocked_slot_range(data: BlockedSlotRangeCreate):
+    block = build_blocked_slot(data)
+    try:
+        await db.blocked_slots.insert_one(block)
+    except Exception as e:
+        logger.error(f"Database error during block insert: {e}")
+        raise HTTPException(status_code=500, detail="Erro ao salvar bloqueios no banco de dados.")
+    block.pop("_id", None)
+    await after_blocks_changed([block], "insert")
+
+    num_days = (parse_date(block["end_date"]) - parse_date(block["start_date"])).days + 1
+    return {"message": f"Bloqueio criado com sucesso para {num_days} dias.", "id": block["id"]}
+
+@api_router.post("/blocked-slots/bulk", status_code=201)
+async def create_blocked_slots_bulk(data: List[BlockedSlotRangeCreate]):
+    blocks = [build_blocked_slot(item) for item in data]
+    if blocks:
         try:
-            await db.blocked_slots.insert_many(blocked_slots_to_insert)
+            await db.blocked_slots.insert_many(blocks)
         except Exception as e:
             logger.error(f"Database error during bulk insert: {e}")
             raise HTTPException(status_code=500, detail="Erro ao salvar bloqueios no banco de dados.")
+        for block in blocks:
+            block.pop("_id", None)
+        await after_blocks_changed(blocks, "insert")
+    return {"created": len(blocks), "ids": [block["id"] for block in blocks]}
+
+@api_router.get("/blocked-slots", response_model=Union[List[BlockedSlot], BlockedSlotPage])
+async def get_blocked_slots(
+    date: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    barber_id: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    format: Optional[str] = None,
+):
+    # date: bloqueios que valem nesse dia; start/end: bloqueios que tocam o intervalo
+    try:
+        if date:
+            query = day_query(date)
+        elif start or end:
+            query = overlap_query(start or "0000-01-01", end or "9999-12-31")
+        else:
+            query = {}
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+    if barber_id:
+        # Os da barbearia toda também valem para o barbeiro
+        query["barber_id"] = {"$in": [None, barber_id]}
+
+    return await list_documents(db.blocked_slots, BlockedSlot, query, BLOCKED_SLOT_SORT, limit, after, format)
+
+@api_router.post("/blocked-slots/bulk-delete")
+async def delete_blocked_slots_bulk(data: BlockedSlotBulkDelete):
+    if data.ids:
+        query = {"id": {"$in": data.ids}}
+    elif data.start_date and data.end_date:
+        query = {"start_date": {"$gte": data.start_date}, "end_date": {"$lte": data.end_date}}
+    else:
+        raise HTTPException(status_code=400, detail="Provide ids or start_date and end_date")
 
-    return {"message": f"Bloqueio criado com sucesso para {num_days} dias."}
-
-
-@api_router.get("/blocked-slots", response_model=List[BlockedSlot])
-async def get_blocked_slots(date: Optional[str] = None):
-    query = {}
-    if date:
-        query["date"] = date
-    
-    blocked_slots = await db.blocked_slots.find(query, {"_id": 0}).to_list(1000)
-    return blocked_slots
+    blocks = await db.blocked_slots.find(
+        query, {"_id": 0, "id": 1, "start_date": 1, "end_date": 1, "barber_id": 1}
+    ).to_list(None)
+    if blocks:
+        await db.blocked_slots.delete_many({"id": {"$in": [block["id"] for block in blocks]}})
+        await after_blocks_changed(blocks, "delete")
+    return {"deleted": len(blocks)}
 
 @api_router.delete("/blocked-slots/{slot_id}")
 async def delete_blocked_slot(slot_id: str):
-    result = await db.blocked_slots.delete_one({"id": slot_id})
-    if result.deleted_count == 0:
+    deleted = await db.blocked_slots.find_one_and_delete(
+        {"id": slot_id}, {"_id": 0, "id": 1, "start_date": 1, "end_date": 1, "barber_id": 1}
+    )
+    if not deleted:
         raise HTTPException(status_code=404, detail="Blocked slot not found")
+    await after_blocks_changed([deleted], "delete")
     return {"success": True}
 
 
@@ -549,10 +1112,59 @@ async def get_customer_by_phone(phone: str):
         raise HTTPException(status_code=404, detail="Customer not found")
     return customer
 
-@api_router.get("/customers", response_model=List[Customer])
-async def get_all_customers():
-    customers = await db.customers.find({}, {"_id": 0}).sort("last_visit", -1).to_list(1000)
-    return customers
+@api_router.get("/customers/{phone}/appointments", response_model=AppointmentPage)
+async def get_customer_appointments(
+    phone: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+):
+    # Histórico de um cliente, do mais recente para o mais antigo
+    query = {"customer_phone": phone}
+    if start or end:
+        query["date"] = {}
+        if start:
+            query["date"]["$gte"] = start
+        if end:
+            query["date"]["$lte"] = end
+    
+    try:
+        items, next_cursor = await paginate(
+            db.appointments, query, CUSTOMER_HISTORY_SORT, limit, after, appointment_rows.projection
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Página vazia: só confere o cliente aqui, sem custo extra no caminho comum
+    if not items and not after and not await db.customers.find_one({"phone": phone}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Customer not found")
+    if FAST_JSON:
+        return appointment_rows.response({"items": appointment_rows.rows(items), "next_cursor": next_cursor})
+    return {"items": items, "next_cursor": next_cursor}
+
+@api_router.post("/customers/recompute-stats")
+async def recompute_customer_stats():
+    count = await recompute_all_customers(db.customers, db.appointments)
+    return {"customers": count}
+
+@api_router.get("/customers", response_model=Union[List[Customer], CustomerPage])
+async def get_all_customers(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    format: Optional[str] = None,
+):
+    return await list_documents(db.customers, Customer, {}, CUSTOMER_SORT, limit, after, format)
+
+# ========== LIVE EVENTS ==========
+
+@api_router.get("/events")
+async def stream_events():
+    # Server-Sent Events para o painel admin aplicar as mudanças sem recarregar tudo
+    return StreamingResponse(
+        events.stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # ========== AUTH ==========
 
@@ -572,35 +1184,129 @@ async def login(login_data: LoginRequest):
 
 @api_router.get("/dashboard/stats")
 async def get_dashboard_stats():
-    # Today's appointments
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    today_appointments = await db.appointments.count_documents({"date": today, "status": "scheduled"})
-    
-    # Total customers
-    total_customers = await db.customers.count_documents({})
-    
-    # This month's revenue (mock calculation)
-    current_month = datetime.now(timezone.utc).strftime("%Y-%m")
-    month_appointments = await db.appointments.find({
-        "date": {"$regex": f"^{current_month}"},
-        "status": "completed"
-    }, {"_id": 0}).to_list(1000)
-    
-    total_revenue = 0
-    for apt in month_appointments:
-        service = await db.services.find_one({"id": apt['service_id']}, {"_id": 0})
-        if service:
-            total_revenue += service['price']
-    
+    now = datetime.now(timezone.utc)
+    today = now.strftime("%Y-%m-%d")
+    current_month = now.strftime("%Y-%m")
+
+    # Um documento de rollup por dia do mês (ver analytics.py)
+    days, total_customers = await asyncio.gather(
+        db.daily_rollups.find(
+            {"date": {"$gte": f"{current_month}-01", "$lte": f"{current_month}-31"}}, {"_id": 0}
+        ).sort("date", 1).to_list(31),
+        db.customers.estimated_document_count(),
+    )
+    today_doc = next((doc for doc in days if doc["date"] == today), {})
+    by_service = {}
+    for doc in days:
+        for service_id, entry in (doc.get("services") or {}).items():
+            if entry.get("completed"):
+                row = by_service.setdefault(service_id, {
+                    "service_id": service_id, "service_name": entry.get("name"), "appointments": 0, "revenue": 0,
+                })
+                row["appointments"] += entry["completed"]
+                row["revenue"] += entry.get("revenue", 0)
+
     return {
-        "today_appointments": today_appointments,
+        "today_appointments": (today_doc.get("appointments") or {}).get("scheduled", 0),
         "total_customers": total_customers,
-        "monthly_revenue": total_revenue,
-        "total_appointments": len(month_appointments)
+        "monthly_revenue": sum(doc.get("revenue", 0) for doc in days),
+        "total_appointments": sum((doc.get("appointments") or {}).get("completed", 0) for doc in days),
+        "revenue_by_service": sorted(by_service.values(), key=lambda row: -row["revenue"]),
+        "revenue_by_day": [
+            {"date": doc["date"], "appointments": doc["appointments"]["completed"], "revenue": doc.get("revenue", 0)}
+            for doc in days if (doc.get("appointments") or {}).get("completed")
+        ],
     }
 
-# Include the router in the main app
-app.include_router(api_router)
+# ========== ANALYTICS ==========
+
+MAX_REPORT_DAYS = 5 * 366
+
+async def rebuild_rollups(since: Optional[str] = None) -> int:
+    days = await backfill_rollups(db.daily_rollups, db.appointments, await service_prices(), since)
+    await db.migrations.replace_one(
+        {"id": ROLLUPS_MIGRATION_ID},
+        {"id": ROLLUPS_MIGRATION_ID, "days": days, "finished_at": datetime.now(timezone.utc).isoformat()},
+        upsert=True,
+    )
+    return days
+
+@api_router.get("/analytics/report")
+async def get_analytics_report(start: str, end: str, period: str = "month"):
+    """Revenue, no-shows and chair utilization for start..end, grouped by day/week/month/year."""
+    if period not in REPORT_PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(REPORT_PERIODS)}")
+    try:
+        first, last = parse_date(start), parse_date(end)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date format")
+    if last < first:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    if (last - first).days >= MAX_REPORT_DAYS:
+        raise HTTPException(status_code=400, detail=f"Range too long (max {MAX_REPORT_DAYS} days)")
+
+    # Capacidade: minutos abertos do dia × cadeiras ativas (bloqueios não descontam)
+    chairs = sum(1 for barber in await barbers_cache.all() if barber.active)
+    capacity = {}
+    for offset in range((last - first).days + 1):
+        day = first + timedelta(days=offset)
+        capacity[day.isoformat()] = (await schedule.template(day)).open_minutes * chairs
+    docs = await db.daily_rollups.find(
+        {"date": {"$gte": first.isoformat(), "$lte": last.isoformat()}}, {"_id": 0}
+    ).to_list(None)
+    return {"start": first.isoformat(), "end": last.isoformat(), "period": period, **summarize(docs, capacity, period)}
+
+@api_router.post("/analytics/rebuild")
+async def rebuild_analytics(since: Optional[str] = None):
+    """Recompute the daily rollups from the appointments (all dates, or ``since`` on)."""
+    if since:
+        try:
+            since = parse_date(since).isoformat()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format")
+    return {"days": await rebuild_rollups(since)}
+
+# Cache HTTP (ETag + 304) nas rotas de leitura mais consultadas
+http_cache = HTTPCache(
+    rules={
+        "/api/services": CacheRule(["services"], "public, max-age=300"),
+        "/api/available-slots": CacheRule(["appointments", "blocked_slots", "services", "schedule", "barbers"], "no-cache"),
+        "/api/available-slots/range": CacheRule(
+            ["appointments", "blocked_slots", "services", "schedule", "barbers"], "no-cache"
+        ),
+        "/api/barbers": CacheRule(["barbers"], "no-cache"),
+        "/api/schedule": CacheRule(["schedule"], "no-cache"),
+        "/api/blocked-slots": CacheRule(["blocked_slots"], "no-cache"),
+        "/api/dashboard/stats": CacheRule(["appointments", "customers", "services"], "private, no-cache", daily=True),
+        "/api/analytics/report": CacheRule(["appointments", "services", "schedule", "barbers"], "private, no-cache"),
+    },
+    # Escritas bem-sucedidas nestes prefixos mudam a versão das coleções
+    writes=[
+        ("/api/appointments", ["appointments", "customers"]),
+        ("/api/blocked-slots", ["blocked_slots"]),
+        ("/api/customers", ["customers"]),
+        ("/api/schedule", ["schedule"]),
+        ("/api/barbers", ["barbers"]),
+        # Rollups refeitos: os relatórios (versionados por appointments) mudam
+        ("/api/analytics/rebuild", ["appointments"]),
+    ],
+    # Versões no MongoDB: valem para todos os workers
+    versions=MongoVersions(db.cache_versions),
+)
+app.middleware("http")(http_cache.middleware)
+# Por fora do cache: um cliente limitado não chega nem ao 304
+app.middleware("http")(rate_limiter.middleware)
+# Registrado depois do cache para envolvê-lo: os 304 também são medidos
+app.middleware("http")(metrics.middleware)
+
+metrics.gauge("services_cache_hits_total", "Service catalog cache hits.", lambda: services_cache.hits, "counter")
+metrics.gauge("services_cache_misses_total", "Service catalog cache misses.", lambda: services_cache.misses, "counter")
+metrics.gauge("http_cache_not_modified_total", "Requests answered with 304 Not Modified.", lambda: http_cache.hits, "counter")
+metrics.gauge("notifications_pending", "Notifications queued, sending or awaiting retry.", lambda: notifications.pending)
+metrics.gauge("events_subscribers", "Connected live-event (SSE) clients.", lambda: events.subscribers)
+metrics.gauge("idempotent_replays_total", "Bookings answered from a stored Idempotency-Key response.", lambda: idempotency.replays, "counter")
+metrics.gauge("rate_limited_total", "Requests rejected by the rate limiter (429).", lambda: rate_limiter.rejected, "counter")
+metrics.gauge("mongo_pool_max_size", "Configured MongoDB maxPoolSize.", lambda: mongo_pool["maxPoolSize"])
 
 # CORS
 app.add_middleware(
@@ -612,13 +1318,47 @@ app.add_middleware(
 )
 
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
+async def shutdown_resources():
+    """Desligamento ordenado: watchers, fila de notificações, sessões HTTP e, por último, o MongoDB."""
+    watchers = [task for task in (services_watch_task, schedule_watch_task, events_watch_task) if task]
+    for task in watchers:
+        task.cancel()
+    await asyncio.gather(*watchers, return_exceptions=True)
+    # Os envios ainda na fila usam as sessões HTTP e gravam no outbox
+    await notifications.stop(SHUTDOWN_DRAIN_SECONDS)
+    if sg_client:
+        sg_client.close()
+    if twilio_client:
+        twilio_client.http_client.session.close()
     client.close()
 
-# Initialize services on startup
-@app.on_event("startup")
+services_watch_task = None
+schedule_watch_task = None
+events_watch_task = None
+
+# Initialize services on startup (chamado pelo lifespan)
 async def initialize_services():
+    elapsed = await warm_up(client, mongo_pool["minPoolSize"])
+    logger.info(f"MongoDB ready in {elapsed * 1000:.0f} ms (pool {mongo_pool['minPoolSize']}-{mongo_pool['maxPoolSize']})")
+    # Telefones duplicados (corrida do find-then-insert antigo) impediriam o phone_unique
+    if "phone_unique" not in await db.customers.index_information():
+        merged = await merge_duplicate_customers(db.customers, db.appointments)
+        if merged:
+            logger.warning(f"Merged {merged} duplicate customer documents")
+    await ensure_indexes(db)
+    # Bloqueios antigos (um documento por dia) viram períodos
+    folded = await compact_legacy_blocks(db.blocked_slots)
+    if folded:
+        logger.info(f"Folded {folded} per-day blocked slots into range documents")
+    # Campos inteiros de horário nos documentos antigos (uma vez; ver time_fields.py)
+    migrated = await migrate_time_fields(db)
+    if migrated:
+        logger.info(f"Backfilled integer time fields: {migrated}")
+    if os.environ.get('CHECK_QUERY_PLANS') == '1':
+        offenders = await check_query_plans(db)
+        if offenders:
+            raise RuntimeError(f"Queries falling back to COLLSCAN: {offenders}")
+
     # Check if services exist
     count = await db.services.count_documents({})
     if count == 0:
@@ -640,24 +1380,119 @@ async def initialize_services():
         await db.services.insert_many(services)
         logger.info("Services initialized")
 
+    # Sem barbeiros cadastrados: cria o padrão e passa a ele a agenda de cadeira única
+    if await db.barbers.count_documents({}) == 0:
+        barber = Barber(name="Jhun").model_dump()
+        await db.barbers.insert_one(barber)
+        for collection in (db.appointments, db.slot_claims):
+            await collection.update_many({"barber_id": {"$exists": False}}, {"$set": {"barber_id": barber["id"]}})
+        await db.day_availability.delete_many({"barber_id": {"$exists": False}})
+        logger.info("Default barber initialized")
+    await barbers_cache.load()
+
+    # Carrega o catálogo em memória e acompanha mudanças externas
+    global services_watch_task
+    await services_cache.load()
+    services_watch_task = asyncio.create_task(services_cache.watch())
+
+    # Regras de funcionamento compiladas uma vez (recompiladas quando mudam)
+    global schedule_watch_task
+    await schedule.load()
+    schedule_watch_task = asyncio.create_task(schedule.watch())
+
+    # Agendamentos anteriores ao campo price recebem o preço atual do serviço (uma vez)
+    if not await db.migrations.find_one({"id": PRICES_MIGRATION_ID}):
+        stamped = await stamp_prices(db.appointments, await service_prices())
+        await db.migrations.replace_one(
+            {"id": PRICES_MIGRATION_ID},
+            {"id": PRICES_MIGRATION_ID, "stamped": stamped, "finished_at": datetime.now(timezone.utc).isoformat()},
+            upsert=True,
+        )
+        logger.info(f"Stamped the service price on {stamped} appointments")
+
+    # Rollups diários para bancos anteriores a eles (uma vez; ver analytics.py)
+    if not await db.migrations.find_one({"id": ROLLUPS_MIGRATION_ID}):
+        days = await rebuild_rollups()
+        logger.info(f"Built daily rollups for {days} days")
+
+    # Reserva as células dos agendamentos futuros criados antes do slot_claims
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    overlaps = await backfill_claims(db.appointments, db.slot_claims, today, ACTIVE_STATUSES)
+    if overlaps:
+        logger.warning(f"{overlaps} existing appointments overlap another booking")
+
+    # Eventos ao vivo: change stream quando o MongoDB suporta, senão pub/sub local
+    global events_watch_task
+    events_watch_task = asyncio.create_task(events.watch_changes(db))
+
+    # Reenfileira notificações pendentes e sobe os workers
+    await notifications.start()
+
 # ========== NOVAS ROTAS DE GESTAO (CORRIGIDAS) ==========
 
 @api_router.put("/appointments/{appointment_id}")
 async def update_appointment_details(appointment_id: str, data: dict):
-    await db.appointments.update_one({"id": appointment_id}, {"$set": data})
+    current = await db.appointments.find_one({"id": appointment_id}, {"_id": 0})
+    if current:
+        # Horário, duração ou status mudaram: refaz a reserva das células
+        updated = {**current, **data, "id": appointment_id}
+        if any(field in data for field in ("date", "time", "duration_minutes")):
+            data = {**data, **appointment_fields(updated)}
+            updated.update(data)
+        if data.get("service_id", current.get("service_id")) != current.get("service_id") and "price" not in data:
+            service = await services_cache.get(data["service_id"])
+            data = {**data, "price": service.price if service else None}
+            updated.update(data)
+        slot_fields = ("date", "time", "duration_minutes", "status", "barber_id")
+        if any(updated.get(f) != current.get(f) for f in slot_fields):
+            await release(db.slot_claims, appointment_id)
+            if updated.get('status') in ACTIVE_STATUSES:
+                try:
+                    await claim_appointment_slot(updated)
+                except HTTPException:
+                    if current.get('status') in ACTIVE_STATUSES:
+                        await claim_appointment_slot(current)
+                    raise
+    updated = await db.appointments.find_one_and_update(
+        {"id": appointment_id}, {"$set": data}, projection={"_id": 0}, return_document=True
+    )
+    if current:
+        await day_availability.refresh_many([
+            (current.get('date'), current.get('barber_id')),
+            (data.get('date', current.get('date')), data.get('barber_id', current.get('barber_id'))),
+        ])
+    if updated:
+        events.publish("appointments", "update", updated)
+        await sync_customer_stats(current, updated)
+        await sync_rollups([(current, updated)])
     return {"status": "success"}
 
 @api_router.delete("/appointments/{appointment_id}")
 async def delete_appointment(appointment_id: str):
-    await db.appointments.delete_one({"id": appointment_id})
+    deleted = await db.appointments.find_one_and_delete({"id": appointment_id}, {"_id": 0})
+    await release(db.slot_claims, appointment_id)
+    if deleted:
+        await day_availability.refresh(deleted["date"], deleted.get("barber_id"))
+        events.publish("appointments", "delete", id=appointment_id)
+        await sync_customer_stats(deleted, None)
+        await sync_rollups([(deleted, None)])
     return {"status": "deleted"}
 
 @api_router.put("/customers/{customer_id}")
 async def update_customer(customer_id: str, data: dict):
-    await db.customers.update_one({"id": customer_id}, {"$set": data})
+    updated = await db.customers.find_one_and_update(
+        {"id": customer_id}, {"$set": data}, projection={"_id": 0}, return_document=True
+    )
+    if updated:
+        events.publish("customers", "update", updated)
     return {"status": "updated"}
 
 @api_router.delete("/customers/{customer_id}")
 async def delete_customer(customer_id: str):
-    await db.customers.delete_one({"id": customer_id})
+    result = await db.customers.delete_one({"id": customer_id})
+    if result.deleted_count:
+        events.publish("customers", "delete", id=customer_id)
     return {"status": "deleted"}
+
+# Include the router in the main app (depois de todas as rotas do api_router)
+app.include_router(api_router)
@@ -0,0 +1,79 @@
+"""Cache em memória do catálogo de serviços.
+
+The catalog is a handful of rows that almost never change, so it is loaded
+once and kept as an id -> Service dict. Any write path calls ``invalidate()``;
+when MongoDB runs as a replica set, a change stream does the same for writes
+made outside this process.
+"""
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ServicesCache:
+    def __init__(self, collection, factory: Callable = dict):
+        self.collection = collection
+        self.factory = factory
+        self._services: Optional[Dict[str, object]] = None
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    async def _ensure_loaded(self) -> Dict[str, object]:
+        services = self._services
+        if services is not None:
+            self.hits += 1
+            return services
+        async with self._lock:
+            if self._services is None:
+                self.misses += 1
+                docs = await self.collection.find({}, {"_id": 0}).to_list(None)
+                self._services = {doc['id']: self.factory(**doc) for doc in docs}
+            else:
+                self.hits += 1
+            return self._services
+
+    async def load(self) -> None:
+        self.invalidate()
+        await self._ensure_loaded()
+
+    async def get(self, service_id: str):
+        services = await self._ensure_loaded()
+        return services.get(service_id)
+
+    async def all(self) -> List[object]:
+        services = await self._ensure_loaded()
+        return list(services.values())
+
+    async def as_dict(self) -> Dict[str, object]:
+        return dict(await self._ensure_loaded())
+
+    def invalidate(self) -> None:
+        if self._services is not None:
+            self.invalidations += 1
+        self._services = None
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self._services is not None,
+            "size": len(self._services or {}),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+        }
+
+    async def watch(self) -> None:
+        """Invalidate on every change to the collection (needs a replica set)."""
+        from pymongo.errors import PyMongoError
+
+        try:
+            async with self.collection.watch() as stream:
+                async for _ in stream:
+                    self.invalidate()
+        except asyncio.CancelledError:
+            raise
+        except PyMongoError as e:
+            logger.info(f"Services change stream unavailable, relying on write-path invalidation: {e}")
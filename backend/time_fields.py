@@ -0,0 +1,137 @@
+"""Campos canônicos de horário: inteiros, gravados junto das strings.
+
+Appointments store ``time`` as the booking site sent it ("02:30 PM" or
+"14:30"), and blocked slots store "HH:MM". Sorting or comparing those strings
+is wrong ("01:00 PM" sorts before "09:00 AM"), and reading them means parsing
+every row. Each appointment and blocked slot also carries ``start_minute``
+and ``end_minute`` (minutes since midnight). Dates need no copy: the
+"YYYY-MM-DD" strings already sort and compare correctly, and every range
+query and index uses them.
+
+The strings stay as they are for display and the API. Write paths call
+``appointment_fields`` / ``block_fields``. ``migrate`` backfills older
+documents in batches, streaming the collection; it runs once at startup
+(a marker in ``migrations`` skips it afterwards) and also drops the
+``day`` / ``start_day`` / ``end_day`` copies an earlier version wrote. From the command line it
+can be run ahead of a deploy::
+
+    python time_fields.py [--batch-size 1000] [--force]
+
+A document whose time can't be parsed gets ``None`` fields and is left out
+of availability, as before.
+"""
+import asyncio
+import logging
+import os
+from datetime import date as Date, datetime, timezone
+from typing import Callable, Optional, Union
+
+from availability import parse_appointment_time, parse_block_time
+
+logger = logging.getLogger(__name__)
+
+EPOCH = Date(1970, 1, 1)
+MIGRATION_ID = "time_fields_v2"
+# Dias desde 1970 gravados pela v1; nenhuma consulta os usava
+OBSOLETE_FIELDS = {"appointments": ("day",), "blocked_slots": ("start_day", "end_day")}
+
+
+def epoch_day(value: Union[str, Date, None]) -> Optional[int]:
+    """Days since 1970-01-01 for a date or "YYYY-MM-DD" (None if invalid)."""
+    if isinstance(value, str):
+        try:
+            value = Date.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, Date):
+        return None
+    return (value - EPOCH).days
+
+
+def appointment_fields(apt: dict) -> dict:
+    start = parse_appointment_time(apt.get("time"))
+    duration = apt.get("duration_minutes")
+    valid = start is not None and isinstance(duration, (int, float))
+    return {
+        "start_minute": start if valid else None,
+        "end_minute": start + int(duration) if valid else None,
+    }
+
+
+def block_fields(block: dict) -> dict:
+    return {
+        "start_minute": parse_block_time(block.get("start_time")),
+        "end_minute": parse_block_time(block.get("end_time")),
+    }
+
+
+async def backfill(collection, fields: Callable[[dict], dict], projection: dict,
+                   batch_size: int = 1000, force: bool = False) -> int:
+    """Set canonical fields on documents missing them, ``batch_size`` updates per round trip."""
+    from pymongo import UpdateOne
+
+    query = {} if force else {"start_minute": {"$exists": False}}
+    updated, ops = 0, []
+    async for doc in collection.find(query, {"_id": 1, **projection}).batch_size(batch_size):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields(doc)}))
+        if len(ops) >= batch_size:
+            await collection.bulk_write(ops, ordered=False)
+            updated, ops = updated + len(ops), []
+    if ops:
+        await collection.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    return updated
+
+
+async def migrate(db, batch_size: int = 1000, force: bool = False) -> Optional[dict]:
+    """Backfill appointments and blocked slots once; None when already done."""
+    if not force and await db.migrations.find_one({"id": MIGRATION_ID}):
+        return None
+    counts = {
+        "appointments": await backfill(
+            db.appointments, appointment_fields, {"date": 1, "time": 1, "duration_minutes": 1}, batch_size, force
+        ),
+        "blocked_slots": await backfill(
+            db.blocked_slots, block_fields,
+            {"start_date": 1, "end_date": 1, "start_time": 1, "end_time": 1}, batch_size, force
+        ),
+    }
+    for collection, fields in OBSOLETE_FIELDS.items():
+        await db[collection].update_many(
+            {"$or": [{field: {"$exists": True}} for field in fields]}, {"$unset": {field: "" for field in fields}}
+        )
+    await db.migrations.replace_one(
+        {"id": MIGRATION_ID},
+        {"id": MIGRATION_ID, "counts": counts, "finished_at": datetime.now(timezone.utc).isoformat()},
+        upsert=True,
+    )
+    return counts
+
+
+async def _main(batch_size: int, force: bool) -> None:
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from pathlib import Path
+
+    from http_cache import MongoVersions
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        counts = await migrate(db, batch_size, force)
+        if counts:
+            await MongoVersions(db.cache_versions).bump("appointments", "blocked_slots")
+        print("Already migrated (use --force to rescan)" if counts is None else f"Backfilled {counts}")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Backfill integer time fields")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--force", action="store_true", help="recompute every document")
+    args = parser.parse_args()
+    asyncio.run(_main(args.batch_size, args.force))
@@ -0,0 +1,93 @@
+"""Micro-benchmark: serialização da listagem de agendamentos.
+
+Compares, for N appointment rows as they come out of MongoDB:
+
+  before  response_model path: validate every row into ``Appointment``,
+          dump to JSON-compatible python, ``json.dumps`` (what FastAPI does
+          for ``response_model=List[Appointment]`` + ``JSONResponse``)
+  after   ``FAST_JSON=1`` path: ``RowSerializer.rows`` + orjson
+
+Usage (from the repo root):
+
+    python benchmarks/bench_serialization.py [--rows 10000] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+
+import orjson  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+
+from fast_json import RowSerializer  # noqa: E402
+from server import Appointment  # noqa: E402
+
+
+def make_rows(count: int) -> List[dict]:
+    rng = random.Random(42)
+    statuses = ["scheduled", "completed", "no-show", "cancelled"]
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "service_id": str(uuid.uuid4()),
+            "service_name": "Men's Haircut",
+            "customer_name": f"Customer {i}",
+            "customer_phone": f"555{i:07d}",
+            "customer_email": None if i % 3 else f"c{i}@example.com",
+            "date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "time": f"{rng.randint(9, 20):02d}:{rng.choice(['00', '30'])}",
+            "duration_minutes": rng.choice([20, 30, 45, 60]),
+            "status": rng.choice(statuses),
+            "created_at": "2025-01-01T12:00:00+00:00",
+            "language": "en",
+        }
+        for i in range(count)
+    ]
+
+
+def before(rows, adapter=TypeAdapter(List[Appointment])):
+    validated = adapter.validate_python(rows)
+    return json.dumps(adapter.dump_python(validated, mode="json")).encode()
+
+
+def after(rows, serializer=RowSerializer(Appointment)):
+    return orjson.dumps(serializer.rows(rows))
+
+
+def measure(fn, rows, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(rows)
+        best = min(best, time.perf_counter() - start)
+    return len(rows) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    assert json.loads(before(rows)) == json.loads(after(rows))
+
+    slow = measure(before, rows, args.repeat)
+    fast = measure(after, rows, args.repeat)
+    print(f"rows: {args.rows}")
+    print(f"before (response_model + json): {slow:>12,.0f} rows/s")
+    print(f"after  (FAST_JSON + orjson):    {fast:>12,.0f} rows/s")
+    print(f"speedup: {fast / slow:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
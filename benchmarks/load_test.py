@@ -0,0 +1,279 @@
+"""Teste de carga da API de agendamento.
+
+Seeds a database with a realistic history (by default two years of
+appointments and 10k customers), then drives concurrent async load at the
+hot endpoints and reports p50/p95/p99 latency and throughput per scenario:
+
+  slots      GET  /api/available-slots   (random open day and service)
+  book       POST /api/appointments      (random future slot; 400 = taken)
+  stats      GET  /api/dashboard/stats
+
+By default the app runs in-process (ASGI transport, no network) against
+MONGO_URL; ``--memory`` uses mongomock-motor as an in-memory stand-in
+(``pip install mongomock-motor``), and ``--url`` targets a running server
+instead (no seeding; start that server with ``RATE_LIMITS=off``). Results
+are written as JSON so two commits can be compared:
+
+    python benchmarks/load_test.py --save benchmarks/results/baseline.json
+    python benchmarks/load_test.py --compare benchmarks/results/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import uuid
+from datetime import date, timedelta
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+SCENARIOS = ("slots", "book", "stats")
+
+
+# ==================== APP / SEED ====================
+
+def load_app(memory: bool):
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "jhun_benchmark")
+    # Toda a carga sai de um só IP: com os limites ligados quase tudo viraria 429
+    os.environ.setdefault("RATE_LIMITS", "off")
+    if memory:
+        import motor.motor_asyncio
+        from mongomock_motor import AsyncMongoMockClient
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+    import server
+    return server
+
+
+async def seed(db, services, barbers: int, days: int, per_day: int, customers: int, rng: random.Random):
+    await db.appointments.delete_many({})
+    await db.customers.delete_many({})
+    await db.blocked_slots.delete_many({})
+    await db.slot_claims.delete_many({})
+    await db.day_availability.delete_many({})
+
+    # O primeiro barbeiro é o padrão criado no startup; os demais são cadeiras extras
+    barber_ids = [b["id"] for b in await db.barbers.find({}, {"_id": 0, "id": 1}).to_list(None)][:1]
+    await db.barbers.delete_many({"id": {"$nin": barber_ids}})
+    extra = [{"id": str(uuid.uuid4()), "name": f"Barber {i}", "active": True} for i in range(1, barbers)]
+    if extra:
+        await db.barbers.insert_many(extra)
+        barber_ids += [b["id"] for b in extra]
+
+    phones = [f"555{i:07d}" for i in range(customers)]
+    await db.customers.insert_many([
+        {"id": str(uuid.uuid4()), "full_name": f"Customer {i}", "phone": phone, "email": None,
+         "total_appointments": 0, "last_visit": None}
+        for i, phone in enumerate(phones)
+    ])
+
+    today = date.today()
+    batch = []
+    for offset in range(-days, 0):
+        day = today + timedelta(days=offset)
+        if day.weekday() == 6:
+            continue
+        for barber_id in barber_ids:
+            for start in rng.sample(range(9 * 60, 20 * 60, 30), min(per_day, 22)):
+                service = rng.choice(services)
+                batch.append({
+                    "id": str(uuid.uuid4()),
+                    "service_id": service["id"],
+                    "service_name": service["name"],
+                    "customer_name": "Seed",
+                    "customer_phone": rng.choice(phones),
+                    "customer_email": None,
+                    "date": day.isoformat(),
+                    "time": f"{start // 60:02d}:{start % 60:02d}",
+                    "duration_minutes": service["duration_minutes"],
+                    "price": service["price"],
+                    "barber_id": barber_id,
+                    "status": rng.choice(["completed", "completed", "completed", "no-show", "cancelled"]),
+                    "created_at": f"{day.isoformat()}T08:00:00+00:00",
+                    "language": "en",
+                    "start_minute": start,
+                    "end_minute": start + service["duration_minutes"],
+                })
+        if len(batch) >= 5000:
+            await db.appointments.insert_many(batch)
+            batch = []
+    if batch:
+        await db.appointments.insert_many(batch)
+    return await db.appointments.count_documents({})
+
+
+# ==================== LOAD ====================
+
+def open_days(count: int):
+    day, days = date.today() + timedelta(days=1), []
+    while len(days) < count:
+        if day.weekday() != 6:
+            days.append(day.isoformat())
+        day += timedelta(days=1)
+    return days
+
+
+def make_request(scenario: str, services, days, rng: random.Random):
+    service = rng.choice(services)
+    if scenario == "slots":
+        return "GET", "/api/available-slots", {"params": {"date": rng.choice(days), "service_id": service["id"]}}
+    if scenario == "book":
+        start = rng.randrange(9 * 60, 20 * 60, 30)
+        return "POST", "/api/appointments", {"json": {
+            "service_id": service["id"],
+            "customer_name": "Load Test",
+            "customer_phone": f"999{rng.randrange(10_000_000):07d}",
+            "date": rng.choice(days),
+            "time": f"{start // 60:02d}:{start % 60:02d}",
+        }}
+    return "GET", "/api/dashboard/stats", {}
+
+
+async def run_scenario(client, scenario, services, days, concurrency, duration, seed_value):
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id):
+        rng = random.Random(seed_value * 1000 + worker_id)
+        while time.perf_counter() < deadline:
+            method, path, kwargs = make_request(scenario, services, days, rng)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return summarize(latencies, statuses, elapsed)
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, statuses, elapsed):
+    values = sorted(latencies)
+    return {
+        "requests": len(values),
+        "throughput_rps": round(len(values) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "mean_ms": round(statistics.fmean(values), 2) if values else 0.0,
+        "statuses": statuses,
+    }
+
+
+# ==================== REPORT ====================
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results, baseline=None):
+    print(f"{'scenario':<8} {'req':>7} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}  statuses")
+    for name, r in results["scenarios"].items():
+        line = (f"{name:<8} {r['requests']:>7} {r['throughput_rps']:>9.1f} "
+                f"{r['p50_ms']:>8.2f}ms {r['p95_ms']:>8.2f}ms {r['p99_ms']:>8.2f}ms  {r['statuses']}")
+        base = (baseline or {}).get("scenarios", {}).get(name)
+        if base and base["p95_ms"]:
+            line += f"  (p95 {100 * (r['p95_ms'] / base['p95_ms'] - 1):+.0f}% vs {baseline.get('commit')})"
+        print(line)
+
+
+def regressions(results, baseline, tolerance):
+    failed = []
+    for name, r in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base and base["p95_ms"] and r["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            failed.append(name)
+    return failed
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=30)
+        services = (await client.get("/api/services")).json()
+        lifespan = None
+    else:
+        server = load_app(args.memory)
+        app = server.app
+        lifespan = app.router.lifespan_context(app)
+        await lifespan.__aenter__()
+        services = [s.model_dump() for s in await server.services_cache.all()]
+        print("seeding...", flush=True)
+        total = await seed(server.db, services, args.barbers, args.days, args.per_day, args.customers, rng)
+        await server.barbers_cache.load()
+        await server.day_availability.rebuild()
+        # O startup já montou os rollups (do banco vazio): refaz com o histórico semeado
+        await server.rebuild_rollups()
+        print(f"seeded {total} appointments, {args.customers} customers", flush=True)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=30)
+
+    days = open_days(args.open_days)
+    results = {
+        "commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("save", "compare")},
+        "scenarios": {},
+    }
+    try:
+        for scenario in args.scenarios:
+            print(f"running {scenario}...", flush=True)
+            results["scenarios"][scenario] = await run_scenario(
+                client, scenario, services, days, args.concurrency, args.duration, args.seed
+            )
+    finally:
+        await client.aclose()
+        if lifespan:
+            await lifespan.__aexit__(None, None, None)
+
+    baseline = json.loads(Path(args.compare).read_text()) if args.compare else None
+    print_report(results, baseline)
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(results, indent=2))
+        print(f"saved {args.save}")
+    if baseline:
+        failed = regressions(results, baseline, args.tolerance)
+        if failed:
+            print(f"p95 regression over {args.tolerance:.0%}: {', '.join(failed)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test for the booking API")
+    parser.add_argument("--url", help="target a running server instead of the in-process app")
+    parser.add_argument("--memory", action="store_true", help="use mongomock-motor instead of MONGO_URL")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--days", type=int, default=730, help="days of seeded history")
+    parser.add_argument("--per-day", type=int, default=16, help="seeded appointments per open day and barber")
+    parser.add_argument("--barbers", type=int, default=1, help="chairs to seed (\"any barber\" merges them)")
+    parser.add_argument("--customers", type=int, default=10_000)
+    parser.add_argument("--open-days", type=int, default=30, help="future days the load spreads over")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per scenario")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--save", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 regression (0.2 = 20%%)")
+    sys.exit(asyncio.run(main(parser.parse_args())))
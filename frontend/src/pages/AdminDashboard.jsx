@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { toast } from 'sonner';
@@ -27,6 +27,15 @@ import { format } from 'date-fns';
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
 
+// Aplica uma mudança ({op, id, data}) a uma lista; repetir a mesma mudança não altera nada
+const applyDelta = (list, event, keep = () => true) => {
+  const rest = list.filter(item => item.id !== event.id);
+  if (event.op === 'delete' || !event.data || !keep(event.data)) return rest;
+  return list.some(item => item.id === event.id)
+    ? list.map(item => (item.id === event.id ? event.data : item))
+    : [...list, event.data];
+};
+
 export default function AdminDashboard() {
   const navigate = useNavigate();
   const [editingCustomer, setEditingCustomer] = useState(null);
@@ -44,6 +53,7 @@ export default function AdminDashboard() {
   const [selectedDates, setSelectedDates] = useState([new Date()]);
   const [loading, setLoading] = useState(false);
   const [blockedSlots, setBlockedSlots] = useState([]);
+  const selectedDateRef = useRef(null);
 
   const [blockSlotData, setBlockSlotData] = useState({
     start_date: format(new Date(), 'yyyy-MM-dd'),
@@ -63,11 +73,59 @@ export default function AdminDashboard() {
   }, []);
 
   useEffect(() => {
+    selectedDateRef.current = selectedDates?.[0] ? format(selectedDates[0], 'yyyy-MM-dd') : null;
     if (selectedDates && selectedDates.length > 0) {
       fetchAppointmentsByDate(selectedDates[0]);
     }
   }, [selectedDates]);
 
+  const onSelectedDate = apt => !selectedDateRef.current || apt.date === selectedDateRef.current;
+
+  // Atualizações ao vivo (SSE) para mudanças feitas por outros; as do próprio admin
+  // já entram pela resposta da escrita (o stream pode não chegar: vários workers, proxy)
+  useEffect(() => {
+    const source = new EventSource(`${API}/events`);
+
+    source.addEventListener('appointment', (e) => {
+      const event = JSON.parse(e.data);
+      // Delete sem id (change stream sem pre-image): não dá para aplicar o delta
+      if (!event.id) {
+        fetchDashboardData();
+        return;
+      }
+      setAppointments(prev => applyDelta(prev, event, onSelectedDate));
+      fetchStats();
+    });
+    source.addEventListener('customer', (e) => {
+      const event = JSON.parse(e.data);
+      if (!event.id) {
+        fetchDashboardData();
+        return;
+      }
+      setCustomers(prev => applyDelta(prev, event));
+      fetchStats();
+    });
+    source.addEventListener('blocked_slot', (e) => {
+      const event = JSON.parse(e.data);
+      if (!event.id) {
+        fetchDashboardData();
+        return;
+      }
+      setBlockedSlots(prev => applyDelta(prev, event));
+    });
+
+    return () => source.close();
+  }, []);
+
+  const fetchStats = async () => {
+    try {
+      const response = await axios.get(`${API}/dashboard/stats`);
+      setStats(response.data);
+    } catch (error) {
+      console.error('Error fetching stats:', error);
+    }
+  };
+
   const fetchDashboardData = async () => {
     try {
       const [statsRes, appointmentsRes, customersRes, blockedRes] = await Promise.all([
@@ -86,6 +144,28 @@ export default function AdminDashboard() {
     }
   };
 
+  const fetchBlockedSlots = async () => {
+    try {
+      const response = await axios.get(`${API}/blocked-slots`);
+      setBlockedSlots(response.data);
+    } catch (error) {
+      console.error('Error fetching blocked slots:', error);
+    }
+  };
+
+  const updateAppointmentStatus = async (id, status) => {
+    const response = await axios.patch(`${API}/appointments/${id}`, { status });
+    setAppointments(prev => applyDelta(prev, { op: 'update', id, data: response.data }, onSelectedDate));
+    fetchStats();
+    // Os contadores do cliente (faltas, gasto) mudam junto com o estado
+    try {
+      const customer = await axios.get(`${API}/customers/${encodeURIComponent(response.data.customer_phone)}`);
+      setCustomers(prev => applyDelta(prev, { op: 'update', id: customer.data.id, data: customer.data }));
+    } catch (error) {
+      console.error('Error fetching customer:', error);
+    }
+  };
+
   const fetchAppointmentsByDate = async (dateToFetch) => {
     try {
       const dateStr = format(dateToFetch, 'yyyy-MM-dd');
@@ -100,10 +180,8 @@ export default function AdminDashboard() {
 
   const handleStatusUpdate = async (appointmentId, newStatus) => {
     try {
-      await axios.patch(`${API}/appointments/${appointmentId}`, { status: newStatus });
+      await updateAppointmentStatus(appointmentId, newStatus);
       toast.success('Estado atualizado');
-      fetchDashboardData();
-      if (selectedDates[0]) fetchAppointmentsByDate(selectedDates[0]);
     } catch (error) {
       toast.error('Erro ao atualizar agendamento');
     }
@@ -115,7 +193,7 @@ export default function AdminDashboard() {
     try {
       await axios.post(`${API}/blocked-slots`, blockSlotData);
       toast.success('Horário bloqueado com sucesso');
-      fetchDashboardData();
+      fetchBlockedSlots();
     } catch (error) {
       toast.error('Erro ao bloquear horário');
     } finally {
@@ -126,8 +204,8 @@ export default function AdminDashboard() {
   const handleUnblockSlot = async (slotId) => {
     try {
       await axios.delete(`${API}/blocked-slots/${slotId}`);
+      setBlockedSlots(prev => applyDelta(prev, { op: 'delete', id: slotId }));
       toast.success('Horário desbloqueado');
-      fetchDashboardData();
     } catch (error) {
       toast.error('Erro ao desbloquear');
     }
@@ -135,10 +213,8 @@ export default function AdminDashboard() {
 
   const handleCancel = async (id) => {
     try {
-      await axios.patch(`${API}/appointments/${id}`, { status: 'cancelled' });
+      await updateAppointmentStatus(id, 'cancelled');
       toast.success('Agendamento cancelado');
-      fetchDashboardData();
-      if (selectedDates[0]) fetchAppointmentsByDate(selectedDates[0]);
     } catch (error) {
       toast.error('Erro ao cancelar');
     }
@@ -148,9 +224,11 @@ export default function AdminDashboard() {
     e.preventDefault();
     try {
       await axios.put(`${API}/customers/${editingCustomer.id}`, editFormData);
+      setCustomers(prev => applyDelta(prev, {
+        op: 'update', id: editingCustomer.id, data: { ...editingCustomer, ...editFormData }
+      }));
       toast.success('Cliente atualizado com sucesso');
       setEditingCustomer(null);
-      fetchDashboardData();
     } catch (error) {
       toast.error('Erro ao atualizar dados do cliente');
     }
@@ -160,10 +238,8 @@ export default function AdminDashboard() {
     if (window.confirm("Deseja cancelar este agendamento?")) {
       try {
         // Mudamos de DELETE para PATCH para evitar o erro 405
-        await axios.patch(`${API}/appointments/${id}`, { status: 'cancelled' });
+        await updateAppointmentStatus(id, 'cancelled');
         toast.success('Agendamento cancelado com sucesso');
-        fetchDashboardData();
-        if (selectedDates[0]) fetchAppointmentsByDate(selectedDates[0]);
       } catch (error) {
         console.error('Erro ao cancelar:', error);
         toast.error('O servidor não permitiu excluir. Tente apenas cancelar.');
@@ -173,15 +249,15 @@ export default function AdminDashboard() {
 
   const fetchCustomerHistory = async (customer) => {
     try {
-      // Busca todos os agendamentos para filtrar os deste cliente
-      const response = await axios.get(`${API}/appointments`);
-      const history = response.data.filter(apt => 
-        apt.customer_name === customer.full_name || apt.customer_id === customer.id
+      // Só o histórico deste cliente (paginado no servidor, mais recentes primeiro)
+      const response = await axios.get(
+        `${API}/customers/${encodeURIComponent(customer.phone)}/appointments`,
+        { params: { limit: 100 } }
       );
       
       setCustomerHistory({
         name: customer.full_name,
-        services: history
+        services: response.data.items
       });
     } catch (error) {
       console.error('Erro ao carregar histórico:', error);
@@ -437,7 +513,9 @@ export default function AdminDashboard() {
                     blockedSlots.map(slot => (
                       <div key={slot.id} className="flex justify-between items-center bg-white/5 p-3 rounded-lg border border-white/5">
                         <div>
-                          <p className="text-[#FFD700] text-sm font-bold">{slot.date}</p>
+                          <p className="text-[#FFD700] text-sm font-bold">
+                            {slot.start_date === slot.end_date ? slot.start_date : `${slot.start_date} → ${slot.end_date}`}
+                          </p>
                           <p className="text-white text-xs">{slot.start_time} - {slot.end_time}</p>
                         </div>
                         <Button size="sm" variant="ghost" onClick={() => handleUnblockSlot(slot.id)} className="text-red-500 hover:bg-red-500/10"><Trash2 className="w-4 h-4" /></Button>
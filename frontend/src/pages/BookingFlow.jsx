@@ -9,7 +9,7 @@ import { Label } from '@/components/ui/label';
 import { Calendar } from '@/components/ui/calendar';
 import { enUS, ptBR, es } from 'date-fns/locale';
 import { ArrowLeft, Check, Clock, DollarSign, Globe } from 'lucide-react';
-import { format } from 'date-fns';
+import { format, startOfMonth, endOfMonth } from 'date-fns';
 
 const BACKEND_URL = import.meta.env.VITE_BACKEND_URL || process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -23,6 +23,8 @@ export default function BookingFlow() {
   const [selectedService, setSelectedService] = useState(null);
   const [selectedDate, setSelectedDate] = useState(null);
   const [availableSlots, setAvailableSlots] = useState([]);
+  const [visibleMonth, setVisibleMonth] = useState(new Date());
+  const [unavailableDates, setUnavailableDates] = useState(new Set());
   const [selectedTime, setSelectedTime] = useState(null);
   const [customerInfo, setCustomerInfo] = useState({
     name: '',
@@ -112,6 +114,33 @@ export default function BookingFlow() {
     }
   }, [selectedDate, selectedService]);
 
+  useEffect(() => {
+    if (selectedService) {
+      fetchMonthAvailability();
+    }
+  }, [selectedService, visibleMonth]);
+
+  const fetchMonthAvailability = async () => {
+    try {
+      // Uma requisição para o mês inteiro: marca dias fechados ou lotados
+      const response = await axios.get(`${API}/available-slots/range`, {
+        params: {
+          start: format(startOfMonth(visibleMonth), 'yyyy-MM-dd'),
+          end: format(endOfMonth(visibleMonth), 'yyyy-MM-dd'),
+          service_id: selectedService.id
+        }
+      });
+      setUnavailableDates(new Set(
+        response.data.days
+          .filter(day => day.closed || day.fully_booked)
+          .map(day => day.date)
+      ));
+    } catch (error) {
+      console.error('Error fetching month availability:', error);
+      setUnavailableDates(new Set());
+    }
+  };
+
   const fetchServices = async () => {
     try {
       const response = await axios.get(`${API}/services`);
@@ -228,6 +257,10 @@ export default function BookingFlow() {
     return date < today;
   };
 
+  const isDateDisabled = (date) => {
+    return isPastDate(date) || unavailableDates.has(format(date, 'yyyy-MM-dd'));
+  };
+
   // Configuração especial para o Calendário Espanhol começar no Domingo
   const getLocale = () => {
     if (language === 'pt') return ptBR;
@@ -311,7 +344,9 @@ export default function BookingFlow() {
                     mode="single"
                     selected={selectedDate}
                     onSelect={handleDateSelect}
-                    disabled={isPastDate}
+                    disabled={isDateDisabled}
+                    month={visibleMonth}
+                    onMonthChange={setVisibleMonth}
                     locale={getLocale()}
                     className="rounded-md border border-white/20 bg-black/40 text-white"
                     data-testid="booking-calendar"
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# server.py e os módulos auxiliares são importados como módulos de topo
+# (uvicorn roda com `cd backend`), então o backend precisa estar no path.
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+def _load_server():
+    """Import server.py against mongomock-motor (once); rate limits off."""
+    pytest.importorskip("httpx")
+    pytest.importorskip("mongomock_motor")
+    if "server" in sys.modules:
+        return sys.modules["server"]
+    import motor.motor_asyncio
+    from mongomock_motor import AsyncMongoMockClient
+
+    os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+    os.environ.setdefault("DB_NAME", "jhun_test")
+    os.environ["RATE_LIMITS"] = "off"
+    real_client = motor.motor_asyncio.AsyncIOMotorClient
+    motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+    try:
+        import server
+    finally:
+        motor.motor_asyncio.AsyncIOMotorClient = real_client
+    return server
+
+
+@pytest.fixture
+def api():
+    """Run ``scenario(client, server)`` against the app on an empty in-memory database.
+
+    The app goes through its real lifespan (indexes, seed services, default
+    barber), so routes behave as in production.
+    """
+    server = _load_server()
+    import httpx
+
+    def run(scenario):
+        async def main():
+            for name in await server.db.list_collection_names():
+                await server.db.drop_collection(name)
+            async with server.app.router.lifespan_context(server.app):
+                transport = httpx.ASGITransport(app=server.app, raise_app_exceptions=False)
+                async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                    return await scenario(client, server)
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,191 @@
+import asyncio
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from analytics import apply_changes, appointment_price, build_rollups, period_key, rollup_updates, summarize
+from schedule import DayTemplate
+
+PRICES = {"cut": 30, "beard": 15}
+NAMES = {"cut": "Haircut", "beard": "Beard"}
+
+
+class FakeRollups:
+    """Applies the ``UpdateOne`` upserts of ``apply_changes`` to plain dicts."""
+
+    def __init__(self):
+        self.docs = {}
+        self.round_trips = 0
+
+    async def bulk_write(self, ops, ordered=True):
+        self.round_trips += 1
+        for op in ops:
+            update = op._doc
+            doc = self.docs.setdefault(op._filter["date"], {"date": op._filter["date"], **update["$setOnInsert"]})
+            for path, amount in update.get("$inc", {}).items():
+                *parents, leaf = path.split(".")
+                target = doc
+                for key in parents:
+                    target = target.setdefault(key, {})
+                target[leaf] = target.get(leaf, 0) + amount
+            for path, value in update.get("$set", {}).items():
+                *parents, leaf = path.split(".")
+                target = doc
+                for key in parents:
+                    target = target.setdefault(key, {})
+                target[leaf] = value
+
+
+def nonzero(value):
+    # Contadores que voltaram a zero equivalem a ausentes
+    if isinstance(value, dict):
+        cleaned = {key: nonzero(item) for key, item in value.items()}
+        return {key: item for key, item in cleaned.items() if item not in (0, {})}
+    return value
+
+
+def random_appointment(rng, i):
+    service = rng.choice(list(PRICES))
+    return {
+        "id": str(i), "date": f"2025-03-{rng.randint(1, 5):02d}", "service_id": service,
+        "service_name": NAMES[service], "barber_id": rng.choice(["a", "b", None]),
+        "duration_minutes": rng.choice([20, 30, 45]),
+        "status": rng.choice(["scheduled", "completed", "no-show", "cancelled"]),
+        "price": PRICES[service],
+    }
+
+
+def test_incremental_updates_match_a_full_rebuild():
+    pytest.importorskip("pandas")
+    pytest.importorskip("pymongo")
+    rng = random.Random(7)
+    rollups, current = FakeRollups(), {}
+    for step in range(300):
+        if current and rng.random() < 0.4:
+            before = current.pop(rng.choice(list(current)))
+            after = None if rng.random() < 0.3 else {
+                **before, "status": rng.choice(["scheduled", "completed", "no-show", "cancelled"]),
+                "date": rng.choice([before["date"], "2025-03-06"]),
+            }
+        else:
+            before, after = None, random_appointment(rng, step)
+        if after:
+            current[after["id"]] = after
+        asyncio.run(apply_changes(rollups, [(before, after)], PRICES))
+
+    # O catálogo mudou depois: a reconstrução usa o preço gravado em cada agendamento
+    rebuilt = {doc["date"]: doc for doc in build_rollups(list(current.values()), {"cut": 99, "beard": 1})}
+    incremental = {date: doc for date, doc in rollups.docs.items() if nonzero(doc["appointments"])}
+    assert set(incremental) == set(rebuilt)
+    for date, doc in rebuilt.items():
+        assert nonzero(incremental[date]) == nonzero(doc)
+
+
+def test_status_change_moves_counters_in_one_write():
+    pytest.importorskip("pymongo")
+    apt = {"date": "2025-03-03", "service_id": "cut", "service_name": "Haircut", "barber_id": "a",
+           "duration_minutes": 30, "status": "scheduled"}
+    updates = rollup_updates([(apt, {**apt, "status": "completed"})], PRICES)
+    assert {path: n for path, n in updates["2025-03-03"]["inc"].items() if n} == {
+        "appointments.scheduled": -1, "appointments.completed": 1, "revenue": 30,
+        "services.cut.completed": 1, "services.cut.revenue": 30,
+    }
+    rollups = FakeRollups()
+    asyncio.run(apply_changes(rollups, [(apt, {**apt, "status": "no-show"}), (None, None)], PRICES))
+    assert rollups.round_trips == 1
+
+
+def test_period_keys():
+    assert period_key("2025-03-06", "week") == "2025-03-03"
+    assert period_key("2025-03-06", "month") == "2025-03"
+    assert period_key("2025-03-06", "year") == "2025"
+    assert period_key("2025-03-06", "day") == "2025-03-06"
+
+
+def test_summarize_buckets_rates_and_utilization():
+    docs = [
+        {"date": "2025-03-03", "appointments": {"completed": 3, "no-show": 1}, "revenue": 90, "booked_minutes": 120,
+         "services": {"cut": {"name": "Haircut", "count": 4, "completed": 3, "revenue": 90}}},
+        {"date": "2025-03-10", "appointments": {"scheduled": 2, "cancelled": 1}, "booked_minutes": 60,
+         "services": {"beard": {"name": "Beard", "count": 2}, "cut": {"name": "Haircut"}}},
+    ]
+    capacity = {f"2025-03-{day:02d}": 600 for day in range(3, 17)}
+    report = summarize(docs, capacity, "week")
+
+    assert [bucket["period"] for bucket in report["periods"]] == ["2025-03-03", "2025-03-10"]
+    first, second = report["periods"]
+    assert first["no_show_rate"] == 0.25 and first["utilization"] == round(120 / 4200, 4)
+    assert second["no_show_rate"] is None and second["revenue"] == 0
+    total = report["total"]
+    assert total["appointments"] == {"scheduled": 2, "completed": 3, "no-show": 1, "cancelled": 1}
+    assert total["capacity_minutes"] == 8400 and total["booked_minutes"] == 180
+    assert [row["service_id"] for row in total["services"]] == ["cut", "beard"]
+    assert total["services"][0]["count"] == 4
+
+
+def test_open_minutes_excludes_breaks():
+    assert DayTemplate(9 * 60, 18 * 60, breaks=((12 * 60, 13 * 60),)).open_minutes == 8 * 60
+    assert DayTemplate().open_minutes == 0
+
+
+def test_stored_price_wins_over_the_catalog():
+    assert appointment_price({"service_id": "cut", "price": 25}, PRICES) == 25
+    assert appointment_price({"service_id": "cut", "price": 0}, PRICES) == 0
+    assert appointment_price({"service_id": "cut"}, PRICES) == 30  # legado
+    pytest.importorskip("pandas")
+    rows = [{"date": "2025-03-03", "service_id": "cut", "status": "completed", "duration_minutes": 30, "price": 25},
+            {"date": "2025-03-03", "service_id": "cut", "status": "completed", "duration_minutes": 30}]
+    assert build_rollups(rows, PRICES)[0]["revenue"] == 55
+
+
+def test_dashboard_stats_match_the_seeded_appointments(api):
+    today = datetime.now(timezone.utc).date()
+    first = today.replace(day=1)
+    last_month = (first - timedelta(days=1)).isoformat()
+    today, first = today.isoformat(), first.isoformat()
+
+    async def scenario(client, server):
+        services = {s["name"]: s for s in (await client.get("/api/services")).json()}
+        cut, beard = services["Men's Haircut"], services["Beard"]
+
+        def apt(n, date, service, status, price=None):
+            return {"id": f"apt-{n}", "date": date, "time": "10:00 AM", "service_id": service["id"],
+                    "service_name": service["name"], "barber_id": None, "duration_minutes": service["duration_minutes"],
+                    "status": status, "price": service["price"] if price is None else price,
+                    "customer_name": "Ana", "customer_phone": f"55{n % 2}"}
+
+        await server.db.appointments.insert_many([
+            apt(1, first, cut, "completed"),
+            apt(2, first, cut, "completed", price=25),  # preço gravado na reserva
+            apt(3, today, beard, "completed"),
+            apt(4, today, cut, "scheduled"),
+            apt(5, today, cut, "scheduled"),
+            apt(6, today, cut, "no-show"),
+            apt(7, today, beard, "cancelled"),
+            apt(8, last_month, cut, "completed"),  # fora do mês
+        ])
+        await server.db.customers.insert_many([{"id": "c0", "phone": "550"}, {"id": "c1", "phone": "551"}])
+        await server.rebuild_rollups()
+        rebuilt = (await client.get("/api/dashboard/stats")).json()
+        # Caminho incremental: uma reserva concluída pela rota entra na hora
+        await client.patch("/api/appointments/apt-5", json={"status": "completed"})
+        return cut, beard, rebuilt, (await client.get("/api/dashboard/stats")).json()
+
+    cut, beard, rebuilt, updated = api(scenario)
+    revenue = cut["price"] + 25 + beard["price"]
+    assert rebuilt["today_appointments"] == 2
+    assert rebuilt["total_customers"] == 2
+    assert rebuilt["total_appointments"] == 3
+    assert rebuilt["monthly_revenue"] == revenue
+    assert {row["service_id"]: (row["appointments"], row["revenue"]) for row in rebuilt["revenue_by_service"]} == {
+        cut["id"]: (2, cut["price"] + 25), beard["id"]: (1, beard["price"])}
+    by_day = {}
+    for date, price in ((first, cut["price"]), (first, 25), (today, beard["price"])):
+        count, total = by_day.get(date, (0, 0))
+        by_day[date] = (count + 1, total + price)
+    assert {row["date"]: (row["appointments"], row["revenue"]) for row in rebuilt["revenue_by_day"]} == by_day
+
+    assert updated["today_appointments"] == 1
+    assert updated["total_appointments"] == 4
+    assert updated["monthly_revenue"] == revenue + cut["price"]
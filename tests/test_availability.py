@@ -0,0 +1,203 @@
+import random
+from datetime import datetime
+
+import pytest
+
+from availability import (
+    DayOccupancy,
+    candidate_starts,
+    format_minutes_12h,
+    parse_appointment_time,
+)
+
+
+def legacy_available_slots(appointments, blocked_slots, duration):
+    """Copy of the per-slot loop get_available_slots used before the engine."""
+    start_hour = 9
+    end_hour = 21
+    slot_interval = 30
+
+    slots_24h = []
+    current_minutes = start_hour * 60
+    end_minutes = end_hour * 60
+    while current_minutes < end_minutes:
+        hour = current_minutes // 60
+        minute = current_minutes % 60
+        if (current_minutes + duration) <= end_minutes:
+            slots_24h.append(f"{hour:02d}:{minute:02d}")
+        current_minutes += slot_interval
+
+    available_slots_24h = []
+    for slot_24h in slots_24h:
+        is_available = True
+        slot_hour, slot_minute = map(int, slot_24h.split(':'))
+        slot_minutes = slot_hour * 60 + slot_minute
+        slot_end_minutes = slot_minutes + duration
+
+        for apt in appointments:
+            try:
+                apt_time = apt['time']
+                if 'AM' in apt_time or 'PM' in apt_time:
+                    time_obj = datetime.strptime(apt_time, "%I:%M %p")
+                else:
+                    time_obj = datetime.strptime(apt_time, "%H:%M")
+                apt_start = time_obj.hour * 60 + time_obj.minute
+                apt_end = apt_start + apt['duration_minutes']
+                if not (slot_end_minutes <= apt_start or slot_minutes >= apt_end):
+                    is_available = False
+                    break
+            except Exception:
+                continue
+
+        if is_available:
+            for blocked in blocked_slots:
+                try:
+                    b_start_h, b_start_m = map(int, blocked['start_time'].split(':'))
+                    b_end_h, b_end_m = map(int, blocked['end_time'].split(':'))
+                    b_start = b_start_h * 60 + b_start_m
+                    b_end = b_end_h * 60 + b_end_m
+                    if not (slot_end_minutes <= b_start or slot_minutes >= b_end):
+                        is_available = False
+                        break
+                except Exception:
+                    continue
+
+        if is_available:
+            available_slots_24h.append(slot_24h)
+
+    return [
+        datetime.strptime(s, "%H:%M").strftime("%I:%M %p")
+        for s in available_slots_24h
+    ]
+
+
+SERVICE_DURATIONS = [10, 20, 25, 30, 40, 45, 60, 90]
+
+
+def random_day(rng):
+    appointments = []
+    for _ in range(rng.randint(0, 12)):
+        minutes = rng.randrange(8 * 60, 22 * 60, 5)
+        hour, minute = divmod(minutes, 60)
+        if rng.random() < 0.5:
+            time = f"{hour:02d}:{minute:02d}"
+        else:
+            time = datetime(2025, 1, 1, hour, minute).strftime("%I:%M %p")
+        appointments.append({"time": time, "duration_minutes": rng.choice(SERVICE_DURATIONS)})
+    blocked_slots = []
+    for _ in range(rng.randint(0, 3)):
+        start = rng.randrange(8 * 60, 21 * 60, 15)
+        end = start + rng.randrange(15, 180, 15)
+        blocked_slots.append({
+            "start_time": f"{start // 60:02d}:{start % 60:02d}",
+            "end_time": f"{end // 60:02d}:{end % 60:02d}",
+        })
+    return appointments, blocked_slots
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_engine_matches_legacy_loop(seed):
+    rng = random.Random(seed)
+    appointments, blocked_slots = random_day(rng)
+    occupancy = DayOccupancy.from_documents(appointments, blocked_slots)
+
+    for duration in SERVICE_DURATIONS:
+        expected = legacy_available_slots(appointments, blocked_slots, duration)
+        assert [format_minutes_12h(m) for m in occupancy.available_starts(duration)] == expected
+
+
+def test_malformed_documents_are_skipped_like_legacy():
+    appointments = [
+        {"time": "not a time", "duration_minutes": 30},
+        {"time": "10:00"},
+        {"time": None, "duration_minutes": 30},
+        {"time": "11:00 am", "duration_minutes": 30},
+        {"time": "02:00 PM", "duration_minutes": 60},
+    ]
+    blocked_slots = [{"start_time": "bad", "end_time": "12:00"}, {"start_time": "18:00"}]
+    occupancy = DayOccupancy.from_documents(appointments, blocked_slots)
+
+    expected = legacy_available_slots(appointments, blocked_slots, 30)
+    assert [format_minutes_12h(m) for m in occupancy.available_starts(30)] == expected
+    assert "02:00 PM" not in expected
+
+
+def test_empty_day_offers_every_grid_slot():
+    occupancy = DayOccupancy()
+    assert occupancy.available_starts(90) == candidate_starts(90)
+    assert candidate_starts(90)[-1] == 19 * 60 + 30
+
+
+def test_parse_appointment_time_formats():
+    assert parse_appointment_time("09:30") == 570
+    assert parse_appointment_time("12:15 AM") == 15
+    assert parse_appointment_time("12:15 PM") == 735
+    assert parse_appointment_time("25:00") is None
+
+
+def test_fit_mask_matches_per_start_test():
+    rng = random.Random(11)
+    for _ in range(100):
+        occupancy = DayOccupancy()
+        for _ in range(rng.randrange(8)):
+            start = rng.randrange(0, 24 * 60)
+            occupancy.occupy(start, start + rng.randrange(5, 120))
+        duration = rng.choice((1, 5, 20, 30, 45, 64, 90, 200))
+        fits = occupancy.fit_mask(duration)
+        for start in range(0, 24 * 60 - duration):
+            assert bool((fits >> start) & 1) == occupancy.is_free(start, duration)
+
+
+def test_range_endpoint_days_blocks_and_bookings(api):
+    async def scenario(client, server):
+        service = (await client.get("/api/services")).json()[0]
+        await client.post("/api/appointments", json={
+            "service_id": service["id"], "customer_name": "Ana", "customer_phone": "555",
+            "date": "2030-01-07", "time": "10:00 AM"})
+        await client.post("/api/blocked-slots", json={
+            "start_date": "2030-01-09", "end_date": "2030-01-09", "start_time": "09:00", "end_time": "21:00"})
+        await client.post("/api/blocked-slots", json={
+            "start_date": "2030-01-10", "end_date": "2030-01-10", "start_time": "12:00", "end_time": "13:00"})
+        week = await client.get("/api/available-slots/range", params={
+            "start": "2030-01-07", "end": "2030-01-13", "service_id": service["id"]})
+        single = await client.get("/api/available-slots/range", params={
+            "start": "2030-01-08", "end": "2030-01-08", "service_id": service["id"]})
+        return week.json(), single.json()
+
+    week, single = api(scenario)
+    days = {day["date"]: day for day in week["days"]}
+    assert list(days) == [f"2030-01-{n:02d}" for n in range(7, 14)]  # limites inclusivos
+    assert "10:00 AM" not in days["2030-01-07"]["available_slots"] and "10:30 AM" in days["2030-01-07"]["available_slots"]
+    assert days["2030-01-09"] == {"date": "2030-01-09", "closed": False, "fully_booked": True, "available_slots": []}
+    assert "12:00 PM" not in days["2030-01-10"]["available_slots"] and "01:00 PM" in days["2030-01-10"]["available_slots"]
+    assert days["2030-01-13"] == {"date": "2030-01-13", "closed": True, "fully_booked": False, "available_slots": []}
+    assert [day["date"] for day in single["days"]] == ["2030-01-08"]
+    assert single["days"][0]["available_slots"][0] == "09:00 AM"
+
+
+def test_range_endpoint_rejects_bad_ranges(api):
+    async def scenario(client, server):
+        service_id = (await client.get("/api/services")).json()[0]["id"]
+
+        async def fetch(start, end, service=service_id):
+            response = await client.get("/api/available-slots/range",
+                                        params={"start": start, "end": end, "service_id": service})
+            return response.status_code, response.json().get("detail")
+
+        return server.MAX_RANGE_DAYS, [
+            await fetch("2030-01-08", "2030-01-07"),
+            await fetch("2030-01-01", "2030-03-04"),  # 63 dias
+            await fetch("2030-01-01", "2030-03-03"),  # 62 dias: o máximo
+            await fetch("2030-01-01", "01/02/2030"),
+            await fetch("2030-01-01", "2030-01-02", service="nope"),
+        ]
+
+    max_days, results = api(scenario)
+    assert max_days == 62
+    assert results == [
+        (400, "Start date must not be after end date"),
+        (400, "Range is limited to 62 days"),
+        (200, None),
+        (400, "Invalid date format"),
+        (404, "Service not found"),
+    ]
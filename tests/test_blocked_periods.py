@@ -0,0 +1,97 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+from blocked_periods import applies_on, block_dates, compact_legacy_blocks, day_query, for_barber, windows_by_date
+
+VACATION = {"start_date": "2025-08-01", "end_date": "2025-08-31", "start_time": "09:00", "end_time": "21:00"}
+LUNCH_MON_WED = {"start_date": "2025-01-01", "end_date": "2025-12-31", "start_time": "12:00",
+                 "end_time": "13:00", "weekdays": [0, 2]}
+
+
+def test_applies_within_range_and_weekdays():
+    assert applies_on(VACATION, date(2025, 8, 1))
+    assert applies_on(VACATION, date(2025, 8, 31))
+    assert not applies_on(VACATION, date(2025, 9, 1))
+    assert applies_on(LUNCH_MON_WED, date(2025, 3, 3))      # segunda
+    assert not applies_on(LUNCH_MON_WED, date(2025, 3, 4))  # terça
+
+
+def test_block_dates_are_clipped_to_the_window():
+    assert list(block_dates(VACATION, "2025-08-30", "2025-09-15")) == ["2025-08-30", "2025-08-31"]
+    assert list(block_dates(LUNCH_MON_WED, "2025-03-03", "2025-03-09")) == ["2025-03-03", "2025-03-05"]
+
+
+def test_windows_by_date_merges_blocks():
+    windows = windows_by_date([VACATION, LUNCH_MON_WED], "2025-07-30", "2025-08-01")
+    assert windows == {
+        "2025-07-30": [{"start_minute": 720, "end_minute": 780, "barber_id": None}],
+        "2025-08-01": [{"start_minute": 540, "end_minute": 1260, "barber_id": None}],
+    }
+
+
+def test_shop_wide_windows_apply_to_every_barber():
+    windows = [{"start_time": "09:00", "end_time": "10:00", "barber_id": None},
+               {"start_time": "12:00", "end_time": "13:00", "barber_id": "ana"}]
+    assert for_barber(windows, "ana") == windows
+    assert for_barber(windows, "rui") == windows[:1]
+    assert day_query("2025-03-04", ["ana"])["barber_id"] == {"$in": [None, "ana"]}
+
+
+def test_day_query_filters_range_and_weekday():
+    assert day_query("2025-03-04") == {
+        "start_date": {"$lte": "2025-03-04"},
+        "end_date": {"$gte": "2025-03-04"},
+        "$or": [{"weekdays": None}, {"weekdays": 1}],
+    }
+
+
+class FakeBlocks:
+    def __init__(self, docs):
+        self.docs = {doc["id"]: dict(doc) for doc in docs}
+
+    def find(self, query, projection=None):
+        rows = sorted((dict(d) for d in self.docs.values() if "start_date" not in d), key=lambda d: d["date"])
+        return FakeCursor(rows)
+
+    async def bulk_write(self, ops, ordered=True):
+        from pymongo import DeleteMany
+
+        for op in ops:
+            if isinstance(op, DeleteMany):
+                for id in op._filter["id"]["$in"]:
+                    self.docs.pop(id)
+            else:
+                target = self.docs[op._filter["id"]]
+                target.update(op._doc["$set"])
+                for field in op._doc["$unset"]:
+                    target.pop(field, None)
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def sort(self, *args):
+        return self
+
+    async def to_list(self, length):
+        return self.rows
+
+
+def test_compacts_consecutive_per_day_rows():
+    pytest.importorskip("pymongo")
+    rows = [{"id": f"d{day}", "date": f"2025-08-{day:02d}", "start_time": "09:00", "end_time": "21:00",
+             "reason": "Férias"} for day in (1, 2, 3, 4, 6)]
+    rows.append({"id": "other", "date": "2025-08-02", "start_time": "12:00", "end_time": "13:00", "reason": None})
+    blocks = FakeBlocks(rows)
+
+    assert asyncio.run(compact_legacy_blocks(blocks)) == 6
+    ranges = sorted((d["id"], d["start_date"], d["end_date"]) for d in blocks.docs.values())
+    assert ranges == [
+        ("d1", "2025-08-01", "2025-08-04"),
+        ("d6", "2025-08-06", "2025-08-06"),
+        ("other", "2025-08-02", "2025-08-02"),
+    ]
+    assert all("date" not in d for d in blocks.docs.values())
@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import pytest
+
+from availability import DayOccupancy
+from bulk_import import DayIndex, customer_ops, read_rows
+
+
+async def chunked(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def rows(data: str, format: str, size: int = 5):
+    async def collect():
+        return [row async for row in read_rows(chunked(data.encode(), size), format)]
+    return asyncio.run(collect())
+
+
+def test_csv_rows_survive_any_chunking():
+    data = '﻿customer_name,time,notes\n"Silva, Ana",09:00 AM,"linha 1\nlinha 2"\nBob,14:30,\n\nCara,10:00\n'
+    for size in (1, 3, 7, 1000):
+        assert rows(data, "csv", size) == [
+            (1, {"customer_name": "Silva, Ana", "time": "09:00 AM", "notes": "linha 1\nlinha 2"}, None),
+            (2, {"customer_name": "Bob", "time": "14:30", "notes": None}, None),
+            (3, None, "Expected 3 columns, got 2"),
+        ]
+
+
+def test_ndjson_rows_report_bad_lines():
+    data = '{"customer_name": "Ana"}\n\n[1, 2]\n{oops\n{"customer_name": "Bob"}'
+    assert rows(data, "ndjson") == [
+        (1, {"customer_name": "Ana"}, None),
+        (2, None, "Row must be a JSON object"),
+        (3, None, "Invalid JSON"),
+        (4, {"customer_name": "Bob"}, None),
+    ]
+
+
+def test_day_index_picks_least_busy_free_chair():
+    index = DayIndex(None, None)
+    busy = DayOccupancy()
+    busy.occupy(9 * 60, 12 * 60)
+    index.days = {("2025-03-03", "ana"): busy, ("2025-03-03", "rui"): DayOccupancy()}
+
+    assert index.claim("2025-03-03", ["ana", "rui"], 13 * 60, 13 * 60 + 30) == "rui"
+    assert index.claim("2025-03-03", ["ana", "rui"], 13 * 60, 13 * 60 + 30) == "ana"
+    assert index.claim("2025-03-03", ["ana", "rui"], 13 * 60 + 15, 13 * 60 + 45) is None
+    assert index.claim("2025-03-04", ["ana"], 600, 630) is None
+
+
+def test_customer_ops_fold_a_chunk_per_phone():
+    pytest.importorskip("pymongo")
+    docs = [
+        {"customer_phone": "1", "customer_name": "Ana", "customer_email": None, "service_id": "cut",
+         "status": "completed", "date": "2025-01-10"},
+        {"customer_phone": "1", "customer_name": "Ana S.", "customer_email": "ana@x.com", "service_id": "cut",
+         "status": "no-show", "date": "2025-02-01"},
+        {"customer_phone": "2", "customer_name": "Bob", "customer_email": None, "service_id": "cut",
+         "status": "cancelled", "date": "2025-03-01"},
+    ]
+    ops = {op._filter["phone"]: op._doc for op in customer_ops(docs, {"cut": 30})}
+    assert ops["1"]["$inc"] == {"total_appointments": 2, "no_show_count": 1, "lifetime_spend": 30}
+    assert ops["1"]["$set"] == {"full_name": "Ana S.", "email": "ana@x.com"}
+    assert ops["1"]["$max"] == {"last_visit": "2025-01-10"}
+    assert ops["2"]["$inc"]["total_appointments"] == 0 and "$max" not in ops["2"]
+    assert ops["2"]["$setOnInsert"]["email"] is None
+
+
+def test_import_reports_row_numbers_and_validation_errors(api):
+    async def scenario(client, server):
+        base = {"service_name": "Men's Haircut", "customer_name": "Ana", "customer_phone": "555",
+                "date": "2030-01-07", "time": "10:00 AM"}
+        lines = [
+            base,
+            {**base, "customer_phone": None, "time": "11:00 AM"},
+            {**base, "duration_minutes": "long", "customer_name": ["Ana"], "time": "12:00 PM"},
+            {**base, "service_name": "Perm"},
+        ]
+        body = "\n".join(json.dumps(line) for line in lines)
+        response = await client.post("/api/appointments/import", content=body,
+                                     headers={"content-type": "application/x-ndjson"})
+        return response.status_code, response.json()
+
+    status, report = api(scenario)
+    assert status == 200
+    assert report["imported"] == 1 and report["rejected"] == 3
+    assert report["errors"] == [
+        {"row": 2, "error": "customer_phone: Field required"},
+        {"row": 3, "error": "customer_name: Input should be a valid string; "
+                            "duration_minutes: Input should be a valid integer, unable to parse string as an integer"},
+        {"row": 4, "error": "Unknown service"},
+    ]
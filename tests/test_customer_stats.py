@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from customer_stats import contribution
+
+PRICES = {"cut": 30, "beard": 15}
+
+
+def test_contribution_per_status():
+    assert contribution({"service_id": "cut", "status": "scheduled"}, PRICES) == {
+        "total_appointments": 1, "no_show_count": 0, "lifetime_spend": 0}
+    assert contribution({"service_id": "cut", "status": "completed"}, PRICES)["lifetime_spend"] == 30
+    assert contribution({"service_id": "beard", "status": "no-show"}, PRICES) == {
+        "total_appointments": 1, "no_show_count": 1, "lifetime_spend": 0}
+    assert contribution({"service_id": "cut", "status": "cancelled"}, PRICES)["total_appointments"] == 0
+
+
+def test_missing_appointment_or_service_contributes_nothing():
+    assert set(contribution(None, PRICES).values()) == {0}
+    assert contribution({"service_id": "gone", "status": "completed"}, PRICES)["lifetime_spend"] == 0
+
+
+def test_stored_price_wins_over_the_catalog():
+    apt = {"service_id": "cut", "status": "completed", "price": 25}
+    assert contribution(apt, PRICES)["lifetime_spend"] == 25
+    assert contribution({**apt, "price": None}, PRICES)["lifetime_spend"] == 30  # legado
+
+
+async def customers_by_phone(server):
+    docs = await server.db.customers.find({}, {"_id": 0, "id": 0}).to_list(None)
+    return {doc["phone"]: doc for doc in docs}
+
+
+async def book(client, phone, name="Ana", time="10:00 AM"):
+    service = (await client.get("/api/services")).json()[0]
+    body = {"service_id": service["id"], "customer_name": name, "customer_phone": phone,
+            "date": "2030-01-07", "time": time}
+    response = await client.post("/api/appointments", json=body)
+    assert response.status_code == 200, response.text
+    return service, response.json()
+
+
+def test_status_changes_after_a_price_change_match_a_recompute(api):
+    from customer_stats import recompute_all_customers
+
+    async def scenario(client, server):
+        service, apt = await book(client, "555")
+        await client.patch(f"/api/appointments/{apt['id']}", json={"status": "completed"})
+        completed = (await client.get("/api/customers/555")).json()
+        # O catálogo muda: desfazer o "completed" tira o que foi pago, não o preço novo
+        await server.db.services.update_one({"id": service["id"]}, {"$set": {"price": service["price"] + 20}})
+        server.services_cache.invalidate()
+        await client.patch(f"/api/appointments/{apt['id']}", json={"status": "cancelled"})
+        incremental = await customers_by_phone(server)
+        await recompute_all_customers(server.db.customers, server.db.appointments)
+        return service, completed, incremental, await customers_by_phone(server)
+
+    service, completed, incremental, rebuilt = api(scenario)
+    assert completed["lifetime_spend"] == service["price"] and completed["total_appointments"] == 1
+    assert incremental["555"]["lifetime_spend"] == 0 and incremental["555"]["total_appointments"] == 0
+    assert incremental == rebuilt
+
+
+def test_moving_a_booking_to_another_phone_creates_a_full_customer(api):
+    from customer_stats import recompute_all_customers
+
+    async def scenario(client, server):
+        await book(client, "555", time="11:00 AM")
+        _, apt = await book(client, "555")
+        await client.patch(f"/api/appointments/{apt['id']}", json={"status": "completed"})
+        await client.put(f"/api/appointments/{apt['id']}", json={"customer_phone": "777", "customer_name": "Bia"})
+        incremental = await customers_by_phone(server)
+        await recompute_all_customers(server.db.customers, server.db.appointments)
+        return apt, incremental, await customers_by_phone(server)
+
+    apt, incremental, rebuilt = api(scenario)
+    moved = incremental["777"]
+    assert moved["full_name"] == "Bia" and moved["email"] is None
+    assert moved["total_appointments"] == 1 and moved["lifetime_spend"] == apt["price"]
+    assert moved["last_visit"] == "2030-01-07"
+    assert incremental["555"]["total_appointments"] == 1 and incremental["555"]["lifetime_spend"] == 0
+    assert incremental == rebuilt
+
+
+def test_duplicate_phones_are_merged_before_the_unique_index():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    from customer_stats import merge_duplicate_customers
+
+    db = mongomock_motor.AsyncMongoMockClient().db
+
+    async def scenario():
+        # Duas primeiras reservas simultâneas no código antigo: dois documentos para o mesmo telefone
+        await db.customers.insert_many([
+            {"id": "c1", "phone": "555", "full_name": "Ana", "email": None, "total_appointments": 1},
+            {"id": "c2", "phone": "555", "full_name": "Ana", "email": "ana@x.com", "total_appointments": 1},
+            {"id": "c3", "phone": "777", "full_name": "Bia", "email": None, "total_appointments": 1},
+        ])
+        await db.appointments.insert_many([
+            {"id": "a1", "customer_phone": "555", "date": "2025-03-03", "status": "completed", "price": 30},
+            {"id": "a2", "customer_phone": "555", "date": "2025-03-04", "status": "scheduled", "price": 30},
+            {"id": "a3", "customer_phone": "777", "date": "2025-03-04", "status": "scheduled", "price": 15},
+        ])
+        removed = await merge_duplicate_customers(db.customers, db.appointments)
+        await db.customers.create_index("phone", unique=True)
+        return removed, await db.customers.find({}, {"_id": 0}).sort("phone", 1).to_list(None)
+
+    removed, docs = asyncio.run(scenario())
+    assert removed == 1
+    assert [doc["id"] for doc in docs] == ["c1", "c3"]
+    assert docs[0]["email"] == "ana@x.com"
+    assert (docs[0]["total_appointments"], docs[0]["lifetime_spend"], docs[0]["last_visit"]) == (2, 30, "2025-03-04")
+    assert docs[1]["total_appointments"] == 1 and "lifetime_spend" not in docs[1]  # telefone sem duplicado: intocado
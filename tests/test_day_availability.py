@@ -0,0 +1,123 @@
+import asyncio
+
+import pytest
+
+from availability import DayOccupancy
+from day_availability import DayAvailabilityStore
+
+DAY = "2030-01-07"  # segunda-feira
+
+
+def make_store():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    db = mongomock_motor.AsyncMongoMockClient().db
+    return db, DayAvailabilityStore(db.day_availability, db.appointments, db.blocked_slots)
+
+
+def booking(start_minute, barber_id="a", date=DAY, status="scheduled"):
+    return {"date": date, "barber_id": barber_id, "status": status,
+            "start_minute": start_minute, "end_minute": start_minute + 30}
+
+
+def busy(occupancy, start_minute):
+    return not occupancy.is_free(start_minute, 1)
+
+
+def test_a_slow_refresh_never_overwrites_a_newer_one():
+    db, store = make_store()
+
+    async def scenario():
+        await db.appointments.insert_one(booking(600))
+        await store.refresh(DAY, "a")  # seq 1
+        await db.appointments.insert_one(booking(660))
+        await store.refresh(DAY, "a")  # seq 2
+        # Um refresh que começou antes (seq 1) termina por último, com o bitmap velho
+        await store._store(DAY, "a", 1, DayOccupancy.from_documents([booking(600)]))
+        return await db.day_availability.find_one({"date": DAY, "barber_id": "a"}, {"_id": 0}), await store.get(DAY, "a")
+
+    doc, occupancy = asyncio.run(scenario())
+    assert doc["seq"] == doc["built_seq"] == 2
+    assert busy(occupancy, 600) and busy(occupancy, 660)
+
+
+def test_stale_days_are_rebuilt_on_read():
+    db, store = make_store()
+
+    async def scenario():
+        await store.refresh(DAY, "a")
+        # Escrita que não passou pelo refresh: só o seq avança
+        await db.appointments.insert_one(booking(600))
+        await db.day_availability.update_one({"date": DAY, "barber_id": "a"}, {"$inc": {"seq": 1}})
+        occupancy = await store.get(DAY, "a")
+        return occupancy, await db.day_availability.find_one({"date": DAY, "barber_id": "a"}, {"_id": 0})
+
+    occupancy, doc = asyncio.run(scenario())
+    assert busy(occupancy, 600)
+    assert doc["built_seq"] == doc["seq"]
+
+
+def test_blocks_invalidate_the_covered_days_of_their_barber():
+    db, store = make_store()
+    days = ["2030-01-07", "2030-01-08", "2030-01-09"]
+
+    async def scenario():
+        for day in days:
+            for barber_id in ("a", "b"):
+                await store.refresh(day, barber_id)
+        await db.blocked_slots.insert_one({"start_date": days[0], "end_date": days[1], "weekdays": None,
+                                           "barber_id": "a", "start_minute": 540, "end_minute": 600})
+        await store.invalidate_range(days[0], days[1], "a")
+        stale = {(doc["date"], doc["barber_id"]) async for doc in db.day_availability.find()
+                 if doc["built_seq"] != doc["seq"]}
+        return stale, {day: await store.get_many(day, ["a", "b"]) for day in days}
+
+    stale, occupancies = asyncio.run(scenario())
+    assert stale == {(days[0], "a"), (days[1], "a")}
+    assert busy(occupancies[days[0]]["a"], 540) and busy(occupancies[days[1]]["a"], 540)
+    assert not busy(occupancies[days[0]]["b"], 540)  # bloqueio de outro barbeiro
+    assert not busy(occupancies[days[2]]["a"], 540)  # fora do intervalo
+
+
+def test_get_many_rebuilds_only_the_stale_chairs():
+    db, store = make_store()
+    refreshed = []
+    refresh = store.refresh
+
+    async def counting_refresh(date, barber_id=None):
+        refreshed.append(barber_id)
+        return await refresh(date, barber_id)
+
+    async def scenario():
+        await db.appointments.insert_many([booking(600, "fresh"), booking(630, "stale"), booking(660, "missing")])
+        await store.refresh(DAY, "fresh")
+        await store.refresh(DAY, "stale")
+        await store.invalidate_range(DAY, DAY, "stale")
+        store.refresh = counting_refresh
+        return await store.get_many(DAY, ["fresh", "stale", "missing"])
+
+    occupancies = asyncio.run(scenario())
+    assert sorted(refreshed) == ["missing", "stale"]
+    assert busy(occupancies["fresh"], 600) and busy(occupancies["stale"], 630) and busy(occupancies["missing"], 660)
+    assert not busy(occupancies["fresh"], 630)
+
+
+def test_block_and_schedule_changes_reach_the_booking_page(api):
+    async def scenario(client, server):
+        service = (await client.get("/api/services")).json()[0]
+        params = {"date": DAY, "service_id": service["id"]}
+        before = (await client.get("/api/available-slots", params=params)).json()["available_slots"]
+        created = await client.post("/api/blocked-slots", json={
+            "start_date": DAY, "end_date": DAY, "start_time": "10:00", "end_time": "12:00"})
+        blocked = (await client.get("/api/available-slots", params=params)).json()["available_slots"]
+        # O horário de funcionamento não fica no bitmap: vale já na próxima leitura
+        config = (await client.get("/api/schedule")).json()
+        config["hours"]["0"] = {"open": "09:00", "close": "10:00"}
+        saved = await client.put("/api/schedule", json=config)
+        shortened = (await client.get("/api/available-slots", params=params)).json()["available_slots"]
+        return before, created.status_code, blocked, saved.status_code, shortened
+
+    before, created, blocked, saved, shortened = api(scenario)
+    assert created == 201 and saved == 200
+    assert "10:00 AM" in before and "11:30 AM" in before
+    assert "10:00 AM" not in blocked and "11:30 AM" not in blocked and "12:00 PM" in blocked
+    assert shortened == ["09:00 AM", "09:30 AM"]
@@ -0,0 +1,123 @@
+import asyncio
+import json
+
+from events import EventBroker
+
+
+def parse(frame):
+    lines = dict(line.split(": ", 1) for line in frame.strip().split("\n"))
+    return lines["event"], json.loads(lines["data"])
+
+
+def test_subscribers_receive_published_changes():
+    broker = EventBroker()
+
+    async def scenario():
+        stream = broker.stream()
+        assert (await stream.__anext__()).startswith("retry:")
+        broker.publish("appointments", "update", {"_id": "x", "id": "a1", "status": "completed"})
+        broker.publish("blocked_slots", "delete", id="b1")
+        frames = [await stream.__anext__(), await stream.__anext__()]
+        await stream.aclose()
+        return frames
+
+    (kind1, first), (kind2, second) = map(parse, asyncio.run(scenario()))
+    assert kind1 == "appointment" and first["data"] == {"id": "a1", "status": "completed"}
+    assert kind2 == "blocked_slot" and second == {"type": "blocked_slot", "op": "delete", "id": "b1", "data": None}
+    assert broker.subscribers == 0
+
+
+def test_slow_client_is_disconnected_instead_of_blocking():
+    broker = EventBroker(queue_size=2)
+
+    async def scenario():
+        stream = broker.stream()
+        await stream.__anext__()
+        for i in range(5):
+            broker.publish("customers", "insert", {"id": str(i)})
+        return [frame async for frame in stream]
+
+    assert asyncio.run(scenario()) == []
+    assert broker.subscribers == 0
+
+
+def test_heartbeat_when_idle():
+    broker = EventBroker(heartbeat=0.01)
+
+    async def scenario():
+        stream = broker.stream()
+        await stream.__anext__()
+        frame = await stream.__anext__()
+        await stream.aclose()
+        return frame
+
+    assert asyncio.run(scenario()) == ": ping\n\n"
+
+
+class FakeChangeStream:
+    def __init__(self, changes):
+        self.changes = changes
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for change in self.changes:
+            yield change
+
+
+class FakeDB:
+    def __init__(self, changes, pre_images=True):
+        self.changes = changes
+        self.pre_images = pre_images
+        self.commands = []
+
+    async def command(self, name, collection, **options):
+        from pymongo.errors import OperationFailure
+
+        if not self.pre_images:
+            raise OperationFailure("BSON field 'changeStreamPreAndPostImages' is an unknown field.")
+        self.commands.append((name, collection, options))
+
+    def watch(self, pipeline, **options):
+        return FakeChangeStream(self.changes)
+
+
+def test_change_stream_deletes_keep_the_app_id():
+    import pytest
+
+    pytest.importorskip("pymongo")
+    broker = EventBroker()
+    db = FakeDB([{
+        "operationType": "delete", "ns": {"coll": "appointments"}, "documentKey": {"_id": "oid"},
+        "fullDocumentBeforeChange": {"_id": "oid", "id": "a1", "status": "scheduled"},
+    }])
+
+    async def scenario():
+        stream = broker.stream()
+        await stream.__anext__()
+        await broker.watch_changes(db)
+        frame = await stream.__anext__()
+        await stream.aclose()
+        return frame
+
+    kind, event = parse(asyncio.run(scenario()))
+    assert kind == "appointment" and event["op"] == "delete" and event["id"] == "a1"
+    assert {collection for _, collection, _ in db.commands} == {"appointments", "customers", "blocked_slots"}
+
+
+def test_without_pre_images_events_stay_local():
+    import pytest
+
+    pytest.importorskip("pymongo")
+    broker = EventBroker()
+    db = FakeDB([{"operationType": "delete", "ns": {"coll": "appointments"}, "documentKey": {"_id": "oid"}}],
+                pre_images=False)
+    asyncio.run(broker.watch_changes(db))
+    assert broker.source == "local"
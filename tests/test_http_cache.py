@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from http_cache import CacheRule, HTTPCache, MongoVersions
+
+
+def make_client(versions=None):
+    calls = {"slots": 0}
+
+    async def slots(request):
+        calls["slots"] += 1
+        return JSONResponse({"available_slots": ["09:00 AM"]})
+
+    async def block(request):
+        return JSONResponse({"ok": True}, status_code=201)
+
+    async def broken(request):
+        return JSONResponse({"detail": "nope"}, status_code=400)
+
+    app = Starlette(routes=[
+        Route("/api/available-slots", slots),
+        Route("/api/blocked-slots", block, methods=["POST"]),
+        Route("/api/appointments", broken, methods=["POST"]),
+    ])
+    cache = HTTPCache(
+        rules={"/api/available-slots": CacheRule(["appointments", "blocked_slots"], "no-cache")},
+        writes=[("/api/appointments", ["appointments"]), ("/api/blocked-slots", ["blocked_slots"])],
+        versions=versions,
+    )
+    app.middleware("http")(cache.middleware)
+    return TestClient(app), cache, calls
+
+
+def test_conditional_get_skips_the_handler():
+    client, cache, calls = make_client()
+    first = client.get("/api/available-slots?date=2025-01-02")
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == "no-cache"
+
+    again = client.get("/api/available-slots?date=2025-01-02", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    assert calls["slots"] == 1
+    assert cache.hits == 1
+
+    other_day = client.get("/api/available-slots?date=2025-01-03", headers={"If-None-Match": etag})
+    assert other_day.status_code == 200
+
+
+def test_successful_writes_change_the_etag():
+    client, cache, calls = make_client()
+    etag = client.get("/api/available-slots").headers["etag"]
+
+    client.post("/api/appointments")  # falhou: versão não muda
+    assert client.get("/api/available-slots", headers={"If-None-Match": etag}).status_code == 304
+
+    client.post("/api/blocked-slots")
+    fresh = client.get("/api/available-slots", headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+    assert fresh.headers["etag"] != etag
+
+
+def test_workers_sharing_mongo_versions_see_each_others_writes():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    collection = mongomock_motor.AsyncMongoMockClient().db.cache_versions
+    worker_a, _, _ = make_client(MongoVersions(collection))
+    worker_b, _, calls_b = make_client(MongoVersions(collection))
+
+    etag = worker_a.get("/api/available-slots").headers["etag"]
+    assert worker_b.get("/api/available-slots", headers={"If-None-Match": etag}).status_code == 304
+
+    worker_a.post("/api/blocked-slots")
+    stale = worker_b.get("/api/available-slots", headers={"If-None-Match": etag})
+    assert stale.status_code == 200 and calls_b["slots"] == 1
+
+    # Coleção apagada: o contador volta ao mesmo número, mas com outro token
+    asyncio.run(collection.drop())
+    worker_a.post("/api/blocked-slots")
+    assert worker_b.get("/api/available-slots", headers={"If-None-Match": stale.headers["etag"]}).status_code == 200
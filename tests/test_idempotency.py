@@ -0,0 +1,104 @@
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from idempotency import IdempotencyConflict, IdempotencyStore, fingerprint
+
+
+def make_store(**kwargs):
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    collection = mongomock_motor.AsyncMongoMockClient().db.idempotency_keys
+
+    async def setup():
+        await collection.create_index("key", unique=True)
+        return IdempotencyStore(collection, **kwargs)
+
+    return asyncio.run(setup())
+
+
+def test_fingerprint_ignores_key_order():
+    assert fingerprint({"a": 1, "b": "x"}) == fingerprint({"b": "x", "a": 1})
+    assert fingerprint({"a": 1}) != fingerprint({"a": 2})
+
+
+def test_retry_gets_the_stored_response():
+    store = make_store()
+
+    async def scenario():
+        assert await store.begin("k1", "h") is None
+        await store.finish("k1", 200, {"id": "apt-1"})
+        return await store.begin("k1", "h")
+
+    assert asyncio.run(scenario()) == {"status_code": 200, "body": {"id": "apt-1"}}
+    assert store.replays == 1
+
+
+def test_reused_key_and_concurrent_retry_are_rejected():
+    store = make_store()
+
+    async def scenario():
+        await store.begin("k1", "h")
+        with pytest.raises(IdempotencyConflict) as in_progress:
+            await store.begin("k1", "h")
+        with pytest.raises(IdempotencyConflict) as reused:
+            await store.begin("k1", "other")
+        with pytest.raises(IdempotencyConflict) as too_long:
+            await store.begin("k" * 300, "h")
+        return in_progress.value.status_code, reused.value.status_code, too_long.value.status_code
+
+    assert asyncio.run(scenario()) == (409, 422, 400)
+
+
+def test_failed_or_abandoned_requests_free_the_key():
+    store = make_store(lease=timedelta(seconds=-1))  # o lease já nasce vencido
+
+    async def scenario():
+        await store.begin("failed", "h")
+        await store.release("failed")
+        released = await store.begin("failed", "h")
+        await store.begin("abandoned", "h")
+        taken_over = await store.begin("abandoned", "h")  # lease vencido
+        return released, taken_over
+
+    assert asyncio.run(scenario()) == (None, None)
+
+
+def test_retry_after_a_failed_side_effect_replays_the_booking(api, monkeypatch):
+    async def scenario(client, server):
+        async def broken_notifications(apt):
+            raise RuntimeError("provider down")
+
+        monkeypatch.setattr(server, "notify_booking", broken_notifications)
+        service = (await client.get("/api/services")).json()[0]
+        body = {"service_id": service["id"], "customer_name": "Ana", "customer_phone": "555",
+                "date": "2030-01-07", "time": "10:00 AM"}
+        first = await client.post("/api/appointments", json=body, headers={"Idempotency-Key": "k1"})
+        retry = await client.post("/api/appointments", json=body, headers={"Idempotency-Key": "k1"})
+        return first.status_code, retry, await server.db.appointments.count_documents({})
+
+    first, retry, stored = api(scenario)
+    assert first == 500  # a reserva foi gravada; só a notificação falhou
+    assert retry.status_code == 200 and retry.headers["idempotent-replayed"] == "true"
+    assert stored == 1
+
+
+def test_replays_do_not_spend_the_phone_rate_limit(api, monkeypatch):
+    from rate_limit import Limit, RateLimiter
+
+    async def scenario(client, server):
+        monkeypatch.setattr(server, "rate_limiter", RateLimiter({"booking_phone": Limit(1, 3600)}, {}))
+        service = (await client.get("/api/services")).json()[0]
+        body = {"service_id": service["id"], "customer_name": "Ana", "customer_phone": "555",
+                "date": "2030-01-07", "time": "10:00 AM"}
+        first = await client.post("/api/appointments", json=body, headers={"Idempotency-Key": "k1"})
+        retries = [await client.post("/api/appointments", json=body, headers={"Idempotency-Key": "k1"})
+                   for _ in range(3)]
+        other = {**body, "time": "11:00 AM"}
+        limited = [await client.post("/api/appointments", json=other, headers={"Idempotency-Key": "k2"})
+                   for _ in range(2)]
+        return first.status_code, [r.status_code for r in retries], [r.status_code for r in limited]
+
+    first, retries, limited = api(scenario)
+    assert first == 200 and retries == [200, 200, 200]
+    assert limited == [429, 429]  # chave nova paga o limite; o 429 libera a chave (não vira 409)
@@ -0,0 +1,131 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("httpx")
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from metrics import Metrics
+
+
+def command(name, micros):
+    return SimpleNamespace(command_name=name, duration_micros=micros)
+
+
+def make_client():
+    metrics = Metrics()
+
+    app = FastAPI()
+
+    @app.get("/items/{item_id}")
+    async def item(item_id: str):
+        # Motor roda os comandos em threads do executor, com o contexto copiado
+        await asyncio.to_thread(metrics.command_listener.succeeded, command("find", 2000))
+        await asyncio.to_thread(metrics.command_listener.succeeded, command("update", 1000))
+        return {"id": item_id}
+
+    @app.post("/fail")
+    async def fail():
+        metrics.command_listener.failed(command("insert", 500))
+        return JSONResponse({"detail": "nope"}, status_code=400)
+
+    @app.get("/metrics")
+    def get_metrics():
+        return metrics.response()
+
+    app.middleware("http")(metrics.middleware)
+    return TestClient(app), metrics
+
+
+def test_requests_are_labelled_by_route_template():
+    client, metrics = make_client()
+    client.get("/items/1")
+    client.get("/items/2")
+    client.post("/fail")
+    client.get("/nowhere")
+
+    text = client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/items/{item_id}",status="200"} 2' in text
+    assert 'http_requests_total{method="POST",route="/fail",status="400"} 1' in text
+    assert 'http_requests_total{method="GET",route="unmatched",status="404"} 1' in text
+    assert 'http_request_duration_seconds_count{method="GET",route="/items/{item_id}"} 2' in text
+    assert "/metrics" not in text
+
+
+def test_db_commands_are_attributed_to_the_request():
+    client, metrics = make_client()
+    client.get("/items/1")
+    client.post("/fail")
+
+    text = metrics.render()
+    assert 'db_commands_total{route="/items/{item_id}",command="find",outcome="ok"} 1' in text
+    assert 'db_commands_total{route="/fail",command="insert",outcome="error"} 1' in text
+    assert 'db_round_trips_per_request_bucket{route="/items/{item_id}",le="2"} 1' in text
+    assert 'db_round_trips_per_request_bucket{route="/items/{item_id}",le="1"} 0' in text
+    assert 'db_time_per_request_seconds_sum{route="/items/{item_id}"} 0.003' in text
+
+
+def test_commands_outside_a_request_are_background():
+    metrics = Metrics()
+    metrics.command_listener.succeeded(command("getMore", 100))
+    assert 'db_commands_total{route="background",command="getMore",outcome="ok"} 1' in metrics.render()
+
+
+def test_outbound_calls_record_outcome():
+    metrics = Metrics()
+    with metrics.outbound("twilio"):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.outbound("sendgrid"):
+            raise RuntimeError("down")
+
+    text = metrics.render()
+    assert 'outbound_request_duration_seconds_count{provider="twilio",outcome="ok"} 1' in text
+    assert 'outbound_request_duration_seconds_count{provider="sendgrid",outcome="error"} 1' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    metrics = Metrics()
+    for value in (0.001, 0.02, 30):
+        metrics.latency.observe((("route", "/x"),), value)
+
+    lines = metrics.render().splitlines()
+    assert 'http_request_duration_seconds_bucket{route="/x",le="0.005"} 1' in lines
+    assert 'http_request_duration_seconds_bucket{route="/x",le="0.025"} 2' in lines
+    assert 'http_request_duration_seconds_bucket{route="/x",le="10.0"} 2' in lines
+    assert 'http_request_duration_seconds_bucket{route="/x",le="+Inf"} 3' in lines
+
+
+def test_collected_values_are_read_at_scrape_time():
+    metrics = Metrics()
+    state = {"pending": 1}
+    metrics.gauge("notifications_pending", "Pending.", lambda: state["pending"])
+    metrics.gauge("cache_hits_total", "Hits.", lambda: 7, "counter")
+    state["pending"] = 4
+
+    text = metrics.render()
+    assert "# TYPE notifications_pending gauge\nnotifications_pending 4" in text
+    assert "# TYPE cache_hits_total counter\ncache_hits_total 7" in text
+
+
+def test_pool_listener_tracks_connections_and_waits():
+    metrics = Metrics()
+    pool = metrics.pool_listener
+    event = SimpleNamespace(address=("localhost", 27017), connection_id=1, reason="timeout")
+    for _ in range(2):
+        pool.connection_created(event)
+        pool.connection_check_out_started(event)
+        pool.connection_checked_out(event)
+    pool.connection_checked_in(event)
+    pool.connection_check_out_started(event)
+    assert (pool.open, pool.checked_out, pool.waiting) == (2, 1, 1)
+    pool.connection_check_out_failed(event)
+
+    text = metrics.render()
+    assert "mongo_pool_connections 2" in text and "mongo_pool_checked_out 1" in text
+    assert "mongo_pool_waiting 0" in text
+    assert "mongo_pool_checkout_wait_seconds_count 2" in text
+    assert 'mongo_pool_checkout_failures_total{reason="timeout"} 1' in text
@@ -0,0 +1,156 @@
+import asyncio
+import time
+
+import pytest
+
+from notifications import FAILED, PENDING, SENDING, SENT, NotificationDispatcher
+
+
+def matches(doc, query):
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(matches(doc, option) for option in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = doc.get(key)
+            for op, arg in cond.items():
+                if op == "$in" and value not in arg:
+                    return False
+                if value is None and op in ("$lt", "$lte"):
+                    return False
+                if op == "$lt" and not value < arg or op == "$lte" and not value <= arg:
+                    return False
+        elif doc.get(key) != cond:
+            return False
+    return True
+
+
+class FakeOutbox:
+    def __init__(self, docs=()):
+        self.docs = {doc["id"]: dict(doc) for doc in docs}
+
+    async def insert_one(self, doc):
+        self.docs[doc["id"]] = dict(doc)
+
+    async def update_one(self, query, update):
+        doc = self.docs[query["id"]]
+        doc.update(update["$set"])
+        for field in update.get("$unset", {}):
+            doc.pop(field, None)
+
+    async def find_one_and_update(self, query, update, projection=None, return_document=None):
+        # Atômico como no MongoDB: nada de await entre o teste e a escrita
+        doc = self.docs.get(query["id"])
+        if doc is None or not matches(doc, query):
+            return None
+        doc.update(update["$set"])
+        return dict(doc)
+
+    def find(self, query, projection=None):
+        async def cursor():
+            for doc in list(self.docs.values()):
+                if matches(doc, query):
+                    yield dict(doc)
+        return cursor()
+
+
+class FlakyProvider:
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.sent = []
+
+    def __call__(self, payload):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("provider down")
+        self.sent.append(payload)
+
+
+def run(dispatcher, *messages):
+    async def scenario():
+        await dispatcher.start()
+        jobs = [await dispatcher.enqueue(channel, payload) for channel, payload in messages]
+        await dispatcher.drain()
+        await dispatcher.stop()
+        return jobs
+    return asyncio.run(scenario())
+
+
+def test_messages_are_delivered_and_marked_sent():
+    outbox, email = FakeOutbox(), FlakyProvider()
+    dispatcher = NotificationDispatcher(outbox, {"email": email}, base_delay=0)
+
+    jobs = run(dispatcher, ("email", {"n": 1}), ("email", {"n": 2}))
+
+    assert sorted(p["n"] for p in email.sent) == [1, 2]
+    assert all(outbox.docs[job["id"]]["status"] == SENT for job in jobs)
+
+
+def test_failures_are_retried_then_given_up():
+    outbox = FakeOutbox()
+    whatsapp, email = FlakyProvider(failures=2), FlakyProvider(failures=10)
+    dispatcher = NotificationDispatcher(
+        outbox, {"whatsapp": whatsapp, "email": email}, max_attempts=3, base_delay=0.001
+    )
+
+    retried, dropped = run(dispatcher, ("whatsapp", {"body": "hi"}), ("email", {"n": 1}))
+
+    assert whatsapp.sent == [{"body": "hi"}]
+    assert outbox.docs[retried["id"]]["status"] == SENT
+    assert outbox.docs[retried["id"]]["attempts"] == 3
+    assert outbox.docs[dropped["id"]]["status"] == FAILED
+    assert outbox.docs[dropped["id"]]["last_error"] == "provider down"
+
+
+def test_pending_outbox_rows_survive_restart():
+    pending = {"id": "old", "channel": "email", "payload": {"n": 7}, "status": PENDING,
+               "attempts": 1, "next_attempt_at": 0}
+    outbox, email = FakeOutbox([pending]), FlakyProvider()
+
+    run(NotificationDispatcher(outbox, {"email": email}))
+
+    assert email.sent == [{"n": 7}]
+    assert outbox.docs["old"]["status"] == SENT
+
+
+def test_overlapping_processes_send_a_pending_row_once():
+    pytest.importorskip("pymongo")
+    pending = {"id": "old", "channel": "whatsapp", "payload": {"n": 7}, "status": PENDING,
+               "attempts": 0, "next_attempt_at": 0}
+    outbox, whatsapp = FakeOutbox([pending]), FlakyProvider()
+    first, second = (NotificationDispatcher(outbox, {"whatsapp": whatsapp}) for _ in range(2))
+
+    async def scenario():
+        await first.start()
+        await second.start()
+        await first.drain()
+        await second.drain()
+        await first.stop()
+        await second.stop()
+
+    asyncio.run(scenario())
+    assert whatsapp.sent == [{"n": 7}]
+    assert outbox.docs["old"]["status"] == SENT and "finished_at" in outbox.docs["old"]
+    assert "locked_until" not in outbox.docs["old"]
+
+
+def test_rows_of_a_dead_sender_wait_for_the_lease():
+    pytest.importorskip("pymongo")
+    now = time.time()
+    rows = [
+        {"id": "live", "channel": "email", "payload": {"n": 1}, "status": SENDING,
+         "attempts": 0, "next_attempt_at": 0, "locked_until": now + 60},
+        {"id": "dead", "channel": "email", "payload": {"n": 2}, "status": SENDING,
+         "attempts": 0, "next_attempt_at": 0, "locked_until": now - 1},
+    ]
+    outbox, email = FakeOutbox(rows), FlakyProvider()
+    dispatcher = NotificationDispatcher(outbox, {"email": email})
+
+    async def scenario():
+        await dispatcher.start()
+        await asyncio.sleep(0.05)
+        await dispatcher.stop(timeout=0.01)
+
+    asyncio.run(scenario())
+    assert email.sent == [{"n": 2}]
+    assert outbox.docs["live"]["status"] == SENDING
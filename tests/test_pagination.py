@@ -0,0 +1,144 @@
+import asyncio
+import functools
+
+import pytest
+
+from pagination import ASC, DESC, decode_cursor, encode_cursor, paginate
+
+
+def matches(doc, query):
+    for key, cond in query.items():
+        if key == "$and":
+            if not all(matches(doc, q) for q in cond):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, q) for q in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = doc.get(key)
+            for op, operand in cond.items():
+                if op == "$ne" and value == operand:
+                    return False
+                if op in ("$gt", "$lt") and (value is None or operand is None):
+                    return False
+                if op == "$gt" and not value > operand:
+                    return False
+                if op == "$lt" and not value < operand:
+                    return False
+        elif doc.get(key) != cond:
+            return False
+    return True
+
+
+def mongo_order(sort):
+    def compare(a, b):
+        for field, direction in sort:
+            x, y = a.get(field), b.get(field)
+            if x == y:
+                continue
+            # null ordena antes de qualquer string, como no MongoDB
+            less = x is None or (y is not None and x < y)
+            return (-1 if less else 1) * direction
+        return 0
+    return functools.cmp_to_key(compare)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, sort):
+        self.docs = sorted(self.docs, key=mongo_order(sort))
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length):
+        return self.docs
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(d) for d in self.docs if matches(d, query)])
+
+
+def walk(collection, sort, limit):
+    async def scenario():
+        pages, after = [], None
+        while True:
+            items, after = await paginate(collection, {}, sort, limit, after)
+            pages.append([d["id"] for d in items])
+            if after is None:
+                return pages
+    return asyncio.run(scenario())
+
+
+def test_pages_cover_every_row_once_with_ties():
+    docs = [{"id": f"{i:03d}", "date": f"2025-01-{i % 4 + 1:02d}", "time": "10:00"} for i in range(23)]
+    sort = [("date", ASC), ("time", ASC), ("id", ASC)]
+    pages = walk(FakeCollection(docs), sort, 5)
+
+    flat = [i for page in pages for i in page]
+    expected = [d["id"] for d in sorted(docs, key=mongo_order(sort))]
+    assert flat == expected
+    assert [len(p) for p in pages] == [5, 5, 5, 5, 3]
+
+
+def test_descending_keys_keep_null_rows():
+    docs = [{"id": str(i), "last_visit": None if i % 3 == 0 else f"2025-02-{i:02d}"} for i in range(1, 11)]
+    sort = [("last_visit", DESC), ("id", ASC)]
+    flat = [i for page in walk(FakeCollection(docs), sort, 3) for i in page]
+
+    assert flat == [d["id"] for d in sorted(docs, key=mongo_order(sort))]
+    assert flat[-3:] == ["3", "6", "9"]
+
+
+def test_cursor_round_trip_and_validation():
+    assert decode_cursor(encode_cursor(["2025-01-01", None, "x"]), 3) == ["2025-01-01", None, "x"]
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor", 3)
+    with pytest.raises(ValueError):
+        decode_cursor(encode_cursor(["a"]), 3)
+
+
+def test_customer_history_pages_newest_first(api):
+    async def scenario(client, server):
+        service_id = (await client.get("/api/services")).json()[0]["id"]
+        for date in ("2030-01-07", "2030-01-08", "2030-01-09"):
+            for time in ("10:00 AM", "02:00 PM"):
+                await client.post("/api/appointments", json={
+                    "service_id": service_id, "customer_name": "Ana", "customer_phone": "555",
+                    "date": date, "time": time})
+        await client.post("/api/appointments", json={
+            "service_id": service_id, "customer_name": "Bia", "customer_phone": "777",
+            "date": "2030-01-08", "time": "11:00 AM"})
+
+        pages, after = [], None
+        while True:
+            params = {"limit": 4, **({"after": after} if after else {})}
+            page = (await client.get("/api/customers/555/appointments", params=params)).json()
+            pages.append([(apt["date"], apt["time"]) for apt in page["items"]])
+            after = page["next_cursor"]
+            if not after:
+                break
+        window = (await client.get("/api/customers/555/appointments",
+                                   params={"start": "2030-01-08", "end": "2030-01-08"})).json()
+        empty = await client.get("/api/customers/555/appointments", params={"start": "2031-01-01"})
+        unknown = await client.get("/api/customers/999/appointments")
+        bad_cursor = await client.get("/api/customers/555/appointments", params={"after": "nope"})
+        return pages, window, empty, unknown, bad_cursor.status_code
+
+    pages, window, empty, unknown, bad_cursor = api(scenario)
+    assert pages == [
+        [("2030-01-09", "02:00 PM"), ("2030-01-09", "10:00 AM"), ("2030-01-08", "02:00 PM"), ("2030-01-08", "10:00 AM")],
+        [("2030-01-07", "02:00 PM"), ("2030-01-07", "10:00 AM")],
+    ]
+    assert [(apt["date"], apt["time"]) for apt in window["items"]] == [("2030-01-08", "02:00 PM"), ("2030-01-08", "10:00 AM")]
+    assert empty.status_code == 200 and empty.json() == {"items": [], "next_cursor": None}
+    assert unknown.status_code == 404 and unknown.json() == {"detail": "Customer not found"}
+    assert bad_cursor == 400
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+from rate_limit import Limit, LocalBuckets, MongoBuckets, RateLimiter, normalize_phone
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_limit_parse():
+    limit = Limit.parse("120/60")
+    assert (limit.capacity, limit.period, limit.rate) == (120, 60.0, 2.0)
+    for bad in ("120", "x/60", "0/60", "10/0"):
+        with pytest.raises(ValueError):
+            Limit.parse(bad)
+
+
+def test_bucket_allows_a_burst_then_refills_evenly():
+    clock = Clock()
+    buckets = LocalBuckets(clock=clock)
+    limit = Limit(3, 30)  # 1 token a cada 10 s
+    assert [buckets.take("ip", limit) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take("ip", limit) == pytest.approx(10)
+    assert buckets.take("other", limit) == 0
+    clock.now += 5
+    assert buckets.take("ip", limit) == pytest.approx(5)
+    clock.now += 5
+    assert buckets.take("ip", limit) == 0
+    clock.now += 1000
+    assert [buckets.take("ip", limit) for _ in range(4)][-1] > 0  # não acumula além da capacidade
+
+
+def test_local_buckets_are_bounded():
+    buckets = LocalBuckets(max_keys=2, clock=Clock())
+    limit = Limit(1, 60)
+    for key in ("a", "b", "c"):
+        buckets.take(key, limit)
+    assert len(buckets) == 2
+    assert buckets.take("a", limit) == 0  # esquecido = cheio de novo
+    assert buckets.take("c", limit) > 0
+
+
+def test_phone_numbers_share_a_bucket_whatever_the_format():
+    assert normalize_phone("+1 (555) 010-2030") == normalize_phone("15550102030") == "15550102030"
+
+
+class Shared:
+    def __init__(self, wait=0.0, error=None):
+        self.wait, self.error, self.calls = wait, error, 0
+
+    async def take(self, key, limit):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.wait
+
+
+def test_shared_backend_only_sees_requests_the_local_bucket_allowed():
+    shared = Shared(wait=7.0)
+    limiter = RateLimiter({"booking": Limit(2, 60)}, {}, shared=shared, local=LocalBuckets(clock=Clock()))
+    waits = [asyncio.run(limiter.hit("booking", "1.2.3.4")) for _ in range(4)]
+    assert waits[:2] == [7.0, 7.0] and all(waits)
+    assert shared.calls == 2 and limiter.rejected == 4
+
+    down = RateLimiter({"booking": Limit(2, 60)}, {}, shared=Shared(error=RuntimeError("no db")))
+    assert asyncio.run(down.hit("booking", "1.2.3.4")) == 0
+
+
+def test_mongo_buckets_refill_and_take_atomically():
+    mongomock_motor = pytest.importorskip("mongomock_motor")
+    clock = Clock()
+    buckets = MongoBuckets(mongomock_motor.AsyncMongoMockClient().db.rate_limits, clock=clock)
+    limit = Limit(2, 20)
+
+    async def takes(n):
+        return [await buckets.take("booking:ip", limit) for _ in range(n)]
+
+    assert asyncio.run(takes(3)) == [0, 0, pytest.approx(10)]
+    clock.now += 10
+    assert asyncio.run(takes(2)) == [0, pytest.approx(10)]
+
+
+def make_client(proxy_hops=0):
+    pytest.importorskip("httpx")
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse
+    from starlette.routing import Route
+    from starlette.testclient import TestClient
+
+    calls = {"slots": 0}
+
+    async def slots(request):
+        calls["slots"] += 1
+        return JSONResponse({"available_slots": []})
+
+    limiter = RateLimiter(
+        {"slots": Limit(2, 60)}, {("GET", "/api/available-slots"): "slots"},
+        proxy_hops=proxy_hops, local=LocalBuckets(clock=Clock()),
+    )
+    app = Starlette(routes=[Route("/api/available-slots", slots), Route("/api/services", slots)])
+    app.middleware("http")(limiter.middleware)
+    return TestClient(app), calls
+
+
+def test_middleware_rejects_before_the_handler():
+    client, calls = make_client()
+    statuses = [client.get("/api/available-slots").status_code for _ in range(3)]
+    assert statuses == [200, 200, 429] and calls["slots"] == 2
+    response = client.get("/api/available-slots")
+    assert response.json() == {"detail": "Too many requests"} and response.headers["retry-after"] == "30"
+    assert client.get("/api/services").status_code == 200  # rota sem limite
+
+
+def test_client_ip_comes_from_the_trusted_proxy_hop():
+    client, calls = make_client(proxy_hops=1)
+    for _ in range(2):
+        client.get("/api/available-slots", headers={"X-Forwarded-For": "6.6.6.6, 10.0.0.1"})
+    assert client.get("/api/available-slots", headers={"X-Forwarded-For": "7.7.7.7, 10.0.0.1"}).status_code == 429
+    assert client.get("/api/available-slots", headers={"X-Forwarded-For": "10.0.0.2"}).status_code == 200
@@ -0,0 +1,156 @@
+import asyncio
+import random
+
+import pytest
+
+pytest.importorskip("pymongo")
+from pymongo.errors import BulkWriteError
+
+from reservations import SlotUnavailable, claim_cells, release, reserve
+
+
+class FakeClaims:
+    """In-memory slot_claims with the unique (date, barber_id, cell) index.
+
+    With ``rng``, each round trip yields a random number of times, so
+    concurrent bookings interleave in a different order on every call.
+    """
+
+    def __init__(self, rng=None):
+        self.docs = {}
+        self.rng = rng
+
+    async def _round_trip(self):
+        for _ in range(self.rng.randrange(4) if self.rng else 1):
+            await asyncio.sleep(0)  # deixa as outras requisições intercalarem
+
+    async def insert_many(self, docs, ordered=True):
+        errors = []
+        for i, doc in enumerate(docs):
+            await self._round_trip()
+            key = (doc["date"], doc.get("barber_id"), doc["cell"])
+            if key in self.docs:
+                errors.append({"index": i, "code": 11000})
+                if ordered:
+                    break
+            else:
+                self.docs[key] = dict(doc)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    def _matching(self, query):
+        return [
+            key for key, doc in self.docs.items()
+            if doc["date"] == query.get("date", doc["date"])
+            and doc.get("barber_id") == query.get("barber_id", doc.get("barber_id"))
+            and doc["appointment_id"] == query.get("appointment_id", doc["appointment_id"])
+            and ("cell" not in query or doc["cell"] in query["cell"]["$in"])
+        ]
+
+    async def distinct(self, field, query):
+        await self._round_trip()
+        return sorted({self.docs[key][field] for key in self._matching(query)})
+
+    async def delete_many(self, query):
+        await self._round_trip()
+        for key in self._matching(query):
+            del self.docs[key]
+
+
+async def attempt(claims, start, duration, appointment_id):
+    try:
+        await reserve(claims, "2025-03-04", start, duration, appointment_id)
+        return appointment_id
+    except SlotUnavailable:
+        return None
+
+
+def test_claim_cells_cover_the_whole_service():
+    assert claim_cells(600, 30) == [600, 605, 610, 615, 620, 625]
+    assert claim_cells(602, 10) == [600, 605, 610]
+
+
+def test_hundreds_of_concurrent_bookings_one_winner():
+    claims = FakeClaims()
+
+    async def scenario():
+        return await asyncio.gather(*(attempt(claims, 600, 30, f"apt-{i}") for i in range(300)))
+
+    winners = [w for w in asyncio.run(scenario()) if w]
+    assert len(winners) == 1
+    assert {doc["appointment_id"] for doc in claims.docs.values()} == set(winners)
+    assert len(claims.docs) == 6
+
+
+def test_a_free_slot_always_goes_to_exactly_one_booking():
+    rng = random.Random(3)
+    for trial in range(50):
+        claims = FakeClaims(rng)
+        # Serviços diferentes disputando o mesmo horário livre, em ordem de chegada aleatória
+        requests = [(rng.choice([600, 605, 610]), rng.choice([20, 30, 45]), f"apt-{i}") for i in range(20)]
+
+        async def scenario():
+            return await asyncio.gather(*(attempt(claims, *r) for r in requests))
+
+        winners = [w for w in asyncio.run(scenario()) if w]
+        assert len(winners) == 1, f"trial {trial}: {len(winners)} bookings got the slot"
+        assert {doc["appointment_id"] for doc in claims.docs.values()} == set(winners)
+
+
+def test_overlapping_services_never_share_a_minute():
+    rng = random.Random(7)
+    claims = FakeClaims()
+    requests = [(rng.randrange(540, 720, 15), rng.choice([20, 30, 45, 90]), f"apt-{i}") for i in range(300)]
+
+    async def scenario():
+        return await asyncio.gather(*(attempt(claims, *r) for r in requests))
+
+    winners = set(w for w in asyncio.run(scenario()) if w)
+    intervals = sorted((s, s + d) for s, d, apt_id in requests if apt_id in winners)
+    assert intervals
+    for (_, end), (next_start, _) in zip(intervals, intervals[1:]):
+        assert end <= next_start
+    # perdedores não deixam células órfãs
+    assert {doc["appointment_id"] for doc in claims.docs.values()} == winners
+
+
+def test_release_and_rebook_is_idempotent():
+    claims = FakeClaims()
+
+    async def scenario():
+        await reserve(claims, "2025-03-04", 600, 30, "a")
+        await reserve(claims, "2025-03-04", 600, 30, "a")
+        with pytest.raises(SlotUnavailable):
+            await reserve(claims, "2025-03-04", 615, 30, "b")
+        await release(claims, "a")
+        await reserve(claims, "2025-03-04", 615, 30, "b")
+
+    asyncio.run(scenario())
+    assert {doc["appointment_id"] for doc in claims.docs.values()} == {"b"}
+
+
+def test_each_barber_has_own_cells():
+    claims = FakeClaims()
+
+    async def scenario():
+        await reserve(claims, "2025-03-04", 600, 30, "a", "ana")
+        await reserve(claims, "2025-03-04", 600, 30, "b", "rui")
+        with pytest.raises(SlotUnavailable):
+            await reserve(claims, "2025-03-04", 610, 30, "c", "rui")
+
+    asyncio.run(scenario())
+    assert {doc["appointment_id"] for doc in claims.docs.values()} == {"a", "b"}
+
+
+def test_cells_owned_on_another_chair_do_not_count():
+    claims = FakeClaims()
+
+    async def scenario():
+        await reserve(claims, "2025-03-04", 600, 30, "mine", barber_id="a")
+        await reserve(claims, "2025-03-04", 600, 30, "theirs", barber_id="b")
+        # "mine" já tem as mesmas células na cadeira "a"; na "b" elas são de outro agendamento
+        with pytest.raises(SlotUnavailable):
+            await reserve(claims, "2025-03-04", 590, 30, "mine", barber_id="b")
+        return {(doc["barber_id"], doc["appointment_id"]) for doc in claims.docs.values()}
+
+    assert asyncio.run(scenario()) == {("a", "mine"), ("b", "theirs")}
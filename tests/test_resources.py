@@ -0,0 +1,45 @@
+import pytest
+
+from resources import SENDGRID_URL, SendGridSender, mongo_options
+
+
+def test_mongo_options_from_environment():
+    options = mongo_options({"MONGO_MAX_POOL_SIZE": "20", "MONGO_MIN_POOL_SIZE": ""})
+    assert options["maxPoolSize"] == 20 and options["minPoolSize"] == 5
+    assert options["waitQueueTimeoutMS"] == 2_000 and options["connect"] is False
+
+
+@pytest.mark.parametrize("environ", [
+    {"MONGO_MAX_POOL_SIZE": "many"},
+    {"MONGO_MAX_POOL_SIZE": "4", "MONGO_MIN_POOL_SIZE": "8"},
+])
+def test_invalid_pool_settings_are_rejected(environ):
+    with pytest.raises(ValueError):
+        mongo_options(environ)
+
+
+class FakeSession:
+    def __init__(self):
+        self.headers = {}
+        self.posts = []
+
+    def post(self, url, json=None, timeout=None):
+        self.posts.append((url, json))
+        return self
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeMail:
+    def get(self):
+        return {"subject": "Nova reserva"}
+
+
+def test_sendgrid_sends_reuse_one_session():
+    session = FakeSession()
+    sender = SendGridSender("key", session=session)
+    sender.send(FakeMail())
+    sender.send(FakeMail())
+    assert session.headers["Authorization"] == "Bearer key"
+    assert session.posts == [(SENDGRID_URL, {"subject": "Nova reserva"})] * 2
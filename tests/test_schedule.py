@@ -0,0 +1,113 @@
+import asyncio
+import random
+from datetime import date
+
+import pytest
+
+from availability import DayOccupancy, format_minutes_12h
+from schedule import CLOSED, DEFAULT_CONFIG, ScheduleRules, compile_weekly
+
+
+class FakeConfig:
+    def __init__(self, doc=None):
+        self.doc = doc
+        self.reads = 0
+
+    async def find_one(self, query, projection=None):
+        self.reads += 1
+        return {k: v for k, v in self.doc.items() if k != "id"} if self.doc else None
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.doc = doc
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_default_template_matches_legacy_hours():
+    weekly = compile_weekly(DEFAULT_CONFIG)
+    rng = random.Random(7)
+    for _ in range(100):
+        occupancy = DayOccupancy()
+        for _ in range(rng.randrange(6)):
+            start = rng.randrange(8 * 60, 21 * 60)
+            occupancy.occupy(start, start + rng.choice((20, 30, 45)))
+        for duration in (10, 30, 45, 90):
+            assert weekly[2].available_starts(occupancy, duration) == occupancy.available_starts(duration)
+    assert weekly[6] is CLOSED
+
+
+def test_breaks_and_labels():
+    config = {**DEFAULT_CONFIG, "slot_interval": 15,
+              "breaks": [{"start": "13:00", "end": "14:00", "weekdays": [0]}]}
+    weekly = compile_weekly(config)
+    monday = weekly[0].available_starts(DayOccupancy(), 30)
+    assert 12 * 60 + 30 in monday and 12 * 60 + 45 not in monday
+    assert 13 * 60 not in monday and 14 * 60 in monday
+    assert 13 * 60 + 15 in weekly[1].available_starts(DayOccupancy(), 30)
+    assert weekly[0].available_labels(DayOccupancy(), 30)[0] == format_minutes_12h(9 * 60)
+    assert weekly[0].allows(12 * 60 + 10, 20) and not weekly[0].allows(12 * 60 + 50, 20)
+    assert not weekly[0].allows(20 * 60 + 45, 30)
+
+
+@pytest.mark.parametrize("config", [
+    {**DEFAULT_CONFIG, "hours": {"0": {"open": "18:00", "close": "09:00"}}},
+    {**DEFAULT_CONFIG, "breaks": [{"start": "14:00", "end": "13:00"}]},
+    {**DEFAULT_CONFIG, "hours": {"0": {"open": "9am", "close": "18:00"}}},
+    {**DEFAULT_CONFIG, "slot_interval": 0},
+])
+def test_invalid_rules_are_rejected(config):
+    with pytest.raises(ValueError):
+        compile_weekly(config)
+
+
+def test_holidays_close_the_day():
+    config = {**DEFAULT_CONFIG, "holidays": [{"date": "12-25"}, {"date": "2025-04-18", "name": "Sexta-feira Santa"}]}
+    rules = ScheduleRules(FakeConfig({"id": "default", **config}))
+    assert run(rules.template("2026-12-25")).closed
+    assert run(rules.template(date(2025, 4, 18))).closed
+    assert not run(rules.template("2026-04-17")).closed
+    assert run(rules.closed_message("2025-04-18")) == "Closed for a holiday"
+    assert run(rules.closed_message("2025-04-20")) == "Closed on Sundays"  # texto de antes das regras
+    with pytest.raises(ValueError):
+        run(rules.template("18/04/2025"))
+
+
+def test_rules_are_compiled_once_until_invalidated():
+    collection = FakeConfig()
+    rules = ScheduleRules(collection)
+
+    async def scenario():
+        for _ in range(5):
+            assert not (await rules.template("2025-01-06")).closed
+        assert collection.reads == 1 and rules.compilations == 1
+
+        sundays_open = {**DEFAULT_CONFIG, "hours": {**DEFAULT_CONFIG["hours"], "6": {"open": "10:00", "close": "14:00"}}}
+        await rules.save(sundays_open)
+        sunday = await rules.template("2025-01-05")
+        assert sunday.starts[0] == 600 and rules.compilations == 2
+
+    run(scenario())
+
+
+def test_invalid_stored_config_falls_back_to_defaults():
+    rules = ScheduleRules(FakeConfig({"id": "default", "hours": {"0": {"open": "x", "close": "y"}}}))
+    assert run(rules.template("2025-01-06")).starts[0] == 9 * 60
+
+
+def test_any_barber_is_the_union_of_chairs():
+    template = compile_weekly(DEFAULT_CONFIG)[2]
+    rng = random.Random(3)
+    for _ in range(50):
+        chairs = []
+        for _ in range(rng.randrange(1, 5)):
+            occupancy = DayOccupancy()
+            for _ in range(rng.randrange(10)):
+                start = rng.randrange(9 * 60, 21 * 60)
+                occupancy.occupy(start, start + rng.choice((20, 30, 45, 60)))
+            chairs.append(occupancy)
+        for duration in (20, 45, 90):
+            union = sorted({s for chair in chairs for s in template.available_starts(chair, duration)})
+            assert template.available_starts_any(chairs, duration) == union
+    assert template.available_starts_any([], 30) == []
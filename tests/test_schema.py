@@ -0,0 +1,74 @@
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from schema import INDEXES, check_query_plans, ensure_indexes, uses_collscan
+
+
+def test_uses_collscan_walks_nested_plans():
+    ixscan = {"queryPlanner": {"winningPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN"}}}}
+    or_plan = {"queryPlanner": {"winningPlan": {"stage": "SUBPLAN", "inputStage": {
+        "stage": "OR", "inputStages": [{"stage": "IXSCAN"}, {"stage": "COLLSCAN"}]}}}}
+    assert not uses_collscan(ixscan)
+    assert uses_collscan(or_plan)
+
+
+def test_every_collection_has_unique_id_index():
+    for collection in ("appointments", "blocked_slots", "customers", "services"):
+        specs = INDEXES[collection]
+        assert any(keys == [("id", 1)] and options.get("unique") for keys, options in specs), collection
+
+
+@pytest.mark.skipif(not os.environ.get("TEST_MONGO_URL"), reason="needs a local mongod (TEST_MONGO_URL)")
+def test_route_queries_use_indexes():
+    motor_asyncio = pytest.importorskip("motor.motor_asyncio")
+
+    async def scenario():
+        client = motor_asyncio.AsyncIOMotorClient(os.environ["TEST_MONGO_URL"])
+        db = client[f"jhun_schema_{uuid.uuid4().hex[:8]}"]
+        try:
+            await ensure_indexes(db)
+            await ensure_indexes(db)  # idempotente
+            return await check_query_plans(db)
+        finally:
+            await client.drop_database(db.name)
+            client.close()
+
+    assert asyncio.run(scenario()) == []
+
+
+class FailingCollection:
+    def __init__(self, failing):
+        self.failing = failing
+
+    async def index_information(self):
+        return {}
+
+    async def create_indexes(self, models):
+        from pymongo.errors import OperationFailure
+
+        if models[0].document["name"] in self.failing:
+            raise OperationFailure("E11000 duplicate key error")
+
+
+class FailingDB(dict):
+    def __missing__(self, name):
+        return self.setdefault(name, FailingCollection(self.failing))
+
+
+def test_unique_index_failure_stops_startup_but_others_only_warn():
+    pytest.importorskip("pymongo")
+    indexes = {
+        "slot_claims": [([("date", 1), ("cell", 1)], {"name": "date_cell_unique", "unique": True})],
+        "appointments": [([("date", 1)], {"name": "date"})],
+    }
+    db = FailingDB()
+    db.failing = {"date"}
+    asyncio.run(ensure_indexes(db, indexes, obsolete={}))
+
+    db = FailingDB()
+    db.failing = {"date_cell_unique"}
+    with pytest.raises(RuntimeError, match="slot_claims.date_cell_unique"):
+        asyncio.run(ensure_indexes(db, indexes, obsolete={}))
@@ -0,0 +1,63 @@
+import asyncio
+
+from services_cache import ServicesCache
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length):
+        return [dict(doc) for doc in self.docs]
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.find_calls = 0
+
+    def find(self, query, projection=None):
+        self.find_calls += 1
+        return FakeCursor(self.docs)
+
+
+SERVICES = [
+    {"_id": 1, "id": "beard", "name": "Beard", "price": 15, "duration_minutes": 20},
+    {"_id": 2, "id": "cut", "name": "Men's Haircut", "price": 30, "duration_minutes": 30},
+]
+
+
+def strip_id(**doc):
+    doc.pop("_id", None)
+    return doc
+
+
+def test_reads_hit_memory_after_first_load():
+    collection = FakeCollection(SERVICES)
+    cache = ServicesCache(collection, strip_id)
+
+    async def scenario():
+        assert (await cache.get("cut"))["duration_minutes"] == 30
+        assert await cache.get("missing") is None
+        assert len(await cache.all()) == 2
+
+    asyncio.run(scenario())
+    assert collection.find_calls == 1
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 2
+
+
+def test_invalidate_forces_reload():
+    collection = FakeCollection(SERVICES)
+    cache = ServicesCache(collection, strip_id)
+
+    async def scenario():
+        await cache.load()
+        collection.docs = SERVICES[:1]
+        cache.invalidate()
+        return await cache.all()
+
+    services = asyncio.run(scenario())
+    assert [s["id"] for s in services] == ["beard"]
+    assert collection.find_calls == 2
+    assert cache.stats()["invalidations"] == 1
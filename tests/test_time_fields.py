@@ -0,0 +1,102 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+from availability import DayOccupancy
+from time_fields import appointment_fields, block_fields, epoch_day, migrate
+
+
+def test_epoch_day():
+    assert epoch_day("1970-01-01") == 0
+    assert epoch_day(date(2025, 3, 3)) == epoch_day("2025-03-03") == 20150
+    assert epoch_day("03/03/2025") is None and epoch_day(None) is None
+
+
+def test_appointment_fields_accept_both_time_formats():
+    assert appointment_fields({"date": "2025-03-03", "time": "02:30 PM", "duration_minutes": 45}) == {
+        "start_minute": 870, "end_minute": 915,
+    }
+    assert appointment_fields({"date": "2025-03-03", "time": "14:30", "duration_minutes": 45})["start_minute"] == 870
+    assert appointment_fields({"date": "2025-03-03", "time": "later", "duration_minutes": 45})["start_minute"] is None
+
+
+def test_integer_fields_take_precedence_over_strings():
+    migrated = {"time": "garbage", "start_minute": 600, "end_minute": 630}
+    legacy = {"time": "11:00 AM", "duration_minutes": 30}
+    block = {"start_time": "x", "end_time": "y", **block_fields({"start_time": "13:00", "end_time": "14:00"})}
+    occupancy = DayOccupancy.from_documents([migrated, legacy], [block])
+    assert not occupancy.is_free(600, 30) and not occupancy.is_free(660, 30) and not occupancy.is_free(780, 60)
+    assert occupancy.is_free(630, 30) and occupancy.is_free(840, 30)
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for doc in self.docs:
+            yield doc
+
+
+class FakeCollection:
+    def __init__(self, docs=()):
+        self.docs = [dict(doc, _id=i) for i, doc in enumerate(docs)]
+        self.round_trips = 0
+
+    def find(self, query, projection=None):
+        missing = query.get("start_minute") == {"$exists": False}
+        return FakeCursor([dict(d) for d in self.docs if not missing or "start_minute" not in d])
+
+    async def bulk_write(self, ops, ordered=True):
+        self.round_trips += 1
+        for op in ops:
+            self.docs[op._filter["_id"]].update(op._doc["$set"])
+
+    async def update_many(self, query, update):
+        fields = [field for condition in query["$or"] for field in condition]
+        for doc in self.docs:
+            if any(field in doc for field in fields):
+                for field in update["$unset"]:
+                    doc.pop(field, None)
+
+    async def find_one(self, query):
+        return next((d for d in self.docs if d.get("id") == query["id"]), None)
+
+    async def replace_one(self, query, doc, upsert=False):
+        self.docs.append(doc)
+
+
+class FakeDB:
+    def __init__(self, appointments, blocked_slots):
+        self.appointments = FakeCollection(appointments)
+        self.blocked_slots = FakeCollection(blocked_slots)
+        self.migrations = FakeCollection()
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+def test_migration_backfills_in_batches_once():
+    pytest.importorskip("pymongo")
+    appointments = [{"date": "2025-03-03", "time": f"{9 + i % 10:02d}:00", "duration_minutes": 30} for i in range(25)]
+    appointments.append({"date": "2025-03-03", "time": "10:00", "duration_minutes": 30,
+                         "day": 20150, "start_minute": 600, "end_minute": 630})  # migrado pela v1
+    blocks = [{"start_date": "2025-08-01", "end_date": "2025-08-31", "start_time": "09:00", "end_time": "21:00",
+               "start_day": 20301, "end_day": 20331}]
+    db = FakeDB(appointments, blocks)
+
+    assert asyncio.run(migrate(db, batch_size=10)) == {"appointments": 25, "blocked_slots": 1}
+    assert db.appointments.round_trips == 3
+    assert db.appointments.docs[3]["start_minute"] == 12 * 60
+    assert db.blocked_slots.docs[0]["end_minute"] == 21 * 60
+    # As cópias da data em dias desde 1970 saem
+    assert not any("day" in doc for doc in db.appointments.docs)
+    assert not any({"start_day", "end_day"} & set(doc) for doc in db.blocked_slots.docs)
+    assert asyncio.run(migrate(db)) is None